@@ -0,0 +1,243 @@
+"""
+Throughput benchmark of the extraction loop against the local mock OpenAI server.
+No API credits are spent: ``extract_all`` runs unchanged with its clients pointed
+at ``utils.mock_openai.MockOpenAIServer``, which adds latency, jitter and 429s.
+
+    python -m benchmarks.bench_extraction
+    python -m benchmarks.bench_extraction --modes 2 --papers 200 --latency 0.2 --rate-limit-rate 0.05
+    python -m benchmarks.bench_extraction --data data/processed/whitematter_data.jsonl --papers 100
+    python -m benchmarks.bench_extraction --baseline benchmarks/results.jsonl --tolerance 0.1
+
+Every case runs in its own process, so peak RSS is measured per case. Results are
+appended to ``--results`` (JSONL); with ``--baseline`` each case is compared to the
+latest baseline result of the same configuration, and the exit status is 1 when
+papers/sec dropped by more than ``--tolerance``.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.prefilter import DEFAULT_VOCABULARY
+
+DEFAULT_RESULTS_PATH = "benchmarks/results.jsonl"
+# Settings that must match for two results to be compared
+CASE_KEYS = ("mode", "source", "papers", "body_tokens", "concurrency", "pack_size", "max_chunk_tokens",
+             "latency", "jitter", "rate_limit_rate")
+
+_FILLER = ("the", "of", "and", "in", "to", "was", "were", "with", "for", "that", "between", "group",
+           "analysis", "data", "study", "results", "significant", "showed", "compared", "using")
+_HEADINGS = ("Introduction", "Methods", "Participants", "MRI acquisition", "Image processing",
+             "Statistical analysis", "Results", "Discussion", "Limitations", "Conclusion",
+             "Acknowledgements", "References")
+
+
+def synthetic_papers(n: int, body_tokens: int = 8000, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    ``n`` papers shaped like the corpus: title, abstract, keywords and a body of about
+    ``body_tokens`` tokens split into '##' sections, with domain terms sprinkled in.
+    """
+    rng = random.Random(seed)
+    words_per_section = max(1, int(body_tokens * 0.75) // len(_HEADINGS))
+
+    def text(n_words: int) -> str:
+        return " ".join(rng.choice(DEFAULT_VOCABULARY) if rng.random() < 0.05 else rng.choice(_FILLER)
+                        for _ in range(n_words))
+
+    return [{
+        "pmcid": f"PMC{9_000_000 + i}",
+        "title": text(12),
+        "abstract": text(250),
+        "keywords": "; ".join(rng.sample(DEFAULT_VOCABULARY, 5)),
+        "body": "".join(f"## {heading}\n{text(words_per_section)}\n" for heading in _HEADINGS),
+    } for i in range(n)]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (``q`` in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(q / 100 * len(ordered)))) - 1]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None where ``resource`` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def load_case_papers(case: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if case["source"] == "synthetic":
+        return synthetic_papers(case["papers"], case["body_tokens"], case["seed"])
+    from main import load_papers
+    papers = load_papers(case["source"])
+    if case["source"].endswith(".jsonl"):
+        return list(papers.iter_range(0, case["papers"]))
+    return papers[:case["papers"]]
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Run ``extract_all`` once against a fresh mock server and measure it."""
+    from openai import AsyncOpenAI, OpenAI
+
+    import main
+    from utils.ledger import RunLedger
+    from utils.mock_openai import MockOpenAIServer
+    from utils.rate_limiter import RateLimiter
+
+    papers = load_case_papers(case)
+    server = MockOpenAIServer(latency=case["latency"], jitter=case["jitter"],
+                              rate_limit_rate=case["rate_limit_rate"], seed=case["seed"]).start()
+    # 429s are left to the pipeline's RateLimiter instead of the SDK's own retries
+    main.client = OpenAI(base_url=server.base_url, api_key="benchmark", max_retries=0)
+    main.async_client = AsyncOpenAI(base_url=server.base_url, api_key="benchmark", max_retries=0)
+    main.USE_RESPONSE_CACHE = False
+    ledger = RunLedger()
+    limiter = RateLimiter(rpm=1_000_000, tpm=1_000_000_000)
+    try:
+        with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(devnull):
+                main.extract_all(papers, out_csv=os.path.join(tmp, "bench.csv"),
+                                 processing_mode=case["mode"],
+                                 max_chunk_tokens=case["max_chunk_tokens"],
+                                 pack_size=case["pack_size"],
+                                 max_concurrency=case["concurrency"],
+                                 limiter=limiter, ledger=ledger)
+            elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    seconds = list(ledger.paper_seconds.values())
+    http_requests = server.request_count + server.rate_limited_count
+    return dict(case,
+                seconds=elapsed,
+                papers_per_sec=len(papers) / elapsed if elapsed else 0.0,
+                p50=percentile(seconds, 50),
+                p95=percentile(seconds, 95),
+                p99=percentile(seconds, 99),
+                requests_per_paper=http_requests / len(papers) if papers else 0.0,
+                rate_limited=server.rate_limited_count,
+                prompt_tokens=ledger.prompt_tokens,
+                peak_rss_mb=peak_rss_mb())
+
+
+def run_case_subprocess(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one case in a fresh interpreter so its peak RSS is its own."""
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_extraction", "--run-case", json.dumps(case)],
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result: Dict[str, Any]) -> tuple:
+    return tuple(result.get(key) for key in CASE_KEYS)
+
+
+def load_baseline(path: str) -> Dict[tuple, Dict[str, Any]]:
+    """Latest result per case configuration in a results file."""
+    baseline = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    baseline[case_key(result)] = result
+    return baseline
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"{'mode':>4} {'source':>10} {'papers':>6} {'papers/s':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'req/paper':>9} {'429s':>5} {'RSS MB':>7}")
+    for r in results:
+        source = "synthetic" if r["source"] == "synthetic" else os.path.basename(r["source"])[:10]
+        print(f"{r['mode']:>4} {source:>10} {r['papers']:>6} {r['papers_per_sec']:>9.2f} {_seconds(r['p50']):>7} "
+              f"{_seconds(r['p95']):>7} {_seconds(r['p99']):>7} {r['requests_per_paper']:>9.2f} {r['rate_limited']:>5} "
+              f"{(r['peak_rss_mb'] or 0):>7.1f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark extract_all against a local mock OpenAI server")
+    parser.add_argument("--modes", type=int, nargs="+", default=[1, 2, 3], choices=[1, 2, 3])
+    parser.add_argument("--papers", type=int, default=100, help="Papers per case")
+    parser.add_argument("--body-tokens", type=int, default=8000, help="Body size of the synthetic papers")
+    parser.add_argument("--data", default=None, help="Also benchmark the first --papers papers of this corpus")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pack-size", type=int, default=1, help="Papers per request in mode 3")
+    parser.add_argument("--max-chunk-tokens", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Mock extra random seconds per request")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="JSONL file the results are appended to")
+    parser.add_argument("--baseline", default=None, help="Results file to compare papers/sec against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative papers/sec drop")
+    parser.add_argument("--run-case", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    sources = ["synthetic"] + ([args.data] if args.data else [])
+    cases = [{"mode": mode, "source": source, "papers": args.papers,
+              "body_tokens": args.body_tokens if source == "synthetic" else None,
+              "concurrency": args.concurrency, "pack_size": args.pack_size if mode == 3 else 1,
+              "max_chunk_tokens": args.max_chunk_tokens, "latency": args.latency, "jitter": args.jitter,
+              "rate_limit_rate": args.rate_limit_rate, "seed": args.seed}
+             for source in sources for mode in args.modes]
+
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    commit, timestamp = git_commit(), time.strftime("%Y-%m-%dT%H:%M:%S")
+    results = []
+    for case in cases:
+        result = run_case_subprocess(case)
+        result.update(commit=commit, timestamp=timestamp, python=sys.version.split()[0])
+        results.append(result)
+    print_results(results)
+
+    if os.path.dirname(args.results):
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    print(f"Results appended to {args.results}")
+
+    regressions = 0
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if previous is None or not previous.get("papers_per_sec"):
+            continue
+        change = result["papers_per_sec"] / previous["papers_per_sec"] - 1
+        flag = "REGRESSION" if change < -args.tolerance else "ok"
+        regressions += flag == "REGRESSION"
+        print(f"mode {result['mode']} {result['source']}: {result['papers_per_sec']:.2f} papers/s vs "
+              f"{previous['papers_per_sec']:.2f} ({previous.get('commit')}) {change:+.1%} {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,8 @@
 # %%
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import scipy as sp
-import json, pprint, itertools
-from neuroquery import fetch_neuroquery_model, NeuroQueryModel
-from nilearn.plotting import view_img
-import glob
-from pathlib import Path
-import os, json, csv, time
-from openai import OpenAI
+import json, csv
 from typing import List, Dict, Any
-from dotenv import load_dotenv
-load_dotenv()  # take environment variables from .env.
 
-#import for openai
-from config import OPENAI_API_KEY
-from prompts.brain_extraction import SYSTEM_PROMPT
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-WHITEMATTER_JSON_PATH = "data/processed/whitematter_data.json"
-with open(WHITEMATTER_JSON_PATH, "r", encoding="utf-8") as f:
-    whitematter_json = json.load(f)
+from main import extract_chunk, get_response_cache, load_papers
 
 #data fields
 imaging_modalities =["Anatomical MRI","fMRI","DTI","PET","CT","SPECT","MEG","EEG"]
@@ -72,10 +51,6 @@ def process_full_data(paper: Dict[str, Any]) -> str:
     return full_data, body_chunks
 
 
-
-abstract, body_chunks  = process_full_data(whitematter_json[0])
-
-
 def extract_one(WM_paper: Dict[str, Any], model: str = "gpt-4o-mini", use_full_data: bool = False) -> Dict[str, Any]:
     """
     Extract data from a single paper, with the option to use all data (including chunked body).
@@ -106,24 +81,11 @@ def extract_one(WM_paper: Dict[str, Any], model: str = "gpt-4o-mini", use_full_d
         user_payload = {
             "body": chunk  # Only include the chunk as the body
         }
-        
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-            ]
-        )
-        
-        content = resp.choices[0].message.content
-        try:
-            data = json.loads(content)
-            # Aggregate the data from all chunks
-            for key in all_data:
-                all_data[key].extend(data.get(key, []))
-        except Exception:
-            pass
+        # Validated against the output schema; only a malformed chunk is re-requested
+        data = extract_chunk(user_payload, model, cache=get_response_cache())
+        # Aggregate the data from all chunks
+        for key in all_data:
+            all_data[key].extend(data.get(key, []))
 
     # Remove duplicates and return the final data
     for key in all_data:
@@ -135,7 +97,6 @@ def extract_one(WM_paper: Dict[str, Any], model: str = "gpt-4o-mini", use_full_d
 def extract_all(WM_papers: List[Dict[str, Any]],
                 out_csv: str = "extracted_info.csv",
                 model: str = "gpt-4o-mini",
-                sleep_sec: float = 0.8,
                 use_full_data: bool = False) -> List[Dict[str, Any]]:
     """
     Extract data from all papers and save to CSV, with option to use full data (body chunking).
@@ -143,7 +104,6 @@ def extract_all(WM_papers: List[Dict[str, Any]],
         WM_papers (List[Dict[str, Any]]): List of dictionaries containing paper details.
         out_csv (str): Output CSV file path.
         model (str): The model to use for extraction.
-        sleep_sec (float): Sleep time between API calls to avoid rate limits.       
         use_full_data (bool): Whether to use full data including chunked body.
     Returns:
         List[Dict[str, Any]]: List of extracted data from all papers.
@@ -161,7 +121,6 @@ def extract_all(WM_papers: List[Dict[str, Any]],
         }
         results.append(row)
         print(f"Processed {i}/{len(WM_papers)}")
-        time.sleep(sleep_sec)
 
     # Write results to CSV
     with open(out_csv, "w", newline="", encoding="utf-8") as f:
@@ -175,10 +134,9 @@ def extract_all(WM_papers: List[Dict[str, Any]],
     return results
 
 
-#read json file
-
-one_paper=extract_one(whitematter_json[0], use_full_data=True)
-
-
-
+if __name__ == "__main__":
+    #read json file
+    whitematter_json = load_papers()
+    abstract, body_chunks  = process_full_data(whitematter_json[0])
 
+    one_paper=extract_one(whitematter_json[0], use_full_data=True)
@@ -0,0 +1,554 @@
+"""
+Command line entry point for the extraction pipeline.
+
+    python cli.py extract --mode 2 --start 0 --end 100 --journal run.journal.jsonl
+    python cli.py extract --mode 2 --workers 4 --data data/processed/whitematter_data.jsonl
+    python cli.py extract --cascade --pack-size 10
+    python cli.py extract --mode 2 --schedule
+    python cli.py screen --thresholds 0.05 0.1
+    python cli.py extract --mode 2 --screen 0.05
+    python cli.py batch --mode 2 --poll-interval 300
+    python cli.py plan --modes 1 2 3
+    python cli.py agreement --sample 50 --mode 2
+    python cli.py counts --parquet extracted_info.parquet --rows whitematter_tracts --cols imaging_modalities
+    python cli.py index --csv extracted_info.csv
+    python cli.py query 'diffusion_measures:FA AND NOT subjects:mice' --facet whitematter_tracts
+    python cli.py preprocess
+    python cli.py --trace run.trace.json --profile run.profile.txt extract --mode 2 --end 50
+
+Each subcommand imports only the modules it needs, and the corpus is only
+loaded by the subcommands that use it.
+"""
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import sys
+
+
+def _load_selection(args, lazy: bool = False):
+    """Papers ``--start`` to ``--end`` of the corpus; streamed from a ``.jsonl`` store when ``lazy``."""
+    from main import load_papers
+    start = time.perf_counter()
+    papers = load_papers(args.data)
+    if args.data.endswith(".jsonl"):
+        papers = papers.iter_range(args.start, args.end)
+        if lazy:
+            return papers
+        papers = list(papers)
+    else:
+        papers = papers[args.start:args.end]
+    print(f"Loaded {len(papers)} papers in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+    return papers
+
+
+def _chunk_filter(args):
+    if not args.prefilter:
+        return None
+    from utils.prefilter import ChunkFilter
+    return ChunkFilter(min_hits=args.prefilter_min_hits)
+
+
+def _validator(args):
+    from prompts.brain_extraction import EXTRACTION_FIELDS
+    from utils.schema import OutputValidator
+    return OutputValidator(EXTRACTION_FIELDS, max_retries=args.max_retries, use_schema=not args.no_schema)
+
+
+def _field_store(args):
+    if not args.field_store:
+        return None
+    from utils.field_store import FieldStore
+    return FieldStore(args.field_store)
+
+
+def _vocabulary(args):
+    if not args.fast_path:
+        return None
+    from utils.vocabulary import LOCAL_FIELDS, VocabularyExtractor
+    return VocabularyExtractor(fields=LOCAL_FIELDS)
+
+
+def _dedup(args):
+    if not args.dedup:
+        return None
+    from utils.dedup import ChunkDeduplicator
+    return ChunkDeduplicator(threshold=args.dedup_threshold)
+
+
+def _chunk_scheduler(args):
+    if not args.schedule:
+        return None
+    from utils.chunk_scheduler import ChunkScheduler
+    return ChunkScheduler(min_fields=args.saturation_fields, wave_size=args.wave_size)
+
+
+def _cascade(args):
+    if not args.cascade:
+        return None
+    from utils.cascade import Cascade
+    return Cascade()
+
+
+def _result_index(args):
+    if not args.index:
+        return None
+    from utils.result_index import ResultIndex
+    return ResultIndex(args.index)
+
+
+def _screened(args, papers):
+    """``papers`` without those scoring below ``--screen`` (the cache is updated first)."""
+    from utils.screening import RelevanceScreen, WHITE_MATTER_QUERY
+
+    screen = RelevanceScreen(args.screen_cache)
+    encoded = screen.update(_load_selection(args, lazy=True))
+    print(f"Screening: encoded {encoded} new papers, {len(screen.pmcids)} cached", file=sys.stderr)
+    return screen, screen.filter(papers, threshold=args.screen, query=args.screen_query or WHITE_MATTER_QUERY)
+
+
+def cmd_extract(args) -> None:
+    if args.screen is not None and (args.workers > 1 or args.num_shards > 1):
+        sys.exit("--screen runs in a single process; screen first with 'cli.py screen' to pick the papers")
+    if args.workers > 1:
+        return _extract_sharded(args)
+
+    import main
+    from utils.ledger import RunLedger
+    from utils.rate_limiter import RateLimiter
+
+    report_startup()
+    main.USE_RESPONSE_CACHE = not args.no_cache
+    out_csv, journal = args.out, args.journal
+    if args.num_shards > 1:
+        # One shard of a run split across machines; merge with ``cli.py merge``
+        from utils.sharding import load_shard_input, shard_journal_path, shard_path
+        papers = load_shard_input(args.data, args.start, args.end)
+        out_csv = shard_path(args.out, args.shard_index, args.num_shards)
+        journal = journal or shard_journal_path(args.out, args.shard_index, args.num_shards)
+    else:
+        papers = _load_selection(args, lazy=True)
+    screen = None
+    if args.screen is not None:
+        screen, papers = _screened(args, papers)
+    main.extract_all(papers,
+                     out_csv=out_csv,
+                     model=args.model,
+                     processing_mode=args.mode,
+                     max_chunk_tokens=args.max_chunk_tokens,
+                     chunk_filter=_chunk_filter(args),
+                     pack_size=args.pack_size,
+                     max_concurrency=args.concurrency,
+                     limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+                     journal_path=journal,
+                     resume=args.resume,
+                     keep_results=journal is None,
+                     validator=_validator(args),
+                     ledger=RunLedger(args.ledger, max_tokens=args.max_tokens, max_cost=args.max_cost),
+                     shard_index=args.shard_index,
+                     num_shards=args.num_shards,
+                     shard_by=args.shard_by,
+                     field_store=_field_store(args),
+                     vocabulary=_vocabulary(args),
+                     out_parquet=args.parquet,
+                     result_index=_result_index(args),
+                     cascade=_cascade(args),
+                     chunk_scheduler=_chunk_scheduler(args),
+                     dedup=_dedup(args))
+    if screen is not None:
+        stats = screen.stats()
+        print(f"Screening: {stats['passed']}/{stats['screened']} papers scored at least {args.screen}")
+
+
+def _extract_sharded(args) -> None:
+    from utils.sharding import run_sharded
+
+    report_startup()
+    run_sharded(args.data, args.out, args.workers, shard_by=args.shard_by,
+                start=args.start, end=args.end, rpm=args.rpm, tpm=args.tpm,
+                ledger_path=args.ledger, max_tokens=args.max_tokens, max_cost=args.max_cost,
+                use_cache=not args.no_cache,
+                model=args.model,
+                processing_mode=args.mode,
+                max_chunk_tokens=args.max_chunk_tokens,
+                chunk_filter=_chunk_filter(args),
+                pack_size=args.pack_size,
+                max_concurrency=args.concurrency,
+                resume=args.resume,
+                validator=_validator(args),
+                field_store=_field_store(args),
+                vocabulary=_vocabulary(args),
+                # Every shard writes its own part files into the one dataset
+                out_parquet=args.parquet,
+                cascade=_cascade(args),
+                chunk_scheduler=_chunk_scheduler(args),
+                dedup=_dedup(args))
+    index = _result_index(args)
+    if index is not None:
+        # Shards run in their own processes; index the merged output once
+        print(f"Indexed {index.update_from_csv(args.out)} papers in {args.index}")
+
+
+def cmd_merge(args) -> None:
+    from main import CSV_FIELDNAMES
+    from utils.sharding import merge_shards
+
+    merge_shards(args.out, args.num_shards, CSV_FIELDNAMES)
+
+
+def cmd_batch(args) -> None:
+    from main import extract_all_batch
+
+    report_startup()
+    papers = _load_selection(args)
+    extract_all_batch(papers,
+                      out_csv=args.out,
+                      model=args.model,
+                      processing_mode=args.mode,
+                      max_chunk_tokens=args.max_chunk_tokens,
+                      chunk_filter=_chunk_filter(args),
+                      batch_dir=args.batch_dir,
+                      poll_interval=args.poll_interval,
+                      batch_ids=args.batch_id,
+                      validator=_validator(args),
+                      out_parquet=args.parquet)
+
+
+def cmd_plan(args) -> None:
+    from utils.planner import plan_corpus, print_plan
+
+    report_startup()
+    plan = plan_corpus(_load_selection(args, lazy=True),
+                       model=args.model,
+                       modes=args.modes,
+                       max_chunk_tokens=args.max_chunk_tokens,
+                       chunk_filter=_chunk_filter(args),
+                       pack_size=args.pack_size,
+                       rpm=args.rpm,
+                       tpm=args.tpm,
+                       max_concurrency=args.concurrency,
+                       output_tokens=args.output_tokens)
+    print_plan(plan)
+    if args.json:
+        import json
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=2)
+
+
+def cmd_agreement(args) -> None:
+    import main
+    from utils.rate_limiter import RateLimiter
+    from utils.vocabulary import compare_with_llm
+
+    report_startup()
+    main.USE_RESPONSE_CACHE = not args.no_cache
+    compare_with_llm(_load_selection(args, lazy=True),
+                     sample_size=args.sample,
+                     seed=args.seed,
+                     processing_mode=args.mode,
+                     max_chunk_tokens=args.max_chunk_tokens,
+                     model=args.model,
+                     chunk_filter=_chunk_filter(args),
+                     max_concurrency=args.concurrency,
+                     limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+                     validator=_validator(args))
+
+
+def cmd_counts(args) -> None:
+    from utils.columnar import cooccurrence_counts, read_results, value_counts
+
+    where = {}
+    for condition in args.where:
+        field, _, values = condition.partition("=")
+        where[field] = values.split(",")
+    columns = [args.rows] + ([args.cols] if args.cols else [])
+    table = read_results(args.parquet, columns=columns, where=where)
+    counts = cooccurrence_counts(table, args.rows, args.cols) if args.cols else value_counts(table, args.rows)
+    print(f"{table.num_rows} papers")
+    for row in counts.slice(0, args.top).to_pylist():
+        print("  ".join(str(value) for value in row.values()))
+
+
+def cmd_index(args) -> None:
+    from utils.result_index import ResultIndex
+
+    index = ResultIndex(args.index)
+    if args.csv:
+        print(f"Indexed {index.update_from_csv(args.csv)} papers from {args.csv}")
+    if args.journal:
+        print(f"Indexed {index.update_from_journal(args.journal)} new journal records from {args.journal}")
+    if args.parquet:
+        print(f"Indexed {index.update_from_parquet(args.parquet)} papers from {args.parquet}")
+    index.close()
+    print(f"{index.stats()['papers']} papers in {args.index}")
+
+
+def cmd_query(args) -> None:
+    from utils.result_index import ResultIndex
+
+    index = ResultIndex(args.index)
+    query = args.query or None
+    print(f"{index.count(query)} papers")
+    if args.facet:
+        for value, n in index.facets(args.facet, query, top=args.top):
+            print(f"{value}  {n}")
+    elif args.cooccur:
+        for row_value, counts in index.cooccurrence(args.cooccur[0], args.cooccur[1], query).items():
+            for col_value, n in counts.items():
+                print(f"{row_value}  {col_value}  {n}")
+    else:
+        for pmcid in index.search(query, limit=args.top):
+            print(pmcid)
+
+
+def cmd_screen(args) -> None:
+    from utils.screening import RelevanceScreen, WHITE_MATTER_QUERY
+
+    screen = RelevanceScreen(args.screen_cache)
+    query = args.screen_query or WHITE_MATTER_QUERY
+    if not args.cached:
+        print(f"Encoded {screen.update(_load_selection(args, lazy=True))} new papers, "
+              f"{len(screen.pmcids)} cached in {args.screen_cache}")
+    start = time.perf_counter()
+    table = screen.threshold_table(args.thresholds, query=query)
+    print(f"Scored {len(screen.pmcids)} papers in {(time.perf_counter() - start) * 1000:.1f}ms")
+    for threshold, kept in table:
+        print(f"  >= {threshold:<6} {kept} papers")
+    if args.pmcids_out:
+        with open(args.pmcids_out, "w", encoding="utf-8") as f:
+            f.writelines(pmcid + "\n" for pmcid in screen.relevant(args.thresholds[0], query=query))
+        print(f"Wrote the pmcids scoring at least {args.thresholds[0]} to {args.pmcids_out}")
+
+
+def cmd_preprocess(args) -> None:
+    from utils import data_preprocessing
+
+    report_startup()
+    store_format = "jsonl" if args.output.endswith(".jsonl") else "json"
+    data_preprocessing.process_data(output=args.output, store_format=store_format, n_jobs=args.jobs)
+    data_preprocessing.save_abstract_data(args.output)
+
+
+def _tracer(args):
+    if not args.trace:
+        return None
+    from utils.tracing import Tracer
+    return Tracer(args.trace).start()
+
+
+def _profiler(args):
+    if not args.profile:
+        return None
+    from utils.profiler import SamplingProfiler
+    return SamplingProfiler(interval=args.profile_interval / 1000).start()
+
+
+def _write_trace(tracer) -> None:
+    from utils.tracing import format_summary
+
+    tracer.stop()
+    tracer.save()
+    stats = tracer.stats()
+    print(f"Trace: {stats['spans']} spans ({stats['dropped']} dropped) written to {tracer.path}; "
+          f"open it in https://ui.perfetto.dev or chrome://tracing", file=sys.stderr)
+    for line in format_summary(tracer.summary()):
+        print(line, file=sys.stderr)
+
+
+def _write_profile(args, profiler) -> None:
+    import os
+
+    profiler.stop()
+    with open(args.profile, "w", encoding="utf-8") as f:
+        f.write(profiler.report(top=40, paths=20) + "\n")
+    folded = os.path.splitext(args.profile)[0] + ".folded"
+    profiler.write_folded(folded)
+    print(f"Profile: {profiler.samples} samples; report in {args.profile}, flame graph stacks in {folded}",
+          file=sys.stderr)
+    print("\n".join(profiler.report(top=10, paths=5).splitlines()[2:]), file=sys.stderr)
+
+
+def report_startup() -> None:
+    """Print the time spent importing what the subcommand needs, before any work starts."""
+    print(f"Startup: {time.perf_counter() - _START:.3f}s", file=sys.stderr)
+
+
+def _add_selection_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--data", default="data/processed/whitematter_data.json",
+                        help="Paper corpus (.json list or .jsonl store)")
+    parser.add_argument("--start", type=int, default=0, help="Index of the first paper")
+    parser.add_argument("--end", type=int, default=None, help="Index after the last paper")
+    parser.add_argument("--mode", type=int, default=1, choices=[1, 2, 3],
+                        help="1: no chunking, 2: chunking, 3: title/abstract/keywords only")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--out", default="extracted_info.csv", help="Output CSV file")
+    parser.add_argument("--max-chunk-tokens", type=int, default=None,
+                        help="Token budget per body chunk (0: one request per '##' section)")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Skip body sections like References/Funding and sections without domain terms")
+    parser.add_argument("--prefilter-min-hits", type=int, default=1,
+                        help="Vocabulary matches a section needs to be kept (0: headings only)")
+    parser.add_argument("--no-schema", action="store_true",
+                        help="Do not request schema-constrained output (the output is still validated)")
+    parser.add_argument("--max-retries", type=int, default=2,
+                        help="Re-requests of a chunk whose output fails validation")
+    parser.add_argument("--parquet", default=None,
+                        help="Also write the results to this Parquet dataset (list columns, needs pyarrow)")
+
+
+def _add_screen_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--screen-cache", default="data/cache/neuroquery_vectors",
+                        help="Cache of the NeuroQuery vectors of title/abstract/keywords")
+    parser.add_argument("--screen-query", default=None,
+                        help="Text that relevant papers resemble (default: white matter / diffusion terms)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Brain imaging paper information extraction")
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome trace of the pipeline stages to this file (before the subcommand)")
+    parser.add_argument("--profile", default=None,
+                        help="Sample the call stacks of the run and write a per-function hot-path report to this file")
+    parser.add_argument("--profile-interval", type=float, default=5.0, help="Milliseconds between profiler samples")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract = subparsers.add_parser("extract", help="Extract with concurrent API calls")
+    _add_selection_args(extract)
+    extract.add_argument("--concurrency", type=int, default=8, help="Papers / requests in flight")
+    extract.add_argument("--rpm", type=int, default=500, help="Requests per minute limit")
+    extract.add_argument("--tpm", type=int, default=200_000, help="Tokens per minute limit")
+    extract.add_argument("--pack-size", type=int, default=1,
+                         help="Papers per request in mode 3")
+    extract.add_argument("--journal", default=None, help="Checkpoint journal (JSONL)")
+    extract.add_argument("--resume", action="store_true", help="Skip papers already in the journal")
+    extract.add_argument("--no-cache", action="store_true", help="Always call the API")
+    extract.add_argument("--ledger", default=None,
+                         help="Per-call usage/latency/cost ledger (JSONL); one per shard with --workers")
+    extract.add_argument("--max-tokens", type=int, default=None,
+                         help="Stop before the run would use more than this many tokens (requests in flight included)")
+    extract.add_argument("--max-cost", type=float, default=None,
+                         help="Stop before the run would cost more than this many dollars (requests in flight included)")
+    extract.add_argument("--field-store", default=None,
+                         help="Per-field results (SQLite); only re-extract fields added or changed in the prompt")
+    extract.add_argument("--fast-path", action="store_true",
+                         help="Find closed-vocabulary fields locally and ask the model for the others only")
+    extract.add_argument("--dedup", action="store_true",
+                         help="Reuse the result of near-duplicate chunks (MinHash/LSH) instead of calling the API")
+    extract.add_argument("--dedup-threshold", type=float, default=0.9,
+                         help="Estimated Jaccard similarity of word shingles needed to reuse a chunk's result")
+    extract.add_argument("--screen", type=float, default=None,
+                         help="Only extract papers whose NeuroQuery similarity to --screen-query reaches this")
+    _add_screen_args(extract)
+    extract.add_argument("--schedule", action="store_true",
+                         help="Send the best-ranked body sections first and stop once the fields are saturated")
+    extract.add_argument("--saturation-fields", type=int, default=9,
+                         help="Filled fields (of 11) after which --schedule stops a paper")
+    extract.add_argument("--wave-size", type=int, default=2,
+                         help="Chunks of a paper sent at once between two saturation checks")
+    extract.add_argument("--cascade", action="store_true",
+                         help="Abstract pass first, then body sections only for fields left empty or uncertain "
+                              "(replaces --mode)")
+    extract.add_argument("--index", default=None,
+                         help="Inverted index (SQLite) updated with every finished paper, for 'cli.py query'")
+    extract.add_argument("--workers", type=int, default=1,
+                         help="Worker processes, one shard each, merged into --out at the end")
+    extract.add_argument("--num-shards", type=int, default=1, help="Process only one of this many shards")
+    extract.add_argument("--shard-index", type=int, default=0, help="Shard to process (0 to --num-shards - 1)")
+    extract.add_argument("--shard-by", default="hash", choices=["hash", "range"],
+                         help="Split by pmcid hash or into contiguous index ranges")
+    extract.set_defaults(func=cmd_extract)
+
+    batch = subparsers.add_parser("batch", help="Extract through the Batch API")
+    _add_selection_args(batch)
+    batch.add_argument("--batch-dir", default="data/batches", help="Directory for batch input files")
+    batch.add_argument("--poll-interval", type=float, default=60.0, help="Seconds between status polls")
+    batch.add_argument("--batch-id", action="append", default=None,
+                       help="Ingest an already submitted batch (repeatable)")
+    batch.set_defaults(func=cmd_batch)
+
+    plan = subparsers.add_parser("plan", help="Estimate requests, tokens, cost and time per mode without calling the API")
+    _add_selection_args(plan)
+    plan.add_argument("--modes", type=int, nargs="+", default=[1, 2, 3], choices=[1, 2, 3])
+    plan.add_argument("--pack-size", type=int, default=1, help="Papers per request in mode 3")
+    plan.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    plan.add_argument("--rpm", type=int, default=500, help="Requests per minute limit")
+    plan.add_argument("--tpm", type=int, default=200_000, help="Tokens per minute limit")
+    plan.add_argument("--output-tokens", type=int, default=150, help="Expected completion tokens per request")
+    plan.add_argument("--json", default=None, help="Also write the plan to this JSON file")
+    plan.set_defaults(func=cmd_plan)
+
+    merge = subparsers.add_parser("merge", help="Merge the shard journals of a run into one CSV in input order")
+    merge.add_argument("--out", default="extracted_info.csv", help="Output CSV file used by the shards")
+    merge.add_argument("--num-shards", type=int, required=True)
+    merge.set_defaults(func=cmd_merge)
+
+    agreement = subparsers.add_parser("agreement",
+                                      help="Compare the closed-vocabulary fast path with the model on a sample")
+    _add_selection_args(agreement)
+    agreement.add_argument("--sample", type=int, default=20, help="Papers in the sample")
+    agreement.add_argument("--seed", type=int, default=0)
+    agreement.add_argument("--concurrency", type=int, default=8, help="Papers / requests in flight")
+    agreement.add_argument("--rpm", type=int, default=500, help="Requests per minute limit")
+    agreement.add_argument("--tpm", type=int, default=200_000, help="Tokens per minute limit")
+    agreement.add_argument("--no-cache", action="store_true", help="Always call the API")
+    agreement.set_defaults(func=cmd_agreement)
+
+    counts = subparsers.add_parser("counts", help="Count papers per value (or value pair) from a Parquet output")
+    counts.add_argument("--parquet", required=True, help="Parquet dataset written with --parquet")
+    counts.add_argument("--rows", required=True, help="List field to count, e.g. whitematter_tracts")
+    counts.add_argument("--cols", default=None, help="Second list field for pair counts, e.g. imaging_modalities")
+    counts.add_argument("--where", action="append", default=[],
+                        help="Keep papers whose field contains one of the values: field=value1,value2 (repeatable)")
+    counts.add_argument("--top", type=int, default=30, help="Rows to print")
+    counts.set_defaults(func=cmd_counts)
+
+    index = subparsers.add_parser("index", help="Build or update the inverted index of the results")
+    index.add_argument("--index", default="data/index/results.sqlite", help="Index file (SQLite)")
+    index.add_argument("--csv", default=None, help="Index every row of this output CSV")
+    index.add_argument("--journal", default=None, help="Index the records appended to this journal since the last update")
+    index.add_argument("--parquet", default=None, help="Index this Parquet dataset")
+    index.set_defaults(func=cmd_index)
+
+    query = subparsers.add_parser("query", help="Query the inverted index: papers, facet counts or value pairs")
+    query.add_argument("query", nargs="?", default="",
+                       help="field:value terms with AND, OR, NOT and parentheses (empty: all papers)")
+    query.add_argument("--index", default="data/index/results.sqlite", help="Index file (SQLite)")
+    query.add_argument("--facet", default=None, help="Count the matching papers per value of this field")
+    query.add_argument("--cooccur", nargs=2, default=None, metavar=("ROWS", "COLS"),
+                       help="Count the matching papers per pair of values of two fields")
+    query.add_argument("--top", type=int, default=30, help="Papers or facet values to print")
+    query.set_defaults(func=cmd_query)
+
+    screen = subparsers.add_parser("screen", help="Encode papers into NeuroQuery vectors and count papers per threshold")
+    _add_selection_args(screen)
+    _add_screen_args(screen)
+    screen.add_argument("--thresholds", type=float, nargs="+", default=[0.02, 0.05, 0.1, 0.2])
+    screen.add_argument("--cached", action="store_true", help="Score the cache only, without encoding new papers")
+    screen.add_argument("--pmcids-out", default=None, help="Write the pmcids passing the first threshold to this file")
+    screen.set_defaults(func=cmd_screen)
+
+    preprocess = subparsers.add_parser("preprocess", help="Build the paper corpus from the raw pubget CSVs")
+    preprocess.add_argument("--output", default="whitematter_data.json",
+                            help="Corpus file in data/processed (.json list or .jsonl store)")
+    preprocess.add_argument("--jobs", type=int, default=1, help="Worker processes parsing text.csv")
+    preprocess.set_defaults(func=cmd_preprocess)
+
+    return parser
+
+
+def main(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    tracer, profiler = _tracer(args), _profiler(args)
+    try:
+        args.func(args)
+    finally:
+        # Also written when the run fails or is interrupted
+        if profiler is not None:
+            _write_profile(args, profiler)
+        if tracer is not None:
+            _write_trace(tracer)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,255 @@
 # %%
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import scipy as sp
-import json, pprint, itertools
-from neuroquery import fetch_neuroquery_model, NeuroQueryModel
-from nilearn.plotting import view_img
-import glob
-from pathlib import Path
 import os, json, csv, time
-from openai import OpenAI
-from typing import List, Dict, Any
-from dotenv import load_dotenv
-load_dotenv()  # take environment variables from .env.
+import asyncio
+import itertools
+from typing import List, Dict, Any, Iterable
 
-#import for openai
-from config import OPENAI_API_KEY
-from prompts.brain_extraction import SYSTEM_PROMPT
-client = OpenAI(api_key=OPENAI_API_KEY)
+from prompts.brain_extraction import (SYSTEM_PROMPT, PACKED_SYSTEM_PROMPT, PACKED_INSTRUCTIONS, EXTRACTION_FIELDS,
+                                      build_system_prompt)
+from utils.api_helper import chat_completion, chat_completion_async, run_coroutine
+from utils.rate_limiter import RateLimiter
+from utils.response_cache import ResponseCache
+from utils.journal import RunJournal, compact_journal
+from utils.chunking import (split_sections, pack_sections, process_full_data, build_chunks, DEFAULT_CHUNK_TOKENS,
+                            MAX_SINGLE_REQUEST_TOKENS)
+from utils.tokens import count_tokens
+from utils.prefilter import ChunkFilter
+from utils.paper_store import PaperStore
+from utils.schema import OutputValidator
+from utils.ledger import RunLedger, BudgetExceeded
+from utils.field_store import FieldStore
+from utils.vocabulary import VocabularyExtractor
+from utils.result_index import ResultIndex
+from utils.cascade import Cascade, request_tokens
+from utils.chunk_scheduler import ChunkScheduler
+from utils.dedup import ChunkDeduplicator
+from utils.tracing import span, traced
+from utils.sharding import shard_items, shard_range
+from utils.batch import make_custom_id, parse_custom_id, write_batch_files, submit_batch, wait_for_batch, iter_batch_output
+
+# Clients, cache and corpus are created on first use, so importing this module
+# is cheap and never touches the network or the data files.
+client = None
+async_client = None
+# Shared RPM/TPM limiter; its budgets follow the x-ratelimit-* headers of the responses
+rate_limiter = RateLimiter()
+# On-disk cache of completions; set USE_RESPONSE_CACHE = False to always call the API
+USE_RESPONSE_CACHE = True
+response_cache = None
+# Schema-constrained output: completions are validated and malformed chunks re-requested
+output_validator = OutputValidator(EXTRACTION_FIELDS)
 
 WHITEMATTER_JSON_PATH = "data/processed/whitematter_data.json"
-with open(WHITEMATTER_JSON_PATH, "r", encoding="utf-8") as f:
-    whitematter_json = json.load(f)
-
-def process_full_data(paper: Dict[str, Any], processing_mode: int) -> str:
-    """
-    Preprocess the data according to the selected processing mode:
-    1. No chunking: Combine all data (title, abstract, keywords, and body).
-    2. Chunking: Abstract + body (split body into chunks).
-    3. Title, Abstract, Keywords: Only include title, abstract, and keywords, no body.
-    """
-    # Convert all fields to strings to handle NaN/float values
-    body = str(paper.get("body", "")) if paper.get("body") is not None else ""
-    abstract = str(paper.get("abstract", "")) if paper.get("abstract") is not None else ""
-    title = str(paper.get("title", "")) if paper.get("title") is not None else ""
-    keywords = str(paper.get("keywords", "")) if paper.get("keywords") is not None else ""
-
-    if processing_mode == 1:
-        # No chunking: Combine all data (title, abstract, keywords, and body)
-        full_data = title + " " + abstract + " " + keywords + " " + body
-        return full_data, []
-
-    elif processing_mode == 2:
-        # Chunking: Combine abstract + body in chunks (split body into sections)
-        full_data = title + " " + abstract + " " + keywords
-        sections = body.split("##")  # Split the body by sections marked with '##'
-        body_chunks = []
-        current_section = ""
-
-        for section in sections:
-            section = section.strip()
-            if not section:
-                continue
-            if section.startswith("#"):  # If it's a subsection (starts with '###')
-                current_section += " " + section
-            else:
-                if current_section:
-                    body_chunks.append(current_section.strip())
-                current_section = section.strip()
 
-        if current_section:
-            body_chunks.append(current_section.strip())
 
-        return full_data, body_chunks
+def get_api_key() -> str:
+    """Read the OpenAI API key from config.py, or from the environment / .env file."""
+    try:
+        from config import OPENAI_API_KEY
+        return OPENAI_API_KEY
+    except ImportError:
+        from dotenv import load_dotenv
+        load_dotenv()  # take environment variables from .env.
+        return os.getenv("OPENAI_API_KEY")
+
+
+def get_client():
+    """Return the shared blocking OpenAI client, creating it on first use."""
+    global client
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=get_api_key())
+    return client
+
 
-    elif processing_mode == 3:
-        # Just Title, Abstract, Keywords: Only include title, abstract, and keywords
-        full_data = title + " " + abstract + " " + keywords
-        return full_data, []
+def get_async_client():
+    """Return the shared async OpenAI client, creating it on first use."""
+    global async_client
+    if async_client is None:
+        from openai import AsyncOpenAI
+        async_client = AsyncOpenAI(api_key=get_api_key())
+    return async_client
 
-    return "", []  # Default case if invalid processing_mode
 
+def get_response_cache() -> ResponseCache:
+    """Return the shared response cache (None if USE_RESPONSE_CACHE is off)."""
+    global response_cache
+    if response_cache is None and USE_RESPONSE_CACHE:
+        response_cache = ResponseCache()
+    return response_cache
+
+
+def load_papers(path: str = WHITEMATTER_JSON_PATH) -> List[Dict[str, Any]]:
+    """
+    Load the paper corpus. A ``.jsonl`` store written by ``generate_json_file(...,
+    store_format="jsonl")`` is opened as a ``PaperStore`` that streams papers lazily
+    and fetches single papers by pmcid; a ``.json`` file is loaded entirely.
+    """
+    with span("load_papers", path=path):
+        if path.endswith(".jsonl"):
+            return PaperStore(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
 
-def extract_one(WM_paper: Dict[str, Any], model: str = "gpt-4o-mini", processing_mode: int = 1) -> Dict[str, Any]:
+# EXTRACTION_FIELDS (the fields returned by the model) come from the prompt module
+CSV_FIELDNAMES = ["pmcid", "title"] + EXTRACTION_FIELDS
+
+
+def empty_result(fields: List[str] = None) -> Dict[str, List[str]]:
+    """Return an empty aggregation dict with one list per extraction field (or per field of ``fields``)."""
+    return {key: [] for key in (EXTRACTION_FIELDS if fields is None else fields)}
+
+
+@traced()
+def merge_chunk_data(all_data: Dict[str, List[str]], data: Dict[str, Any]) -> None:
+    """Aggregate the fields of one parsed completion into ``all_data`` in place."""
+    for key in all_data:
+            if isinstance(data.get(key), list):
+                all_data[key].extend(data[key])
+            elif data.get(key):  # Handle case where API returns string instead of list
+                all_data[key].append(data[key])
+
+
+def merge_chunk_content(all_data: Dict[str, List[str]], content: str, validator: OutputValidator = None) -> bool:
+    """
+    Parse one completion and aggregate its fields into ``all_data`` in place.
+    Returns False (and counts the error in ``validator``) if the completion is malformed.
+    """
+    data = (validator or output_validator).parse(content)
+    if data is None:
+        return False
+    # Aggregate the data from all chunks
+    merge_chunk_data(all_data, data)
+    return True
+
+
+@traced()
+def finalize_result(all_data: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Remove duplicates from the aggregated fields."""
+    for key in all_data:
+        if isinstance(all_data[key], list):
+            all_data[key] = list(set(all_data[key]))
+    return all_data
+
+
+def split_fields(fields: List[str] = None, vocabulary: VocabularyExtractor = None):
+    """
+    Split the wanted fields (default all) into those asked from the model and those
+    found locally by ``vocabulary``. Without a vocabulary, ``fields`` is returned as is.
+    """
+    if vocabulary is None:
+        return fields, []
+    wanted = EXTRACTION_FIELDS if fields is None else fields
+    return ([field for field in wanted if field not in vocabulary.fields],
+            [field for field in wanted if field in vocabulary.fields])
+
+
+def extract_chunk(user_payload: Dict[str, Any], model: str = "gpt-4o-mini",
+                  limiter: RateLimiter = None,
+                  cache: ResponseCache = None,
+                  validator: OutputValidator = None,
+                  ledger: RunLedger = None,
+                  tags: Dict[str, Any] = None,
+                  fields: List[str] = None,
+                  dedup: ChunkDeduplicator = None) -> Dict[str, Any]:
+    """
+    Send one chunk and return its validated result.
+    Only this chunk is re-requested (bypassing the cache) when its output is not
+    valid JSON matching the schema, at most ``validator.max_retries`` times;
+    an empty dict is returned if it never validates.
+    Every call is recorded in ``ledger`` with ``tags`` (pmcid, chunk_index); raises
+    ``BudgetExceeded`` once the ledger's budget is spent.
+    With ``fields``, the prompt and schema are reduced to those fields and only they are returned.
+    With ``dedup``, the result of a near-duplicate chunk extracted before with the same
+    prompt is returned without a call, and every validated result is indexed for later chunks.
+    ``limiter`` defaults to the module-level ``rate_limiter``, so callers never bypass the
+    RPM/TPM budget and the 429 retries.
+    """
+    limiter = limiter or rate_limiter
+    validator = validator or output_validator
+    system_prompt = SYSTEM_PROMPT if fields is None else build_system_prompt(fields)
+    schema = validator.response_format if fields is None else validator.response_format_for(fields)
+    with span("extract_chunk", **(tags or {})):
+        if dedup is not None:
+            with span("dedup_lookup"):
+                scope, signature = dedup.scope(model, system_prompt, schema), dedup.signature(user_payload["body"])
+                data = dedup.find(signature, scope, count_tokens(user_payload["body"], model))
+            if data is not None:
+                return data
+        for attempt in range(validator.max_retries + 1):
+            content = chat_completion(get_client(), model, system_prompt, user_payload, rate_limiter=limiter,
+                                      cache=cache, response_format=schema, refresh=attempt > 0,
+                                      ledger=ledger, tags=tags)
+            with span("validate_response", attempt=attempt):
+                data = validator.parse(content, fields)
+            if data is not None:
+                if attempt:
+                    validator.recovered += 1
+                if fields is not None:
+                    data = {field: data[field] for field in fields}
+                if dedup is not None:
+                    dedup.add(signature, scope, data)
+                return data
+            if attempt < validator.max_retries:
+                validator.retries += 1
+        validator.failed += 1
+        return {}
+
+
+async def extract_chunk_async(user_payload: Dict[str, Any], model: str = "gpt-4o-mini",
+                              semaphore: asyncio.Semaphore = None,
+                              limiter: RateLimiter = None,
+                              cache: ResponseCache = None,
+                              validator: OutputValidator = None,
+                              ledger: RunLedger = None,
+                              tags: Dict[str, Any] = None,
+                              fields: List[str] = None,
+                              dedup: ChunkDeduplicator = None) -> Dict[str, Any]:
+    """Async version of ``extract_chunk``; each attempt holds ``semaphore`` while in flight."""
+    limiter = limiter or rate_limiter
+    validator = validator or output_validator
+    system_prompt = SYSTEM_PROMPT if fields is None else build_system_prompt(fields)
+    schema = validator.response_format if fields is None else validator.response_format_for(fields)
+    with span("extract_chunk", **(tags or {})):
+        if dedup is not None:
+            with span("dedup_lookup"):
+                scope, signature = dedup.scope(model, system_prompt, schema), dedup.signature(user_payload["body"])
+                data = dedup.find(signature, scope, count_tokens(user_payload["body"], model))
+            if data is not None:
+                return data
+        for attempt in range(validator.max_retries + 1):
+            async with semaphore:
+                content = await chat_completion_async(get_async_client(), model, system_prompt, user_payload,
+                                                      rate_limiter=limiter, cache=cache,
+                                                      response_format=schema, refresh=attempt > 0,
+                                                      ledger=ledger, tags=tags)
+            with span("validate_response", attempt=attempt):
+                data = validator.parse(content, fields)
+            if data is not None:
+                if attempt:
+                    validator.recovered += 1
+                if fields is not None:
+                    data = {field: data[field] for field in fields}
+                if dedup is not None:
+                    dedup.add(signature, scope, data)
+                return data
+            if attempt < validator.max_retries:
+                validator.retries += 1
+        validator.failed += 1
+        return {}
+
+
+def extract_one(WM_paper: Dict[str, Any], model: str = "gpt-4o-mini", processing_mode: int = 1,
+                max_chunk_tokens: int = None,
+                chunk_filter: ChunkFilter = None,
+                limiter: RateLimiter = None,
+                cache: ResponseCache = None,
+                validator: OutputValidator = None,
+                ledger: RunLedger = None,
+                fields: List[str] = None,
+                vocabulary: VocabularyExtractor = None,
+                chunk_scheduler: ChunkScheduler = None,
+                dedup: ChunkDeduplicator = None) -> Dict[str, Any]:
     """
     Extract data from a single paper based on the selected processing mode.
     Args:
@@ -84,123 +259,879 @@ def extract_one(WM_paper: Dict[str, Any], model: str = "gpt-4o-mini", processing
         1. No chunking: Combine all data (title, abstract, keywords, and body).
         2. Chunking: Abstract + body (split body into chunks).
         3. Title, Abstract, Keywords: Only include title, abstract, and keywords, no body.
+        max_chunk_tokens (int): Token budget per body chunk (see ``process_full_data``).
+        chunk_filter (ChunkFilter): Optional lexical pre-filter for body sections.
+        limiter (RateLimiter): RPM/TPM limiter, defaults to the module-level ``rate_limiter``.
+        cache (ResponseCache): Response cache checked before any network call,
+            defaults to the shared ``get_response_cache()``.
+        validator (OutputValidator): Output schema and malformed-response counters,
+            defaults to the module-level ``output_validator``.
+        ledger (RunLedger): Optional usage/cost ledger; raises ``BudgetExceeded`` when spent.
+        fields (List[str]): Only extract these fields, with a prompt reduced to them.
+        vocabulary (VocabularyExtractor): Find its closed-vocabulary fields locally and ask
+            the model for the other fields only.
+        chunk_scheduler (ChunkScheduler): Send the best-ranked body sections first and stop
+            once its saturation rule is met.
+        dedup (ChunkDeduplicator): Reuse the result of a near-duplicate chunk extracted before.
     Returns:
         Dict[str, Any]: Extracted data from the paper.
     """
-    full_data, body_chunks = process_full_data(WM_paper, processing_mode)
+    limiter = limiter or rate_limiter
+    cache = cache or get_response_cache()
+    with span("extract_one", pmcid=WM_paper.get("pmcid", ""), mode=processing_mode):
+        chunks = build_chunks(WM_paper, processing_mode, max_chunk_tokens, chunk_filter, chunk_scheduler)
+
+        all_data = empty_result(fields)
+        fields, local_fields = split_fields(fields, vocabulary)
+        if local_fields:
+            for chunk in chunks:
+                merge_chunk_data(all_data, vocabulary.extract(chunk, local_fields))
+            if not fields:
+                return finalize_result(all_data)
+        sent = 0
+        for wave in chunk_scheduler.waves(len(chunks)) if chunk_scheduler else [range(len(chunks))]:
+            for chunk_index in wave:
+                user_payload = {
+                    "body": chunks[chunk_index]  # Send the chunk as the body content
+                }
+                tags = {"pmcid": WM_paper.get("pmcid", ""), "chunk_index": chunk_index}
+                merge_chunk_data(all_data, extract_chunk(user_payload, model, limiter=limiter, cache=cache,
+                                                         validator=validator, ledger=ledger, tags=tags, fields=fields,
+                                                         dedup=dedup))
+            sent += len(wave)
+            if chunk_scheduler is not None and chunk_scheduler.saturated(all_data):
+                break
+        if chunk_scheduler is not None:
+            chunk_scheduler.record(len(chunks), sent)
+
+        # Remove duplicates and return the final data
+        return finalize_result(all_data)
+
+
+async def extract_one_async(WM_paper: Dict[str, Any],
+                            model: str = "gpt-4o-mini",
+                            processing_mode: int = 1,
+                            max_chunk_tokens: int = None,
+                            chunk_filter: ChunkFilter = None,
+                            semaphore: asyncio.Semaphore = None,
+                            limiter: RateLimiter = None,
+                            cache: ResponseCache = None,
+                            validator: OutputValidator = None,
+                            ledger: RunLedger = None,
+                            fields: List[str] = None,
+                            vocabulary: VocabularyExtractor = None,
+                            chunk_scheduler: ChunkScheduler = None,
+                            dedup: ChunkDeduplicator = None) -> Dict[str, Any]:
+    """
+    Async version of ``extract_one``: all chunks of the paper are sent concurrently.
+    Args:
+        WM_paper (Dict[str, Any]): A dictionary containing paper details.
+        model (str): The model to use for extraction.
+        processing_mode (int): The mode of processing (see ``extract_one``).
+        max_chunk_tokens (int): Token budget per body chunk (see ``process_full_data``).
+        chunk_filter (ChunkFilter): Optional lexical pre-filter for body sections.
+        semaphore (asyncio.Semaphore): Shared limit on in-flight API requests.
+        limiter (RateLimiter): RPM/TPM limiter, defaults to the module-level ``rate_limiter``.
+        cache (ResponseCache): Response cache, defaults to the shared ``get_response_cache()``.
+        validator (OutputValidator): Output schema and malformed-response counters; chunks
+            failing validation are re-requested on their own.
+        ledger (RunLedger): Optional usage/cost ledger; raises ``BudgetExceeded`` when spent.
+        fields (List[str]): Only extract these fields, with a prompt reduced to them.
+        vocabulary (VocabularyExtractor): Find its closed-vocabulary fields locally and ask
+            the model for the other fields only.
+        chunk_scheduler (ChunkScheduler): Send the best-ranked body sections first, a wave of
+            chunks at a time, and stop once its saturation rule is met.
+        dedup (ChunkDeduplicator): Reuse the result of a near-duplicate chunk extracted before.
+    Returns:
+        Dict[str, Any]: Extracted data from the paper, aggregated in chunk order.
+    """
+    limiter = limiter or rate_limiter
+    cache = cache or get_response_cache()
+    with span("extract_one", pmcid=WM_paper.get("pmcid", ""), mode=processing_mode):
+        chunks = build_chunks(WM_paper, processing_mode, max_chunk_tokens, chunk_filter, chunk_scheduler)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(len(chunks))
+
+        all_data = empty_result(fields)
+        fields, local_fields = split_fields(fields, vocabulary)
+        if local_fields:
+            for chunk in chunks:
+                merge_chunk_data(all_data, vocabulary.extract(chunk, local_fields))
+            if not fields:
+                return finalize_result(all_data)
+
+        pmcid = WM_paper.get("pmcid", "")
+        sent = 0
+        for wave in chunk_scheduler.waves(len(chunks)) if chunk_scheduler else [range(len(chunks))]:
+            datas = await asyncio.gather(*(extract_chunk_async({"body": chunks[chunk_index]}, model,
+                                                               semaphore=semaphore, limiter=limiter, cache=cache,
+                                                               validator=validator, ledger=ledger,
+                                                               tags={"pmcid": pmcid, "chunk_index": chunk_index},
+                                                               fields=fields, dedup=dedup)
+                                           for chunk_index in wave),
+                                         return_exceptions=True)
+
+            for data in datas:
+                if isinstance(data, BaseException):
+                    raise data  # e.g. BudgetExceeded, once every chunk of the wave has settled
+                merge_chunk_data(all_data, data)
+            sent += len(wave)
+            if chunk_scheduler is not None and chunk_scheduler.saturated(all_data):
+                break
+        if chunk_scheduler is not None:
+            chunk_scheduler.record(len(chunks), sent)
+        return finalize_result(all_data)
+
+
+@traced()
+def parse_packed_content(content: str, validator: OutputValidator = None,
+                         fields: List[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse the answer to a packed request into {pmcid: fields}.
+    Entries failing schema validation (against ``fields``, if the request asked for
+    only some fields) are left out and counted in ``validator``.
+    """
+    validator = validator or output_validator
+    validator.responses += 1
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError) as e:
+        validator.invalid_json += 1
+        print(f"JSON parsing error in packed response: {e}")
+        return {}
+    entries = data.get("results", []) if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        validator.schema_errors += 1
+        return {}
+    return {str(entry["pmcid"]): entry for entry in entries
+            if isinstance(entry, dict) and entry.get("pmcid") is not None and not validator.check(entry, fields)}
 
-    # If we are chunking, we have multiple chunks; otherwise, we have just one chunk
-    if processing_mode == 1 or processing_mode == 3:
-        chunks = [full_data]
+
+@traced("extract_packed")
+async def extract_packed_async(WM_papers: List[Dict[str, Any]],
+                               model: str = "gpt-4o-mini",
+                               semaphore: asyncio.Semaphore = None,
+                               limiter: RateLimiter = None,
+                               cache: ResponseCache = None,
+                               validator: OutputValidator = None,
+                               ledger: RunLedger = None,
+                               fields: List[str] = None,
+                               vocabulary: VocabularyExtractor = None,
+                               dedup: ChunkDeduplicator = None) -> List[Dict[str, Any]]:
+    """
+    Mode-3 extraction of several papers in one request.
+    The title/abstract/keywords of every paper are sent as a JSON array keyed by
+    pmcid and the model answers with one result per pmcid. Papers missing from
+    (or malformed in) the answer are re-run individually with ``extract_one_async``,
+    the packed counterpart of re-requesting only the chunks that failed validation.
+    Args:
+        WM_papers (List[Dict[str, Any]]): The papers packed into one request.
+        model (str): The model to use for extraction.
+        semaphore (asyncio.Semaphore): Shared limit on in-flight API requests.
+        limiter (RateLimiter): RPM/TPM limiter, defaults to the module-level ``rate_limiter``.
+        cache (ResponseCache): Response cache, defaults to the shared ``get_response_cache()``.
+        validator (OutputValidator): Output schema and malformed-response counters.
+        ledger (RunLedger): Optional usage/cost ledger; the packed call is shared between its papers.
+        fields (List[str]): Only extract these fields, with a prompt reduced to them.
+        vocabulary (VocabularyExtractor): Find its closed-vocabulary fields locally and ask
+            the model for the other fields only.
+        dedup (ChunkDeduplicator): Used for the papers re-run individually (packed requests
+            are not deduplicated).
+    Returns:
+        List[Dict[str, Any]]: Extracted data of each paper, in input order.
+    """
+    limiter = limiter or rate_limiter
+    cache = cache or get_response_cache()
+    validator = validator or output_validator
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    bodies = [build_chunks(paper, 3)[0] for paper in WM_papers]
+    model_fields, local_fields = split_fields(fields, vocabulary)
+    if local_fields and not model_fields:
+        return [finalize_result(vocabulary.extract(body, local_fields)) for body in bodies]
+    user_payload = {"papers": [{"pmcid": str(paper.get("pmcid", "")), "body": body}
+                               for paper, body in zip(WM_papers, bodies)]}
+    if model_fields is None:
+        system_prompt, schema = PACKED_SYSTEM_PROMPT, validator.packed_response_format
     else:
-        chunks = [full_data] + body_chunks  # Combine full data (title, abstract, keywords) + body chunks
-
-    all_data = {"subjects": [],
-        "patient_groups": [],
-        "imaging_modalities": [],
-        "whitematter_tracts": [],               
-        "analysis_software": [],
-        "study_type": [],
-        "diffusion_measures": [],
-        "template_space": [],
-        "results_method": [],
-        "white_integrity": [],
-        "question_of_study": [],
+        system_prompt = build_system_prompt(model_fields) + PACKED_INSTRUCTIONS
+        schema = validator.packed_response_format_for(model_fields)
+    async with semaphore:
+        content = await chat_completion_async(get_async_client(), model, system_prompt, user_payload,
+                                              rate_limiter=limiter, cache=cache,
+                                              response_format=schema, ledger=ledger,
+                                              tags={"pmcid": [p["pmcid"] for p in user_payload["papers"]],
+                                                    "chunk_index": 0})
+    returned = parse_packed_content(content, validator, model_fields)
+
+    results = [None] * len(WM_papers)
+    missing = []
+    for i, paper in enumerate(WM_papers):
+        entry = returned.get(str(paper.get("pmcid", "")))
+        if entry is None:
+            missing.append(i)
+            continue
+        all_data = empty_result(fields)
+        merge_chunk_data(all_data, entry if model_fields is None else {field: entry[field] for field in model_fields})
+        if local_fields:
+            merge_chunk_data(all_data, vocabulary.extract(bodies[i], local_fields))
+        results[i] = finalize_result(all_data)
+    if missing:
+        print(f"Packed request returned {len(WM_papers) - len(missing)}/{len(WM_papers)} papers; "
+              f"re-running {len(missing)} individually")
+        singles = await asyncio.gather(*(extract_one_async(WM_papers[i], model=model, processing_mode=3,
+                                                           semaphore=semaphore, limiter=limiter, cache=cache,
+                                                           validator=validator, ledger=ledger, fields=fields,
+                                                           vocabulary=vocabulary, dedup=dedup)
+                                         for i in missing), return_exceptions=True)
+        for i, data in zip(missing, singles):
+            if isinstance(data, BaseException):
+                raise data
+            results[i] = data
+    return results
+
+
+def extract_packed(WM_papers: List[Dict[str, Any]],
+                   model: str = "gpt-4o-mini",
+                   pack_size: int = 10,
+                   max_concurrency: int = 8,
+                   limiter: RateLimiter = None,
+                   cache: ResponseCache = None,
+                   validator: OutputValidator = None,
+                   ledger: RunLedger = None) -> List[Dict[str, Any]]:
+    """
+    Mode-3 extraction with ``pack_size`` papers per request (see ``extract_packed_async``).
+    All packed requests, and the papers re-run individually, share one semaphore, limiter,
+    cache, validator and ledger, so at most ``max_concurrency`` requests are in flight.
+    Args:
+        WM_papers (List[Dict[str, Any]]): The papers to extract.
+        model (str): The model to use for extraction.
+        pack_size (int): Papers per request.
+        max_concurrency (int): Maximum number of in-flight API requests.
+        limiter (RateLimiter): RPM/TPM limiter, defaults to the module-level ``rate_limiter``.
+        cache (ResponseCache): Response cache, defaults to the shared ``get_response_cache()``.
+        validator (OutputValidator): Output schema and malformed-response counters.
+        ledger (RunLedger): Optional usage/cost ledger.
+    Returns:
+        List[Dict[str, Any]]: Extracted data of each paper, in input order.
+    """
+    limiter = limiter or rate_limiter
+    cache = cache or get_response_cache()
+    validator = validator or output_validator
+
+    async def run():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        groups = [WM_papers[i:i + pack_size] for i in range(0, len(WM_papers), pack_size)]
+        packed = await asyncio.gather(*(extract_packed_async(group, model=model, semaphore=semaphore,
+                                                             limiter=limiter, cache=cache,
+                                                             validator=validator, ledger=ledger)
+                                        for group in groups))
+        return [data for group in packed for data in group]
+
+    return run_coroutine(run())
+
+
+@traced("extract_cascade")
+async def extract_cascade_async(WM_papers: List[Dict[str, Any]],
+                                model: str = "gpt-4o-mini",
+                                max_chunk_tokens: int = None,
+                                chunk_filter: ChunkFilter = None,
+                                semaphore: asyncio.Semaphore = None,
+                                limiter: RateLimiter = None,
+                                cache: ResponseCache = None,
+                                validator: OutputValidator = None,
+                                ledger: RunLedger = None,
+                                fields: List[str] = None,
+                                vocabulary: VocabularyExtractor = None,
+                                cascade: Cascade = None,
+                                dedup: ChunkDeduplicator = None) -> List[Dict[str, Any]]:
+    """
+    Cascade extraction: every paper gets the mode-3 pass (title, abstract, keywords; packed
+    when several papers are given), then only the fields ``cascade`` flags as empty or
+    uncertain are extracted from the body sections likely to hold them, and merged in.
+    Prompt tokens are counted locally for each paper, together with what mode 2 would
+    have sent for the same fields, in ``cascade.stats()``.
+    Args:
+        WM_papers (List[Dict[str, Any]]): The papers; more than one are packed in the first pass.
+        model (str): The model to use for extraction.
+        max_chunk_tokens (int): Token budget per body chunk (see ``process_full_data``).
+        chunk_filter (ChunkFilter): Optional lexical pre-filter for body sections.
+        semaphore (asyncio.Semaphore): Shared limit on in-flight API requests.
+        limiter (RateLimiter): RPM/TPM limiter, defaults to the module-level ``rate_limiter``.
+        cache (ResponseCache): Response cache, defaults to the shared ``get_response_cache()``.
+        validator (OutputValidator): Output schema and malformed-response counters.
+        ledger (RunLedger): Optional usage/cost ledger; raises ``BudgetExceeded`` when spent.
+        fields (List[str]): Only extract these fields, with a prompt reduced to them.
+        vocabulary (VocabularyExtractor): Find its closed-vocabulary fields locally and ask
+            the model for the other fields only.
+        cascade (Cascade): Escalation policy and statistics, defaults to ``Cascade()``.
+        dedup (ChunkDeduplicator): Reuse the result of a near-duplicate chunk extracted before.
+    Returns:
+        List[Dict[str, Any]]: Extracted data of each paper, in input order.
+    """
+    cascade = cascade or Cascade()
+    limiter = limiter or rate_limiter
+    cache = cache or get_response_cache()
+    validator = validator or output_validator
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    if len(WM_papers) > 1:
+        datas = await extract_packed_async(WM_papers, model=model, semaphore=semaphore, limiter=limiter, cache=cache,
+                                           validator=validator, ledger=ledger, fields=fields, vocabulary=vocabulary,
+                                           dedup=dedup)
+    else:
+        datas = [await extract_one_async(WM_papers[0], model=model, processing_mode=3, semaphore=semaphore,
+                                         limiter=limiter, cache=cache, validator=validator, ledger=ledger,
+                                         fields=fields, vocabulary=vocabulary, dedup=dedup)]
+
+    model_fields, _ = split_fields(fields, vocabulary)
+    system_prompt = SYSTEM_PROMPT if model_fields is None else build_system_prompt(model_fields)
+    abstracts = [build_chunks(paper, 3)[0] for paper in WM_papers]
+    # Each paper's share of the first pass
+    if model_fields == []:
+        shares = [0] * len(WM_papers)
+    elif len(WM_papers) > 1:
+        packed_prompt = PACKED_SYSTEM_PROMPT if model_fields is None else system_prompt + PACKED_INSTRUCTIONS
+        packed = request_tokens(packed_prompt, {"papers": [{"pmcid": str(paper.get("pmcid", "")), "body": abstract}
+                                                           for paper, abstract in zip(WM_papers, abstracts)]}, model)
+        shares = [packed // len(WM_papers)] * len(WM_papers)
+    else:
+        shares = [request_tokens(system_prompt, {"body": abstracts[0]}, model)]
+    budget = DEFAULT_CHUNK_TOKENS if max_chunk_tokens is None else max_chunk_tokens
+
+    def pack(sections: List[str]) -> List[str]:
+        return pack_sections(sections, budget) if budget else sections
+
+    async def escalate(i: int, paper: Dict[str, Any], data: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        pmcid = paper.get("pmcid", "")
+        sections = split_sections(str(paper.get("body") or ""))
+        if chunk_filter is not None:
+            sections = chunk_filter.filter_sections(sections, pmcid)
+        # What mode 2 sends for the same paper and fields
+        mode2_chunks = [abstracts[i]] + pack(sections)
+        mode2_tokens = 0 if model_fields == [] else sum(request_tokens(system_prompt, {"body": chunk}, model)
+                                                        for chunk in mode2_chunks)
+        escalated = cascade.fields_to_escalate(data, abstracts[i], fields) if sections else []
+        tokens, requests = shares[i], 0
+        if escalated:
+            chunks = pack(cascade.select_sections(sections, escalated))
+            body_model_fields, body_local_fields = split_fields(escalated, vocabulary)
+            body_data = empty_result(escalated)
+            for chunk in chunks if body_local_fields else []:
+                merge_chunk_data(body_data, vocabulary.extract(chunk, body_local_fields))
+            if body_model_fields:
+                body_prompt = build_system_prompt(body_model_fields)
+                results = await asyncio.gather(*(extract_chunk_async({"body": chunk}, model, semaphore=semaphore,
+                                                                     limiter=limiter, cache=cache, validator=validator,
+                                                                     ledger=ledger, fields=body_model_fields,
+                                                                     tags={"pmcid": pmcid, "chunk_index": chunk_index},
+                                                                     dedup=dedup)
+                                                 for chunk_index, chunk in enumerate(chunks, start=1)),
+                                               return_exceptions=True)
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+                    merge_chunk_data(body_data, result)
+                tokens += sum(request_tokens(body_prompt, {"body": chunk}, model) for chunk in chunks)
+                requests = len(chunks)
+            for field in escalated:
+                data[field] = list(set(data[field] + body_data[field]))
+        cascade.record(escalated, tokens, requests, 0 if model_fields == [] else len(mode2_chunks), mode2_tokens)
+        return data
+
+    results = await asyncio.gather(*(escalate(i, paper, data) for i, (paper, data) in enumerate(zip(WM_papers, datas))),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def merge_stored_fields(field_store: FieldStore, pmcid: Any, stored: Dict[str, List[str]],
+                        data: Dict[str, List[str]] = None, model: str = "", save: bool = True) -> Dict[str, List[str]]:
+    """
+    Combine the current fields of a paper in ``field_store`` with the freshly extracted
+    ``data`` (None when no field was stale) and store the fresh fields with their fingerprints.
+    Returns:
+        Dict[str, List[str]]: All fields of the paper.
+    """
+    if data is None:
+        field_store.papers_current += 1
+        field_store.fields_reused += len(stored)
+        return stored
+    if save:
+        field_store.put(pmcid, data, model)
+    merged = dict(stored, **data)
+    field_store.papers_updated += 1
+    field_store.fields_extracted += len(data)
+    field_store.fields_reused += len(merged) - len(data)
+    return merged
+
+
+def build_row(WM_paper: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten the extracted data of one paper into a CSV row."""
+    row = {
+        "pmcid": WM_paper.get("pmcid", ""),
+        "title": WM_paper.get("title", ""),
     }
+    for key in EXTRACTION_FIELDS:
+        row[key] = ";".join(data.get(key, []))
+    return row
 
-    for chunk in chunks:
-        user_payload = {
-            "body": chunk  # Send the chunk as the body content
-        }
-        
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-            ]
-        )
-        
-        content = resp.choices[0].message.content
-        try:
-            data = json.loads(content)
-            # Aggregate the data from all chunks
-            for key in all_data:
-                    if isinstance(data.get(key), list):
-                        all_data[key].extend(data[key])
-                    elif data.get(key):  # Handle case where API returns string instead of list
-                        all_data[key].append(data[key])
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Raw content: {content}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            print(f"Raw content: {content}")
-
-    # Remove duplicates and return the final data
-    for key in all_data:
-        if isinstance(all_data[key], list):
-            all_data[key] = list(set(all_data[key]))
 
-    return all_data
+def write_csv(rows: List[Dict[str, Any]], out_csv: str) -> None:
+    """Write extraction rows to a CSV file."""
+    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
 
 
-def extract_all(WM_papers: List[Dict[str, Any]],
+async def extract_all_async(WM_papers: Iterable[Dict[str, Any]],
+                            out_csv: str = "extracted_info.csv",
+                            model: str = "gpt-4o-mini",
+                            sleep_sec: float = 0.0,
+                            processing_mode: int = 1,
+                            max_chunk_tokens: int = None,
+                            chunk_filter: ChunkFilter = None,
+                            pack_size: int = 1,
+                            max_concurrency: int = 8,
+                            limiter: RateLimiter = None,
+                            cache: ResponseCache = None,
+                            journal_path: str = None,
+                            resume: bool = False,
+                            keep_results: bool = True,
+                            validator: OutputValidator = None,
+                            ledger: RunLedger = None,
+                            shard_index: int = 0,
+                            num_shards: int = 1,
+                            shard_by: str = "hash",
+                            field_store: FieldStore = None,
+                            vocabulary: VocabularyExtractor = None,
+                            out_parquet: str = None,
+                            result_index: ResultIndex = None,
+                            cascade: Cascade = None,
+                            chunk_scheduler: ChunkScheduler = None,
+                            dedup: ChunkDeduplicator = None) -> List[Dict[str, Any]]:
+    """
+    Concurrent engine behind ``extract_all``.
+    ``max_concurrency`` workers pull papers in input order, and the same number
+    bounds the API requests in flight across all papers and their chunks.
+    Rows are written in input order regardless of completion order.
+    With a journal, every finished paper is appended to it as it completes and the
+    CSV is compacted from the journal at the end, so an interrupted run loses nothing.
+    When the ledger's budget is spent, workers stop starting new papers, papers cut
+    short are left out (and redone on resume), and the CSV holds the finished ones.
+    With ``num_shards > 1`` only the papers of shard ``shard_index`` are processed, and
+    the journal keeps their positions in the whole input for ``merge_shards``.
+    With a field store, only the stale fields of each paper are requested (see ``merge_stored_fields``).
+    With ``out_parquet``, the unjoined lists of every finished paper also go to a Parquet
+    dataset, written a row group at a time.
+    With a result index, every finished paper is indexed as it completes.
+    With a cascade, ``processing_mode`` is replaced by ``extract_cascade_async``.
+    """
+    if resume and out_parquet and not journal_path:
+        # Without a journal every paper is redone, and appended to the kept part files again
+        raise ValueError("resume=True with out_parquet needs a journal_path to know which papers are done")
+    limiter = limiter or rate_limiter
+    cache = cache or get_response_cache()
+    # Malformed-response counters are per run
+    validator = validator or OutputValidator(EXTRACTION_FIELDS)
+    ledger = ledger or RunLedger()
+    total = len(WM_papers) if hasattr(WM_papers, "__len__") else None
+    # Rows by input position; without a journal they are needed for the CSV
+    results = {} if keep_results or not journal_path else None
+    journal = RunJournal(journal_path, resume=resume) if journal_path else None
+    finished = journal.completed_pmcids() if journal and resume else set()
+    parquet = None
+    if out_parquet:
+        # Imported here so that pyarrow is only loaded for Parquet output
+        from utils.columnar import ParquetResultWriter
+        parquet = ParquetResultWriter(out_parquet, resume=resume,
+                                      prefix=f"shard-{shard_index}-of-{num_shards}" if num_shards > 1 else "part")
+    if parquet is not None and finished:
+        # Papers journaled but still buffered for Parquet when the run died are redone
+        finished &= parquet.completed_pmcids()
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Workers pull from one shared iterator, so only ``max_concurrency`` papers
+    # are held at a time even when WM_papers is a lazy stream
+    if num_shards > 1:
+        papers = shard_items(WM_papers, shard_index, num_shards, by=shard_by)
+        total = None
+        if shard_by == "range":
+            start, end = shard_range(len(WM_papers), shard_index, num_shards)
+            total = end - start
+    else:
+        papers = enumerate(WM_papers)
+    done = skipped = 0
+    budget_reached = False
+
+    # Mode 3 (and the first pass of the cascade) can pack several papers into one request
+    group_size = pack_size if (processing_mode == 3 or cascade is not None) and pack_size > 1 else 1
+
+    async def worker():
+        nonlocal done, skipped, budget_reached
+        while not budget_reached:
+            group = list(itertools.islice(papers, group_size))
+            if not group:
+                return
+            todo = [(i, paper) for i, paper in group if str(paper.get("pmcid", "")) not in finished]
+            skipped += len(group) - len(todo)
+            if not todo:
+                continue
+            query, fields, stored = todo, None, {}
+            if field_store is not None:
+                stale = {}
+                for i, paper in todo:
+                    stored[i], stale[i] = field_store.lookup(paper.get("pmcid", ""))
+                query = [(i, paper) for i, paper in todo if stale[i]]
+                # A packed group asks for the union of its papers' stale fields; all of
+                # them is the unreduced prompt, so its cached responses are reused
+                wanted = {field for i, _ in query for field in stale[i]}
+                if len(wanted) < len(field_store.fields):
+                    fields = [field for field in field_store.fields if field in wanted]
+            started = time.perf_counter()
+            failed_before = validator.failed
+            try:
+                if not query:
+                    datas = []
+                elif cascade is not None:
+                    datas = await extract_cascade_async([paper for _, paper in query], model=model,
+                                                        max_chunk_tokens=max_chunk_tokens, chunk_filter=chunk_filter,
+                                                        semaphore=semaphore, limiter=limiter, cache=cache,
+                                                        validator=validator, ledger=ledger, fields=fields,
+                                                        vocabulary=vocabulary, cascade=cascade, dedup=dedup)
+                elif group_size > 1:
+                    datas = await extract_packed_async([paper for _, paper in query], model=model,
+                                                       semaphore=semaphore, limiter=limiter, cache=cache,
+                                                       validator=validator, ledger=ledger, fields=fields,
+                                                       vocabulary=vocabulary, dedup=dedup)
+                else:
+                    datas = [await extract_one_async(query[0][1], model=model, processing_mode=processing_mode,
+                                                     max_chunk_tokens=max_chunk_tokens, chunk_filter=chunk_filter,
+                                                     semaphore=semaphore, limiter=limiter, cache=cache,
+                                                     validator=validator, ledger=ledger, fields=fields,
+                                                     vocabulary=vocabulary, chunk_scheduler=chunk_scheduler,
+                                                     dedup=dedup)]
+            except BudgetExceeded:
+                # Stop cleanly: this paper is not recorded, so a resumed run redoes it
+                budget_reached = True
+                return
+            elapsed = time.perf_counter() - started
+            datas = dict(zip((i for i, _ in query), datas))
+            # A chunk given up leaves its fields empty, which must not be stored as current.
+            # The counter is shared by concurrent papers, so this may also skip storing a
+            # valid paper, which is then simply extracted again by the next run.
+            complete = validator.failed == failed_before
+            for i, paper in todo:
+                data = datas.get(i)
+                if field_store is not None:
+                    data = merge_stored_fields(field_store, paper.get("pmcid", ""), stored[i], data,
+                                               model=model, save=complete)
+                ledger.record_paper_time(paper.get("pmcid", ""), elapsed)
+                with span("write_results", pmcid=paper.get("pmcid", "")):
+                    row = build_row(paper, data)
+                    if journal:
+                        journal.append(i, row)
+                    if parquet is not None:
+                        parquet.append(i, paper, data)
+                    if result_index is not None:
+                        result_index.add(paper.get("pmcid", ""), data)
+                if results is not None:
+                    results[i] = row
+                done += 1
+                print(f"Processed {done + skipped}/{total}" if total is not None else f"Processed {done}")
+            if sleep_sec:
+                await asyncio.sleep(sleep_sec)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, max_concurrency))))
+    finally:
+        # Also runs on errors and Ctrl-C, so every finished paper is on disk
+        if journal:
+            journal.close()
+        if parquet is not None:
+            parquet.close()
+        if result_index is not None:
+            result_index.save()
+        ledger.close()
+
+    if budget_reached:
+        print(f"Budget reached after {done} papers ({ledger.total_tokens} tokens, ${ledger.cost:.4f}); "
+              + (f"rerun with resume=True to continue from {journal_path}" if journal else "stopping early"))
+    if skipped:
+        print(f"Resumed: skipped {skipped} papers already in {journal_path}")
+
+    # Write results to CSV
+    with span("write_csv", path=out_csv):
+        if journal:
+            n_rows = compact_journal(journal_path, out_csv, CSV_FIELDNAMES)
+        else:
+            write_csv([results[i] for i in sorted(results)], out_csv)
+            n_rows = len(results)
+    print(f"✅ Successfully saved {n_rows} records to {out_csv}")
+    if parquet is not None:
+        print(f"✅ Successfully saved {parquet.rows_written} records to {out_parquet} "
+              f"({len(parquet.part_files())} part files)")
+    if result_index is not None:
+        stats = result_index.stats()
+        print(f"Result index: {stats['papers']} papers, {sum(stats['values'].values())} values in {result_index.path}")
+    if limiter.rate_limited:
+        print(f"Rate limited {limiter.rate_limited} times (rate scale now {limiter.scale:.2f})")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    if dedup is not None:
+        stats = dedup.stats()
+        print(f"Near-duplicate chunks: {stats['hits']}/{stats['lookups']} reused ({stats['hit_rate']:.0%} hit rate, "
+              f"~{stats['tokens_saved']} tokens not sent), {stats['too_short']} too short to match, "
+              f"{stats['entries']} chunks indexed")
+    if chunk_scheduler is not None:
+        stats = chunk_scheduler.stats()
+        print(f"Chunk scheduler: sent {stats['chunks_sent']}/{stats['chunks_total']} chunks "
+              f"({stats['chunks_per_paper']:.2f}/paper), {stats['stopped_early']}/{stats['papers']} papers stopped early")
+    if chunk_filter is not None:
+        stats = chunk_filter.stats()
+        print(f"Pre-filter: dropped {stats['sections_dropped']}/{stats['sections_seen']} sections, "
+              f"~{stats['tokens_saved']} tokens saved over {stats['papers']} papers")
+    stats = ledger.stats()
+    if stats["calls"]:
+        print(f"Usage: {stats['calls']} calls, {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion "
+              f"tokens ({stats['cached_tokens']} cached), ${stats['cost']:.4f} "
+              f"(${stats['cost_per_paper']:.5f}/paper), {stats['mean_latency']:.2f}s mean latency")
+    if cascade is not None:
+        stats = cascade.stats()
+        saved = stats["tokens_saved"] / stats["mode2_tokens"] if stats["mode2_tokens"] else 0.0
+        print(f"Cascade: {stats['escalated']}/{stats['papers']} papers escalated to the body "
+              f"({stats['sections_sent']}/{stats['sections_seen']} sections, {stats['body_requests']} requests); "
+              f"~{stats['tokens']} prompt tokens vs ~{stats['mode2_tokens']} in mode 2 "
+              f"({stats['mode2_requests']} requests), {stats['tokens_saved']} saved ({saved:.0%})")
+    if vocabulary is not None:
+        stats = vocabulary.stats()
+        print(f"Vocabulary fast path: {', '.join(vocabulary.fields)} found locally "
+              f"({stats['matches']} values in {stats['chunks']} chunks)")
+    if field_store is not None:
+        stats = field_store.stats()
+        print(f"Field store: {stats['papers_current']} papers up to date, {stats['papers_updated']} updated "
+              f"({stats['fields_extracted']} fields extracted, {stats['fields_reused']} reused)")
+    if validator.malformed:
+        stats = validator.stats()
+        print(f"Malformed responses: {stats['malformed']}/{stats['responses']} ({stats['invalid_json']} invalid JSON, "
+              f"{stats['schema_errors']} schema errors); {stats['retries']} chunk retries, "
+              f"{stats['recovered']} recovered, {stats['failed']} given up")
+
+    if not keep_results:
+        return []
+    return [results[i] for i in sorted(results)]
+
+
+def extract_all(WM_papers: Iterable[Dict[str, Any]],
                 out_csv: str = "extracted_info.csv",
                 model: str = "gpt-4o-mini",
-                sleep_sec: float = 0.8,
-                processing_mode: int = 1) -> List[Dict[str, Any]]:
+                sleep_sec: float = 0.0,
+                processing_mode: int = 1,
+                max_chunk_tokens: int = None,
+                chunk_filter: ChunkFilter = None,
+                pack_size: int = 1,
+                max_concurrency: int = 8,
+                limiter: RateLimiter = None,
+                cache: ResponseCache = None,
+                journal_path: str = None,
+                resume: bool = False,
+                keep_results: bool = True,
+                validator: OutputValidator = None,
+                ledger: RunLedger = None,
+                shard_index: int = 0,
+                num_shards: int = 1,
+                shard_by: str = "hash",
+                field_store: FieldStore = None,
+                vocabulary: VocabularyExtractor = None,
+                out_parquet: str = None,
+                result_index: ResultIndex = None,
+                cascade: Cascade = None,
+                chunk_scheduler: ChunkScheduler = None,
+                dedup: ChunkDeduplicator = None) -> List[Dict[str, Any]]:
     """
     Extract data from all papers and save to CSV, with option to select processing mode.
+    Papers and their mode-2 chunks are processed concurrently with the async client.
     Args:
-        WM_papers (List[Dict[str, Any]]): List of dictionaries containing paper details.
+        WM_papers (Iterable[Dict[str, Any]]): Papers to process: a list, or any iterator such as
+            ``PaperStore.iter_range(...)``; papers are pulled lazily, so memory use does not
+            depend on corpus size.
         out_csv (str): Output CSV file path.
         model (str): The model to use for extraction.
-        sleep_sec (float): Sleep time between API calls to avoid rate limits.       
+        sleep_sec (float): Optional extra pause per worker after each paper. Throttling is
+            normally left to ``limiter``.
         processing_mode (int): The mode of processing (1: No chunking, 2: Chunking, 3: Title, Abstract, Keywords only).
+        max_chunk_tokens (int): Token budget per body chunk; adjacent sections are packed up to
+            it in mode 2 (default DEFAULT_CHUNK_TOKENS, 0 = one request per '##' section).
+        chunk_filter (ChunkFilter): Optional lexical pre-filter skipping body sections such as
+            References or Funding; its per-paper and run savings are in ``chunk_filter.stats()``.
+        pack_size (int): In mode 3, number of papers packed into one request (JSON array keyed
+            by pmcid); papers missing from the answer are re-run individually.
+        max_concurrency (int): Number of papers processed at once and maximum number of
+            API requests in flight. 1 reproduces the sequential behaviour.
+        limiter (RateLimiter): RPM/TPM limiter shared by all requests, defaults to the
+            module-level ``rate_limiter``. Use ``RateLimiter(rpm=..., tpm=...)`` for other limits.
+        cache (ResponseCache): Response cache checked before every request, defaults to the shared
+            ``get_response_cache()``. Use ``ResponseCache(read_only=True)`` to replay only.
+        journal_path (str): Optional JSONL checkpoint journal; each finished paper is appended
+            as it completes and the CSV is compacted from it at the end.
+        resume (bool): Keep the existing journal and skip the pmcids it already contains.
+        keep_results (bool): Keep the rows in memory and return them. Set to False for very
+            large corpora (with a journal) to keep memory flat.
+        validator (OutputValidator): Output schema, retry bound and malformed-response counters
+            of the run (``validator.stats()``). Defaults to a new ``OutputValidator(EXTRACTION_FIELDS)``;
+            pass ``use_schema=False`` for models without structured outputs.
+        ledger (RunLedger): Records tokens, latency and cost of every call with per-paper and
+            run rollups (``ledger.stats()``, ``ledger.top_papers()``). ``RunLedger(path, max_tokens=...,
+            max_cost=...)`` writes the ledger to a JSONL file and stops the run cleanly, with
+            the journal, once the budget is spent. Defaults to an in-memory ledger without budget.
+        shard_index (int): Shard processed by this call, from 0 to ``num_shards - 1``.
+        num_shards (int): Split the input into this many shards (see ``utils.sharding``); give
+            each shard its own ``journal_path`` and merge them with ``merge_shards``.
+        shard_by (str): "hash" (pmcid hash mod ``num_shards``) or "range" (contiguous blocks).
+        field_store (FieldStore): Results per (pmcid, field) with the fingerprint of the field's
+            prompt. Only fields that are missing or whose instructions changed are re-extracted,
+            with a prompt reduced to them, and merged with the stored ones.
+        vocabulary (VocabularyExtractor): Deterministic fast path: its closed-vocabulary fields
+            (e.g. ``LOCAL_FIELDS``: modalities, diffusion measures, template space, software) are found
+            locally in one pass over each chunk and the prompt is reduced to the other fields.
+            Check it against the model with ``utils.vocabulary.compare_with_llm``.
+        out_parquet (str): Also write the results to this Parquet dataset (needs ``pyarrow``),
+            one list<string> column per field, row groups written as papers finish.
+            Read it with ``utils.columnar.read_results``. Resuming it needs ``journal_path``
+            (``ValueError`` otherwise), which tells the papers already written.
+        result_index (ResultIndex): Inverted index updated with every finished paper, for
+            AND/OR/NOT queries and facet counts over the results (see ``utils.result_index``).
+        cascade (Cascade): Adaptive mode used instead of ``processing_mode``: the mode-3 pass
+            first (packed with ``pack_size``), then body chunks only for the fields left empty
+            or uncertain, over the sections likely to hold them (see ``utils.cascade``).
+            ``cascade.stats()`` reports the papers escalated and the tokens saved vs. mode 2.
+        chunk_scheduler (ChunkScheduler): In modes 1 and 2, send a paper's chunks best-ranked
+            first (body sections ordered by heading and vocabulary density) and skip the rest
+            once its saturation rule over the fields is met (see ``utils.chunk_scheduler``).
+        dedup (ChunkDeduplicator): MinHash/LSH index of the chunks extracted so far (kept
+            across runs); a chunk whose near-duplicate was already extracted with the same
+            prompt reuses that result instead of calling the API (see ``utils.dedup``).
     Returns:
-        List[Dict[str, Any]]: List of extracted data from all papers.   
+        List[Dict[str, Any]]: List of extracted data from the papers processed in this run, in input order.
     """
-    results = []
-    for i, paper in enumerate(WM_papers, 1):
-        data = extract_one(paper, model=model, processing_mode=processing_mode)
-        row = {
-            "pmcid": paper.get("pmcid", ""),
-            "title": paper.get("title", ""),
-            "subjects": ";".join(data.get("subjects", [])),
-            "patient_groups": ";".join(data.get("patient_groups", [])),
-            "imaging_modalities": ";".join(data.get("imaging_modalities", [])),
-            "whitematter_tracts": ";".join(data.get("whitematter_tracts", [])),
-            "analysis_software": ";".join(data.get("analysis_software", [])),
-            "study_type": ";".join(data.get("study_type", [])),
-            "diffusion_measures": ";".join(data.get("diffusion_measures", [])),
-            "template_space": ";".join(data.get("template_space", [])),
-            "results_method": ";".join(data.get("results_method", [])),
-            "white_integrity": ";".join(data.get("white_integrity", [])),
-            "question_of_study": ";".join(data.get("question_of_study", [])),
-        }
-        results.append(row)
-        print(f"Processed {i}/{len(WM_papers)}")
-        time.sleep(sleep_sec)
+    return run_coroutine(extract_all_async(WM_papers, out_csv=out_csv, model=model, sleep_sec=sleep_sec,
+                                           processing_mode=processing_mode, max_chunk_tokens=max_chunk_tokens,
+                                           chunk_filter=chunk_filter, pack_size=pack_size,
+                                           max_concurrency=max_concurrency,
+                                           limiter=limiter, cache=cache, journal_path=journal_path,
+                                           resume=resume, keep_results=keep_results, validator=validator,
+                                           ledger=ledger, shard_index=shard_index, num_shards=num_shards,
+                                           shard_by=shard_by, field_store=field_store,
+                                           vocabulary=vocabulary, out_parquet=out_parquet,
+                                           result_index=result_index, cascade=cascade,
+                                           chunk_scheduler=chunk_scheduler, dedup=dedup))
 
-    # Write results to CSV
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["pmcid", "title","subjects", "patient_groups", "imaging_modalities", "whitematter_tracts","analysis_software","study_type","diffusion_measures","template_space","results_method","white_integrity","question_of_study"]
-        )
-        writer.writeheader()
-        writer.writerows(results)
-    
-    print(f"✅ Successfully saved {len(results)} records to {out_csv}")
 
-    return results
+def extract_all_batch(WM_papers: Iterable[Dict[str, Any]],
+                      out_csv: str = "extracted_info.csv",
+                      model: str = "gpt-4o-mini",
+                      processing_mode: int = 1,
+                      max_chunk_tokens: int = None,
+                      chunk_filter: ChunkFilter = None,
+                      batch_dir: str = "data/batches",
+                      poll_interval: float = 60.0,
+                      batch_ids: List[str] = None,
+                      batch_client=None,
+                      validator: OutputValidator = None,
+                      out_parquet: str = None) -> List[Dict[str, Any]]:
+    """
+    Extract data from all papers through the OpenAI Batch API and save to CSV.
+    Every chunk from ``process_full_data`` becomes one request with
+    ``custom_id`` = pmcid + chunk index; the batch output is aggregated per paper
+    exactly like ``extract_all`` and written with the same CSV writer.
+    Args:
+        WM_papers (Iterable[Dict[str, Any]]): List of papers or a ``PaperStore`` (iterated twice:
+            once to build the requests and once to aggregate the output).
+        out_csv (str): Output CSV file path.
+        model (str): The model to use for extraction.
+        processing_mode (int): The mode of processing (1: No chunking, 2: Chunking, 3: Title, Abstract, Keywords only).
+        max_chunk_tokens (int): Token budget per body chunk (see ``process_full_data``).
+        chunk_filter (ChunkFilter): Optional lexical pre-filter for body sections.
+        batch_dir (str): Directory for the batch input files.
+        poll_interval (float): Seconds between two status polls.
+        batch_ids (List[str]): Ids of already submitted batches for the same papers; skips
+            building and submitting, e.g. to ingest last night's run.
+        batch_client: Client used for the batch endpoints, e.g.
+            ``OpenAI(base_url=MockOpenAIServer().base_url)``. Defaults to ``get_client()``.
+        validator (OutputValidator): Output schema and malformed-response counters. The batch
+            requests ask for the schema; malformed outputs are counted and listed, since a
+            finished batch cannot be retried chunk by chunk (rerun them with ``extract_all``).
+        out_parquet (str): Also write the results to this Parquet dataset (see ``extract_all``).
+    Returns:
+        List[Dict[str, Any]]: List of extracted data from all papers, in input order.
+    """
+    batch_client = batch_client or get_client()
+    validator = validator or OutputValidator(EXTRACTION_FIELDS)
+
+    if batch_ids is None:
+        def batch_requests():
+            for paper in WM_papers:
+                for chunk_index, chunk in enumerate(build_chunks(paper, processing_mode, max_chunk_tokens, chunk_filter)):
+                    yield make_custom_id(paper.get("pmcid", ""), chunk_index), {"body": chunk}
 
-extract_all(whitematter_json[0:3], processing_mode=1)
+        prefix = os.path.join(batch_dir, f"batch_mode{processing_mode}_{int(time.time())}")
+        paths = write_batch_files(batch_requests(), prefix, model, SYSTEM_PROMPT,
+                                  response_format=validator.response_format)
+        batch_ids = []
+        for path in paths:
+            batch = submit_batch(batch_client, path, metadata={"processing_mode": str(processing_mode)})
+            print(f"Submitted {path} as batch {batch.id}")
+            batch_ids.append(batch.id)
 
+    # Collect the completions per paper, keyed by chunk index
+    contents = {}
+    n_failed = 0
+    for batch_id in batch_ids:
+        batch = wait_for_batch(batch_client, batch_id, poll_interval=poll_interval)
+        if batch.status != "completed":
+            print(f"Batch {batch_id} ended with status {batch.status}")
+        for custom_id, content in iter_batch_output(batch_client, batch):
+            if content is None:
+                n_failed += 1
+                continue
+            pmcid, chunk_index = parse_custom_id(custom_id)
+            contents.setdefault(pmcid, {})[chunk_index] = content
 
+    results = []
+    malformed = []
+    parquet = None
+    if out_parquet:
+        from utils.columnar import ParquetResultWriter
+        parquet = ParquetResultWriter(out_parquet)
+    for i, paper in enumerate(WM_papers):
+        all_data = empty_result()
+        pmcid = str(paper.get("pmcid", ""))
+        paper_contents = contents.get(pmcid, {})
+        for chunk_index in sorted(paper_contents):
+            if not merge_chunk_content(all_data, paper_contents[chunk_index], validator):
+                malformed.append(make_custom_id(pmcid, chunk_index))
+        data = finalize_result(all_data)
+        results.append(build_row(paper, data))
+        if parquet is not None:
+            parquet.append(i, paper, data)
 
+    write_csv(results, out_csv)
+    print(f"✅ Successfully saved {len(results)} records to {out_csv}")
+    if parquet is not None:
+        parquet.close()
+        print(f"✅ Successfully saved {parquet.rows_written} records to {out_parquet}")
+    if n_failed:
+        print(f"{n_failed} batch requests failed; their chunks are missing from the results")
+    if malformed:
+        print(f"{len(malformed)} malformed batch outputs: {', '.join(malformed[:20])}"
+              + (" ..." if len(malformed) > 20 else ""))
 
+    return results
 
 
+if __name__ == "__main__":
+    extract_all(load_papers()[0:3], processing_mode=1)
@@ -1,51 +1,118 @@
+import hashlib
+import json
 
-SYSTEM_PROMPT = """You are an information extraction expert for brain imaging papers.
+# The prompt is assembled from one block per field, so a request can ask for only
+# some fields and every field's instructions can be fingerprinted on their own.
+
+PROMPT_HEADER = """You are an information extraction expert for brain imaging papers.
 
 Task: Given a JSON object that contain the paper details like title, abstract, and body, extract and return a JSON object with these fields:
+"""
 
-- imaging_modalities: e.g ["Anatomical MRI","fMRI","DTI","PET","CT","SPECT","MEG","EEG"]
-- patient_groups: e.g ["Alzheimer's disease","Bipolar","Healthy controls"]
-- whitematter_tracts: e.g ["Corpus Callosum","Cingulum","Uncinate Fasciculus","Superior Longitudinal Fasciculus"]
-- subjects: e.g ["humans","mice","rats","monkeys"]  
-- analysis_software: e.g ["DIPY","FSL","FreeSurfer","SPM"]
-- study_type: e.g ["review", "single study"]
-- diffusion_measures: e.g ["FA","MD","AD","RD","MK", "NDI","ODI"]    
-- template_space: e.g ["Talairach","MNI"]
-- results_method: e.g ["t-test","ANOVA","MANOVA","beta effect size","correlation", "regression"]
-- white_integrity: e.g ["decrease", "increase","no mention"]
-- question_of_study: e.g ["bipolar patients vs controls", "Alzheimer's patients vs controls"]
-
-Rules:
-- Return values mentioned in the text that clearly belong to each category
-- For white matter tracts, only return names of specific white matter tracts, not general brain regions
-- Imaging modalities should be only brain imaging modalities related to structural and functional brain imaging
-- Patient groups should be conditions or diseases affecting humans e.g Alzheimer's disease, Bipolar disorder, Healthy controls
-- Subjects should be the species/organisms studied, e.g humans, mice, rats, monkeys
-- Analysis software: Extract the specialized neuroimaging analysis software or toolboxes that were used for the neuroimaging analysis, e.g (FSL, FreeSurfer, SPM, AFNI, DIPY).Do NOT include 
-  statistical analysis software like SPSS, R, SPSS, STATA, etc. Only comprehensive software library specifically for analyzing and processing neuroimaging data, such as fMRI, sMRI, and diffusion MRI.
-- Study type: "single study" for original research, "review" for review studies or meta-analysis
-- Template space should be the template space used for the analysis, e.g Talairach, MNI
-- Results method should be the statistical method used for the analysis
-- White matter integrity should be the mention of white matter integrity changes in the text
-- Question of study should be the experimental conditions or comparisons the researchers used
-- The lists given above are examples, not exhaustive
-- If none apply, return an empty list for that field
-- Output must be valid JSON only
-
-Example output format:
-{
-  "imaging_modalities": ["fMRI", "DTI"],
-  "patient_groups": ["Alzheimer's disease", "Healthy controls"],
-  "whitematter_tracts": ["Corpus Callosum"],
-  "subjects": ["humans"],
-  "analysis_software": ["FSL", "FreeSurfer", "SPM"],
-  "study_type": ["single study"],
-  "diffusion_measures": ["FA", "MD"],
-  "template_space": ["MNI"],
-  "results_method": ["t-test"],
-  "white_integrity": ["decrease"],
-  "question_of_study": ["Alzheimer's patients vs controls"]
+# Per field, in prompt order: (examples, rule, example output). A field without a rule has None.
+# Trailing spaces are part of the original prompt and kept, so SYSTEM_PROMPT is unchanged.
+FIELD_PROMPTS = {
+    "imaging_modalities": (
+        '["Anatomical MRI","fMRI","DTI","PET","CT","SPECT","MEG","EEG"]',
+        "Imaging modalities should be only brain imaging modalities related to structural and functional brain imaging",
+        ["fMRI", "DTI"]),
+    "patient_groups": (
+        '["Alzheimer\'s disease","Bipolar","Healthy controls"]',
+        "Patient groups should be conditions or diseases affecting humans e.g Alzheimer's disease, Bipolar disorder, Healthy controls",
+        ["Alzheimer's disease", "Healthy controls"]),
+    "whitematter_tracts": (
+        '["Corpus Callosum","Cingulum","Uncinate Fasciculus","Superior Longitudinal Fasciculus"]',
+        "For white matter tracts, only return names of specific white matter tracts, not general brain regions",
+        ["Corpus Callosum"]),
+    "subjects": (
+        '["humans","mice","rats","monkeys"]  ',
+        "Subjects should be the species/organisms studied, e.g humans, mice, rats, monkeys",
+        ["humans"]),
+    "analysis_software": (
+        '["DIPY","FSL","FreeSurfer","SPM"]',
+        "Analysis software: Extract the specialized neuroimaging analysis software or toolboxes that were used "
+        "for the neuroimaging analysis, e.g (FSL, FreeSurfer, SPM, AFNI, DIPY).Do NOT include \n"
+        "  statistical analysis software like SPSS, R, SPSS, STATA, etc. Only comprehensive software library "
+        "specifically for analyzing and processing neuroimaging data, such as fMRI, sMRI, and diffusion MRI.",
+        ["FSL", "FreeSurfer", "SPM"]),
+    "study_type": (
+        '["review", "single study"]',
+        'Study type: "single study" for original research, "review" for review studies or meta-analysis',
+        ["single study"]),
+    "diffusion_measures": (
+        '["FA","MD","AD","RD","MK", "NDI","ODI"]    ',
+        None,
+        ["FA", "MD"]),
+    "template_space": (
+        '["Talairach","MNI"]',
+        "Template space should be the template space used for the analysis, e.g Talairach, MNI",
+        ["MNI"]),
+    "results_method": (
+        '["t-test","ANOVA","MANOVA","beta effect size","correlation", "regression"]',
+        "Results method should be the statistical method used for the analysis",
+        ["t-test"]),
+    "white_integrity": (
+        '["decrease", "increase","no mention"]',
+        "White matter integrity should be the mention of white matter integrity changes in the text",
+        ["decrease"]),
+    "question_of_study": (
+        '["bipolar patients vs controls", "Alzheimer\'s patients vs controls"]',
+        "Question of study should be the experimental conditions or comparisons the researchers used",
+        ["Alzheimer's patients vs controls"]),
 }
+
+# Order of the field rules under "Rules:" (it differs from the field order above)
+RULE_ORDER = ["whitematter_tracts", "imaging_modalities", "patient_groups", "subjects", "analysis_software",
+              "study_type", "diffusion_measures", "template_space", "results_method", "white_integrity",
+              "question_of_study"]
+
+GENERAL_RULES_BEFORE = ["Return values mentioned in the text that clearly belong to each category"]
+GENERAL_RULES_AFTER = ["The lists given above are examples, not exhaustive",
+                       "If none apply, return an empty list for that field",
+                       "Output must be valid JSON only"]
+
+# Fields listed in SYSTEM_PROMPT, in CSV column order; the structured-output schema is built from them
+EXTRACTION_FIELDS = ["subjects", "patient_groups", "imaging_modalities", "whitematter_tracts",
+                     "analysis_software", "study_type", "diffusion_measures", "template_space",
+                     "results_method", "white_integrity", "question_of_study"]
+
+
+def build_system_prompt(fields=None) -> str:
+    """
+    System prompt asking for ``fields`` only (all fields by default), e.g. to re-extract
+    the fields whose instructions changed without paying for the others.
+    """
+    selected = [field for field in FIELD_PROMPTS if fields is None or field in fields]
+    rules = GENERAL_RULES_BEFORE + [FIELD_PROMPTS[field][1] for field in RULE_ORDER
+                                    if field in selected and FIELD_PROMPTS[field][1]]
+    example = ",\n".join(f"  {json.dumps(field)}: {json.dumps(FIELD_PROMPTS[field][2])}" for field in selected)
+    return (PROMPT_HEADER + "\n"
+            + "".join(f"- {field}: e.g {FIELD_PROMPTS[field][0]}\n" for field in selected)
+            + "\nRules:\n"
+            + "".join(f"- {rule}\n" for rule in rules + GENERAL_RULES_AFTER)
+            + "\nExample output format:\n{\n" + example + "\n}\n")
+
+
+def field_fingerprint(field: str) -> str:
+    """
+    Hash of everything in the prompt that determines ``field``'s values: its own block and
+    the text shared by all fields. It changes when the field's rule or examples are edited.
+    """
+    blob = json.dumps([PROMPT_HEADER, GENERAL_RULES_BEFORE, GENERAL_RULES_AFTER, field, FIELD_PROMPTS[field]],
+                      ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+SYSTEM_PROMPT = build_system_prompt()
+
+# Appended to SYSTEM_PROMPT when several papers are packed into one request
+PACKED_INSTRUCTIONS = """
+Packed input: the JSON object contains a "papers" list, each entry with a "pmcid" and the paper text in "body".
+Extract the fields for each paper independently and return a JSON object of the form
+{"results": [{"pmcid": "<pmcid exactly as given>", "imaging_modalities": [...], ...}, ...]}
+with exactly one entry per input paper, in the same order.
 """
 
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + PACKED_INSTRUCTIONS
+
 ## end of prompt
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from utils.mock_openai import DEFAULT_RESULT, MockOpenAIServer
+from utils.rate_limiter import RateLimiter
+
+
+def echo_responder(request_body):
+    """Puts the first word of each paper's text in ``subjects``, so results can be matched to papers."""
+    payload = json.loads(request_body["messages"][-1]["content"])
+    if isinstance(payload.get("papers"), list):
+        return json.dumps({"results": [dict(DEFAULT_RESULT, pmcid=paper["pmcid"], subjects=[paper["body"].split()[0]])
+                                       for paper in payload["papers"]]})
+    return json.dumps(dict(DEFAULT_RESULT, subjects=[payload["body"].split()[0]]))
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """``MockOpenAIServer`` behind ``main``'s clients, without the response cache."""
+    openai = pytest.importorskip("openai")
+    import main
+
+    with MockOpenAIServer(responder=echo_responder, jitter=0.02, seed=0) as server:
+        # The SDK's own retries would hide the 429 handling under test
+        monkeypatch.setattr(main, "client", openai.OpenAI(base_url=server.base_url, api_key="test", max_retries=0))
+        monkeypatch.setattr(main, "async_client",
+                            openai.AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0))
+        monkeypatch.setattr(main, "USE_RESPONSE_CACHE", False)
+        monkeypatch.setattr(main, "response_cache", None)
+        monkeypatch.setattr(main, "rate_limiter", RateLimiter())
+        yield server
+
+
+def make_papers(n, body=""):
+    return [{"pmcid": 1000 + i, "title": f"paper{i}", "abstract": "Diffusion tensor imaging study.",
+             "keywords": "DTI", "body": body} for i in range(n)]
@@ -0,0 +1,35 @@
+import csv
+import json
+
+from tests.conftest import echo_responder, make_papers
+
+
+def test_packed_extraction_reruns_only_the_missing_paper(mock_api, tmp_path):
+    import abstract
+
+    dropped = "1003"
+    requests = []
+
+    def responder(request_body):
+        payload = json.loads(request_body["messages"][-1]["content"])
+        requests.append(payload)
+        reply = json.loads(echo_responder(request_body))
+        if "results" in reply:
+            reply["results"] = [entry for entry in reply["results"] if entry["pmcid"] != dropped]
+        return json.dumps(reply)
+
+    mock_api.responder = responder
+    papers = make_papers(7)
+    rows = abstract.extract_all(papers, out_csv=str(tmp_path / "out.csv"), pack_size=3)
+
+    packed = [payload for payload in requests if "papers" in payload]
+    singles = [payload for payload in requests if "papers" not in payload]
+    # Packed requests run concurrently, so they may arrive in any order
+    assert sorted([p["pmcid"] for p in payload["papers"]] for payload in packed) == [
+        ["1000", "1001", "1002"], ["1003", "1004", "1005"], ["1006"]]
+    assert len(singles) == 1
+    assert singles[0]["body"].startswith("paper3")
+
+    assert [row["subjects"] for row in rows] == [f"paper{i}" for i in range(7)]
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as f:
+        assert [row["pmcid"] for row in csv.DictReader(f)] == [str(p["pmcid"]) for p in papers]
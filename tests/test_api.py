@@ -0,0 +1,58 @@
+import pytest
+
+from utils.api_helper import MAX_RATE_LIMIT_RETRIES, chat_completion, chat_completion_async, run_coroutine
+from utils.ledger import RunLedger
+from utils.mock_openai import MockOpenAIServer
+from utils.rate_limiter import RateLimiter, retry_after_seconds
+
+openai = pytest.importorskip("openai")
+
+PAYLOAD = {"body": "Diffusion tensor imaging of the corpus callosum."}
+
+
+def clients(server):
+    # The SDK's own retries would hide the 429 handling under test
+    return (openai.OpenAI(base_url=server.base_url, api_key="test", max_retries=0),
+            openai.AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0))
+
+
+def test_retry_after_seconds_prefers_server_header():
+    assert retry_after_seconds({"retry-after-ms": "250"}, 3) == 0.25
+    assert retry_after_seconds({"retry-after": "2"}, 0) == 2
+    assert 0.5 <= retry_after_seconds(None, 0) <= 1.0
+
+
+def test_rate_limited_requests_are_retried():
+    with MockOpenAIServer(rate_limit_rate=0.5, retry_after_ms=1, seed=0) as server:
+        client, _ = clients(server)
+        limiter, ledger = RateLimiter(), RunLedger()
+        for _ in range(10):
+            assert chat_completion(client, "gpt-4o-mini", "system", PAYLOAD, rate_limiter=limiter, ledger=ledger)
+    assert server.rate_limited_count > 0
+    assert limiter.rate_limited == server.rate_limited_count
+    assert server.request_count == 10  # answered requests; the 429s are counted apart
+    assert ledger.calls == 10
+    assert ledger.reserved_tokens == 0 and ledger.reserved_cost == 0
+
+
+def test_rate_limit_retries_are_bounded_and_release_the_reservation():
+    with MockOpenAIServer(rate_limit_rate=1.0, retry_after_ms=1, seed=0) as server:
+        client, _ = clients(server)
+        limiter, ledger = RateLimiter(), RunLedger()
+        with pytest.raises(openai.RateLimitError):
+            chat_completion(client, "gpt-4o-mini", "system", PAYLOAD, rate_limiter=limiter, ledger=ledger)
+    assert server.rate_limited_count == MAX_RATE_LIMIT_RETRIES + 1
+    assert limiter.rate_limited == MAX_RATE_LIMIT_RETRIES
+    assert ledger.calls == 0
+    assert ledger.reserved_tokens == 0 and ledger.reserved_cost == 0
+
+
+def test_failed_async_call_releases_the_reservation():
+    with MockOpenAIServer(rate_limit_rate=1.0, seed=0) as server:
+        _, async_client = clients(server)
+        ledger = RunLedger()
+        with pytest.raises(openai.RateLimitError):
+            # Without a limiter the 429 is not retried
+            run_coroutine(chat_completion_async(async_client, "gpt-4o-mini", "system", PAYLOAD, ledger=ledger))
+    assert server.rate_limited_count == 1
+    assert ledger.reserved_tokens == 0 and ledger.reserved_cost == 0
@@ -0,0 +1,56 @@
+import csv
+import json
+import os
+
+import pytest
+
+import main
+from tests.conftest import make_papers
+from utils import batch
+from utils.batch import (iter_batch_output, make_custom_id, parse_custom_id, submit_batch, wait_for_batch,
+                         write_batch_files)
+
+BODY = "## Methods\nmethods text\n## Results\nresults text"
+
+
+@pytest.mark.parametrize("pmcid, chunk_index", [("PMC123", 0), ("PMC-12-3", 4), (1000, 12)])
+def test_custom_id_round_trip(pmcid, chunk_index):
+    assert parse_custom_id(make_custom_id(pmcid, chunk_index)) == (str(pmcid), chunk_index)
+
+
+def test_write_batch_files_splits_by_request_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "MAX_REQUESTS_PER_BATCH", 2)
+    requests = [(make_custom_id("PMC1", i), {"body": f"chunk {i}"}) for i in range(5)]
+    paths = write_batch_files(requests, str(tmp_path / "batches" / "run"), "gpt-4o-mini", "prompt",
+                              response_format={"type": "json_object"})
+    assert [os.path.basename(path) for path in paths] == ["run_0.jsonl", "run_1.jsonl", "run_2.jsonl"]
+    with open(paths[0], encoding="utf-8") as f:
+        line = json.loads(f.readline())
+    assert line["custom_id"] == "PMC1-0" and line["url"] == batch.BATCH_ENDPOINT
+    assert line["body"]["response_format"] == {"type": "json_object"}
+    assert json.loads(line["body"]["messages"][1]["content"]) == {"body": "chunk 0"}
+
+
+def test_batch_output_maps_back_to_pmcid_and_chunk(mock_api, tmp_path):
+    papers = [dict(paper, pmcid=f"PMC-{i}") for i, paper in enumerate(make_papers(3, body=BODY))]
+    chunks = {(paper["pmcid"], k): chunk for paper in papers
+              for k, chunk in enumerate(main.build_chunks(paper, 2, max_chunk_tokens=0))}
+    paths = write_batch_files(((make_custom_id(*key), {"body": chunk}) for key, chunk in chunks.items()),
+                              str(tmp_path / "run"), "gpt-4o-mini", "prompt")
+    done = wait_for_batch(main.client, submit_batch(main.client, paths[0]).id, poll_interval=0)
+    output = {parse_custom_id(custom_id): content for custom_id, content in iter_batch_output(main.client, done)}
+    assert set(output) == set(chunks)
+    for key, content in output.items():
+        assert json.loads(content)["subjects"] == [chunks[key].split()[0]]
+
+
+def test_extract_all_batch(mock_api, tmp_path):
+    papers = make_papers(3, body=BODY)
+    out = str(tmp_path / "out.csv")
+    rows = main.extract_all_batch(papers, out_csv=out, processing_mode=2, max_chunk_tokens=0,
+                                  batch_dir=str(tmp_path / "batches"), poll_interval=0, batch_client=main.client)
+    with open(out, newline="", encoding="utf-8") as f:
+        assert [row["pmcid"] for row in csv.DictReader(f)] == [str(paper["pmcid"]) for paper in papers]
+    assert [sorted(row["subjects"].split(";")) for row in rows] == [sorted([paper["title"], "Methods", "Results"])
+                                                                    for paper in papers]
+    assert mock_api.request_count == 9
@@ -0,0 +1,38 @@
+from prompts.brain_extraction import EXTRACTION_FIELDS
+from utils.chunk_scheduler import DEFAULT_MIN_FIELDS, ChunkScheduler
+
+
+def filled(n, fields=EXTRACTION_FIELDS):
+    return {field: ["x"] if i < n else [] for i, field in enumerate(fields)}
+
+
+def test_default_saturation_does_not_need_every_field():
+    scheduler = ChunkScheduler()
+    assert not scheduler.saturated(filled(DEFAULT_MIN_FIELDS - 1))
+    assert scheduler.saturated(filled(DEFAULT_MIN_FIELDS))
+
+
+def test_saturation_over_reduced_fields_and_all_fields():
+    assert ChunkScheduler().saturated(filled(2, ["subjects", "study_type"]))
+    assert not ChunkScheduler().saturated(filled(1, ["subjects", "study_type"]))
+    assert not ChunkScheduler(min_fields=None).saturated(filled(len(EXTRACTION_FIELDS) - 1))
+
+
+def test_custom_rule():
+    scheduler = ChunkScheduler(rule=lambda data: bool(data["subjects"]))
+    assert scheduler.saturated(filled(1))
+
+
+def test_rank_prefers_methods_over_introduction():
+    sections = ["Introduction\nBackground on the brain.", "Discussion\nWe discuss.",
+                "MRI acquisition\nDTI data with FA and MD maps were acquired."]
+    assert ChunkScheduler().rank(sections)[0].startswith("MRI acquisition")
+
+
+def test_waves_and_stats():
+    scheduler = ChunkScheduler(wave_size=2)
+    assert scheduler.waves(5) == [[0, 1], [2, 3], [4]]
+    scheduler.record(5, 2)
+    scheduler.record(3, 3)
+    stats = scheduler.stats()
+    assert (stats["chunks_sent"], stats["chunks_skipped"], stats["stopped_early"]) == (5, 3, 1)
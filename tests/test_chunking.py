@@ -0,0 +1,55 @@
+from utils.chunking import pack_sections, split_oversized, split_sections
+from utils.tokens import count_tokens
+
+
+def sentences(n, prefix="Sentence"):
+    return " ".join(f"{prefix} number {i} describes the diffusion tensor imaging protocol." for i in range(n))
+
+
+def test_split_sections_keeps_subsections_with_their_section():
+    body = "## Introduction\nintro\n## Methods\nmethods\n### MRI\nscanner\n## Results\nresults"
+    assert split_sections(body) == ["Introduction\nintro", "Methods\nmethods # MRI\nscanner", "Results\nresults"]
+
+
+def test_split_sections_empty():
+    assert split_sections("") == []
+
+
+def test_pack_sections_packs_adjacent_sections_in_order():
+    sections = [sentences(2, f"S{i}") for i in range(6)]
+    budget = count_tokens(sections[0]) * 2 + 5
+    chunks = pack_sections(sections, budget)
+    assert len(chunks) == 3
+    assert "\n\n".join(chunks) == "\n\n".join(sections)
+    assert all(count_tokens(chunk) <= budget for chunk in chunks)
+
+
+def test_pack_sections_splits_oversized_section():
+    small, big = "Short section.", sentences(40)
+    chunks = pack_sections([small, big, small], 60)
+    assert chunks[0] == small and chunks[-1] == small
+    assert len(chunks) > 3
+    assert all(count_tokens(chunk) <= 60 for chunk in chunks)
+
+
+def test_split_oversized_respects_budget_and_keeps_text():
+    section = sentences(30)
+    pieces = split_oversized(section, 50)
+    assert all(count_tokens(piece) <= 50 for piece in pieces)
+    assert " ".join(" ".join(pieces).split()) == " ".join(section.split())
+
+
+def test_split_oversized_overlap_repeats_last_sentences():
+    section = sentences(30)
+    pieces = split_oversized(section, 60, overlap_tokens=20)
+    assert len(pieces) > 1
+    for previous, piece in zip(pieces, pieces[1:]):
+        assert piece.split("\n")[0] in previous.split("\n")
+        assert count_tokens(piece) <= 60
+
+
+def test_split_oversized_single_long_sentence_split_on_words():
+    section = " ".join(f"word{i}" for i in range(400))
+    pieces = split_oversized(section, 50)
+    assert len(pieces) > 1
+    assert " ".join(pieces).split() == section.split()
@@ -0,0 +1,68 @@
+import subprocess
+import sys
+
+import pytest
+
+from tests.conftest import make_papers
+
+pytest.importorskip("pyarrow")
+from utils.columnar import ParquetResultWriter, read_results  # noqa: E402
+
+
+def write(path, pmcids, prefix="part", resume=False, row_group_size=2):
+    writer = ParquetResultWriter(str(path), row_group_size=row_group_size, resume=resume, prefix=prefix)
+    for i, pmcid in enumerate(pmcids):
+        writer.append(i, {"pmcid": pmcid, "title": f"t{pmcid}"}, {"subjects": [f"s{pmcid}"]})
+    writer.close()
+    return writer
+
+
+def test_writer_writes_one_part_file_per_row_group(tmp_path):
+    writer = write(tmp_path / "out.parquet", [10, 11, 12, 13, 14])
+    assert writer.rows_written == 5
+    assert len(writer.part_files()) == 3
+    table = read_results(str(tmp_path / "out.parquet"))
+    assert table.column("pmcid").to_pylist() == ["10", "11", "12", "13", "14"]
+    assert table.column("subjects").to_pylist()[0] == ["s10"]
+
+
+def test_rewrite_replaces_parts_but_resume_keeps_them(tmp_path):
+    path = tmp_path / "out.parquet"
+    write(path, [1, 2, 3])
+    assert write(path, [4], resume=True).completed_pmcids() == {"1", "2", "3", "4"}
+    assert write(path, [5]).completed_pmcids() == {"5"}
+
+
+def test_shard_prefixes_do_not_remove_each_other(tmp_path):
+    path = tmp_path / "out.parquet"
+    write(path, [1, 2], prefix="shard-0-of-2")
+    shard = write(path, [3], prefix="shard-1-of-2")
+    assert shard.completed_pmcids() == {"3"}
+    assert sorted(read_results(str(path)).column("pmcid").to_pylist()) == ["1", "2", "3"]
+
+
+def test_main_does_not_load_pyarrow():
+    code = "import sys, main; assert 'pyarrow' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_resume_with_parquet_needs_a_journal(tmp_path):
+    import main
+
+    with pytest.raises(ValueError, match="journal_path"):
+        main.extract_all(make_papers(1), out_csv=str(tmp_path / "out.csv"), out_parquet=str(tmp_path / "out.parquet"),
+                         resume=True)
+
+
+def test_resume_writes_each_paper_once(mock_api, tmp_path):
+    import main
+
+    papers = make_papers(6)
+    paths = dict(out_csv=str(tmp_path / "out.csv"), journal_path=str(tmp_path / "journal.jsonl"),
+                 out_parquet=str(tmp_path / "out.parquet"))
+    main.extract_all(papers[:4], processing_mode=3, **paths)
+    main.extract_all(papers, processing_mode=3, resume=True, **paths)
+
+    assert mock_api.request_count == 6
+    pmcids = read_results(paths["out_parquet"]).column("pmcid").to_pylist()
+    assert sorted(pmcids) == sorted(str(p["pmcid"]) for p in papers)
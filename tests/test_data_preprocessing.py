@@ -0,0 +1,51 @@
+import json
+import math
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from utils import data_preprocessing  # noqa: E402
+from utils.paper_store import PaperStore  # noqa: E402
+
+TEXT_ROWS = [
+    {"pmcid": 30, "title": "Tracts/MRI", "keywords": "DTI", "abstract": "Fibres – café", "body": "## Methods\na/b"},
+    {"pmcid": 10, "title": "First", "keywords": None, "abstract": "FA decreased", "body": "## Results\nx"},
+    {"pmcid": 99, "title": "Not selected", "keywords": "", "abstract": "", "body": ""},
+    {"pmcid": 20, "title": "Second", "keywords": "fMRI", "abstract": None, "body": "text"},
+]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    for folder in ("raw", "processed"):
+        (tmp_path / folder).mkdir()
+    monkeypatch.setattr(data_preprocessing, "get_file_path",
+                        lambda file_name, folder="raw": str(tmp_path / folder / file_name))
+    pd.DataFrame({"PMCID": ["PMC10", "PMC30", "PMC20"]}).to_csv(tmp_path / "raw" / "WM_data.csv", index=False)
+    pd.DataFrame(TEXT_ROWS).to_csv(tmp_path / "raw" / "text.csv", index=False)
+    return tmp_path
+
+
+def expected_papers():
+    """The corpus as the original script built it: WM_data.csv order, NaN for missing text."""
+    rows = {row["pmcid"]: row for row in TEXT_ROWS}
+    return [{"pmcid": pmcid, **{column: rows[pmcid][column] if rows[pmcid][column] is not None else float("nan")
+                                for column in ("title", "keywords", "abstract", "body")}}
+            for pmcid in (10, 30, 20)]
+
+
+def test_json_output_matches_json_dump(data_dir):
+    data_preprocessing.process_data(output="corpus.json")
+    written = (data_dir / "processed" / "corpus.json").read_text(encoding="utf-8")
+    assert written == json.dumps(expected_papers(), indent=4, ensure_ascii=False)
+    assert "a/b" in written and "café" in written
+
+
+def test_jsonl_store(data_dir):
+    data_preprocessing.process_data(output="corpus.jsonl", store_format="jsonl")
+    with PaperStore(str(data_dir / "processed" / "corpus.jsonl")) as store:
+        papers = list(store)
+        assert store.get(20)["title"] == "Second"
+    assert [paper["pmcid"] for paper in papers] == [10, 30, 20]
+    assert math.isnan(papers[2]["abstract"]) and papers[1]["body"] == "## Methods\na/b"
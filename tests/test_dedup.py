@@ -0,0 +1,82 @@
+import pickle
+import random
+
+import pytest
+
+from utils.dedup import ChunkDeduplicator, lsh_bands
+
+RESULT = {"imaging_modalities": ["DTI"], "diffusion_measures": ["FA"]}
+WORDS = ["diffusion", "tensor", "images", "were", "acquired", "on", "a", "3T", "scanner", "with", "gradient",
+         "directions", "b", "value", "motion", "eddy", "current", "correction", "FSL", "tract", "based"]
+
+
+def text(seed, n=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 50)) for _ in range(n))
+
+
+def edited(original, n_edits, seed=0):
+    """``original`` with ``n_edits`` words replaced."""
+    rng = random.Random(seed)
+    words = original.split()
+    for i in rng.sample(range(len(words)), n_edits):
+        words[i] = "edited"
+    return " ".join(words)
+
+
+@pytest.fixture
+def dedup(tmp_path):
+    dedup = ChunkDeduplicator(str(tmp_path / "minhash.sqlite"), threshold=0.8)
+    yield dedup
+    dedup.close()
+
+
+@pytest.mark.parametrize("num_perm, threshold", [(128, 0.8), (128, 0.9), (64, 0.5)])
+def test_lsh_bands(num_perm, threshold):
+    bands, rows = lsh_bands(num_perm, threshold)
+    assert bands * rows == num_perm
+    assert (1 / bands) ** (1 / rows) <= threshold
+
+
+def test_similarity_estimate():
+    dedup = ChunkDeduplicator(":memory:")
+    a = dedup.signature(text(1))
+    assert dedup.similarity(a, a) == 1.0
+    assert dedup.similarity(a, dedup.signature(text(2))) < 0.2
+
+
+def test_near_duplicate_reuses_result(dedup):
+    scope = dedup.scope("gpt-4o-mini", "prompt")
+    original = text(1)
+    dedup.add(dedup.signature(original), scope, RESULT)
+    assert dedup.find(dedup.signature(edited(original, 3)), scope, tokens=500) == RESULT
+    assert dedup.find(dedup.signature(text(2)), scope) is None
+    stats = dedup.stats()
+    assert (stats["lookups"], stats["hits"], stats["tokens_saved"], stats["entries"]) == (2, 1, 500, 1)
+
+
+def test_results_are_scoped(dedup):
+    original = text(1)
+    dedup.add(dedup.signature(original), dedup.scope("gpt-4o-mini", "prompt"), RESULT)
+    assert dedup.find(dedup.signature(original), dedup.scope("gpt-4o-mini", "other prompt")) is None
+    assert dedup.find(dedup.signature(original), dedup.scope("gpt-4o", "prompt")) is None
+
+
+def test_short_chunks_are_never_matched(dedup):
+    scope = dedup.scope("gpt-4o-mini", "prompt")
+    assert dedup.signature("a short methods paragraph") is None
+    dedup.add(None, scope, RESULT)
+    assert dedup.find(None, scope) is None
+    assert dedup.stats()["too_short"] == 1 and dedup.stats()["entries"] == 0
+
+
+def test_index_persists_and_pickles(tmp_path):
+    path = str(tmp_path / "minhash.sqlite")
+    dedup = ChunkDeduplicator(path, threshold=0.8)
+    scope = dedup.scope("gpt-4o-mini", "prompt")
+    dedup.add(dedup.signature(text(1)), scope, RESULT)
+    copy = pickle.loads(pickle.dumps(dedup))
+    dedup.close()
+    assert copy.find(copy.signature(text(1)), scope) == RESULT
+    assert (copy.threshold, copy.lookups) == (0.8, 1)
+    copy.close()
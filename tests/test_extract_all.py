@@ -0,0 +1,36 @@
+import csv
+
+import main
+from tests.conftest import make_papers
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_rows_in_input_order_under_concurrency(mock_api, tmp_path):
+    papers = make_papers(30)
+    out = str(tmp_path / "out.csv")
+    rows = main.extract_all(papers, out_csv=out, processing_mode=3, max_concurrency=8)
+    expected = [(str(paper["pmcid"]), paper["title"]) for paper in papers]
+    assert [(str(row["pmcid"]), row["subjects"]) for row in rows] == expected
+    assert [(row["pmcid"], row["subjects"]) for row in read_csv(out)] == expected
+    assert mock_api.request_count == 30
+
+
+def test_chunks_of_a_paper_are_merged(mock_api, tmp_path):
+    papers = make_papers(3, body="## Methods\nmethods text\n## Results\nresults text")
+    rows = main.extract_all(papers, out_csv=str(tmp_path / "out.csv"), processing_mode=2, max_chunk_tokens=0,
+                            max_concurrency=4)
+    assert [sorted(row["subjects"].split(";")) for row in rows] == [sorted([p["title"], "Methods", "Results"])
+                                                                    for p in papers]
+    assert mock_api.request_count == 9
+
+
+def test_extract_chunk_defaults_to_the_shared_limiter(mock_api):
+    mock_api.rate_limit_rate = 0.5
+    results = [main.extract_chunk({"body": f"chunk{i} text"}) for i in range(6)]
+    assert [data["subjects"] for data in results] == [[f"chunk{i}"] for i in range(6)]
+    assert mock_api.rate_limited_count > 0
+    assert main.rate_limiter.rate_limited == mock_api.rate_limited_count
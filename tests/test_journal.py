@@ -0,0 +1,79 @@
+import csv
+
+from utils.journal import RunJournal, _drop_partial_line, compact_journal, iter_journal
+
+FIELDS = ["pmcid", "title"]
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_drop_partial_line(tmp_path):
+    path = tmp_path / "run.jsonl"
+    path.write_bytes(b'{"a": 1}\n{"b": ')
+    _drop_partial_line(str(path))
+    assert path.read_bytes() == b'{"a": 1}\n'
+    _drop_partial_line(str(path))
+    assert path.read_bytes() == b'{"a": 1}\n'
+
+
+def test_resume_drops_partial_record_and_appends(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    journal.append(0, {"pmcid": 1, "title": "a"})
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "row": {"pmc')
+    journal = RunJournal(path, resume=True)
+    assert journal.completed_pmcids() == {"1"}
+    journal.append(1, {"pmcid": 2, "title": "b"})
+    journal.close()
+    assert [record["row"]["pmcid"] for _, record in iter_journal(path)] == [1, 2]
+
+
+def test_new_journal_starts_over(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    journal.append(0, {"pmcid": 1, "title": "a"})
+    journal.close()
+    journal = RunJournal(path)
+    assert journal.completed_pmcids() == set()
+    journal.close()
+
+
+def test_iter_journal_from_offset(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    for i in range(3):
+        journal.append(i, {"pmcid": i, "title": str(i)})
+    journal.close()
+    records = list(iter_journal(path))
+    offset = records[1][0]
+    assert [record["index"] for _, record in iter_journal(path, offset)] == [1, 2]
+
+
+def test_compact_journal_input_order_last_record_wins(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = RunJournal(path)
+    journal.append(2, {"pmcid": 30, "title": "c"})
+    journal.append(0, {"pmcid": 10, "title": "a"})
+    journal.append(1, {"pmcid": 20, "title": "old"})
+    journal.append(1, {"pmcid": 20, "title": "new"})
+    journal.close()
+    out = str(tmp_path / "out.csv")
+    assert compact_journal(path, out, FIELDS) == 3
+    assert [(row["pmcid"], row["title"]) for row in read_csv(out)] == [("10", "a"), ("20", "new"), ("30", "c")]
+
+
+def test_compact_journal_merges_shards(tmp_path):
+    shards = [str(tmp_path / f"shard{i}.jsonl") for i in range(2)]
+    for shard, indices in zip(shards, [(0, 2), (1, 3)]):
+        journal = RunJournal(shard)
+        for i in indices:
+            journal.append(i, {"pmcid": i, "title": shard})
+        journal.close()
+    out = str(tmp_path / "out.csv")
+    assert compact_journal(shards + [str(tmp_path / "missing.jsonl")], out, FIELDS) == 4
+    assert [row["pmcid"] for row in read_csv(out)] == ["0", "1", "2", "3"]
@@ -0,0 +1,46 @@
+import pytest
+
+from utils.ledger import BudgetExceeded, RunLedger, request_cost
+
+USAGE = {"prompt_tokens": 1000, "completion_tokens": 100, "cached_tokens": 0}
+
+
+def test_request_cost_cached_tokens_and_snapshots():
+    assert request_cost("gpt-4o-mini", 1_000_000, 0) == pytest.approx(0.15)
+    assert request_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0, cached_tokens=1_000_000) == pytest.approx(0.075)
+
+
+def test_record_rollups_and_packed_share():
+    ledger = RunLedger()
+    ledger.record("gpt-4o-mini", [1, 2], None, USAGE, 1.0)
+    ledger.record("gpt-4o-mini", 1, 0, USAGE, 0.0, cache_hit=True)
+    assert ledger.calls == 1 and ledger.cache_hits == 1
+    assert ledger.paper_stats(1)["prompt_tokens"] == 500
+    assert ledger.total_tokens == 1100
+
+
+def test_admit_counts_requests_in_flight():
+    ledger = RunLedger(max_tokens=3000)
+    first = ledger.admit("gpt-4o-mini", 1000, 400)
+    ledger.admit("gpt-4o-mini", 1000, 400)
+    # 2800 tokens in flight: a third request would pass the budget before any is recorded
+    with pytest.raises(BudgetExceeded):
+        ledger.admit("gpt-4o-mini", 1000, 400)
+    ledger.release(first)
+    ledger.admit("gpt-4o-mini", 1000, 400)
+
+
+def test_admit_cost_budget():
+    ledger = RunLedger(max_cost=request_cost("gpt-4o-mini", 1000, 400) * 1.5)
+    reservation = ledger.admit("gpt-4o-mini", 1000, 400)
+    with pytest.raises(BudgetExceeded):
+        ledger.admit("gpt-4o-mini", 1000, 400)
+    ledger.record("gpt-4o-mini", 1, 0, USAGE, 1.0)
+    ledger.release(reservation)
+    assert ledger.reserved_tokens == 0 and ledger.reserved_cost == pytest.approx(0)
+
+
+def test_no_budget_never_raises():
+    ledger = RunLedger()
+    for _ in range(100):
+        ledger.admit("gpt-4o", 100_000, 400)
@@ -0,0 +1,38 @@
+import pytest
+
+from utils.paper_store import PaperStore, write_paper_store, write_store_index
+
+PAPERS = [{"pmcid": f"PMC{i}", "title": f"Paper {i} – diffusion", "body": "x" * (i * 37)} for i in range(10)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "papers.jsonl")
+    assert write_paper_store(iter(PAPERS), path) == len(PAPERS)
+    with PaperStore(path) as store:
+        yield store
+
+
+def test_iterates_in_store_order(store):
+    assert list(store) == PAPERS
+    assert store.pmcids() == [paper["pmcid"] for paper in PAPERS]
+    assert len(store) == len(PAPERS) and "PMC3" in store and "PMC99" not in store
+
+
+def test_get_by_pmcid(store):
+    for paper in reversed(PAPERS):
+        assert store.get(paper["pmcid"]) == paper
+    assert store.get("PMC99") is None
+
+
+@pytest.mark.parametrize("start, end", [(0, None), (3, 7), (9, None), (8, 20), (5, 5), (-2, None)])
+def test_iter_range_matches_slicing(store, start, end):
+    assert list(store.iter_range(start, end)) == PAPERS[start:end]
+
+
+def test_index_of_a_store_written_elsewhere(tmp_path):
+    path = str(tmp_path / "papers.jsonl")
+    write_paper_store(PAPERS, path)
+    assert write_store_index(path, [paper["pmcid"] for paper in PAPERS]) == len(PAPERS)
+    with PaperStore(path) as store:
+        assert store.get("PMC7") == PAPERS[7]
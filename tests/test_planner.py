@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+from utils.chunking import build_chunks
+from utils.planner import plan_corpus
+from utils.prefilter import ChunkFilter
+
+BODY = ("## Methods\nDiffusion tensor imaging of the corpus callosum in patients.\n"
+        "## Acknowledgments\nWe thank the funding agencies.\n"
+        "## References\n1. Smith J. Neuroimage. 2010.")
+
+
+def make_papers(n):
+    return [{"pmcid": 2000 + i, "title": f"paper{i}", "abstract": "A DTI study.", "keywords": "DTI", "body": BODY}
+            for i in range(n)]
+
+
+def test_planner_does_not_import_main():
+    code = "import sys, utils.planner; assert 'main' not in sys.modules and 'pyarrow' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_chunk_filter_counts_each_paper_once():
+    chunk_filter = ChunkFilter()
+    plan = plan_corpus(make_papers(3), modes=(1, 2, 3), max_chunk_tokens=0, chunk_filter=chunk_filter)
+
+    assert chunk_filter.stats()["papers"] == 3
+    assert chunk_filter.stats()["sections_seen"] == 3 * 3
+    assert chunk_filter.stats()["sections_dropped"] == 3 * 2
+    # Mode 2 sends the metadata chunk and the one kept section per paper
+    assert plan["modes"][2]["requests"] == 3 * 2
+    assert plan["modes"][3]["requests"] == 3
+
+
+def test_build_chunks_with_presplit_sections_matches_chunk_filter():
+    paper = make_papers(1)[0]
+    for mode in (1, 2):
+        filtered = build_chunks(paper, mode, 0, chunk_filter=ChunkFilter())
+        assert build_chunks(paper, mode, 0, sections=["Methods\nDiffusion tensor imaging of the corpus callosum "
+                                                       "in patients."]) == filtered
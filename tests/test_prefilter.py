@@ -0,0 +1,45 @@
+import re
+
+import pytest
+
+from utils.prefilter import ChunkFilter, alternation
+from utils.tokens import count_tokens
+
+METHODS = "Methods\nDiffusion tensor imaging was processed with FSL and TBSS."
+RESULTS = "Results\nFA was lower in the corpus callosum of patients."
+HISTORY = "Historical note\nThe study started in a small town in winter."
+
+
+@pytest.mark.parametrize("heading", ["References", "2. Funding", "IV. Conflicts of interest:",
+                                     "ACKNOWLEDGEMENTS", "Data availability statement"])
+def test_skip_headings(heading):
+    assert ChunkFilter().skip_reason(f"{heading}\nFSL DTI MRI") == "heading"
+
+
+def test_vocabulary_scan():
+    chunk_filter = ChunkFilter()
+    assert chunk_filter.skip_reason(METHODS) == ""
+    assert chunk_filter.skip_reason(HISTORY) == "vocabulary"
+    # Abbreviations are case-sensitive: "ad" and "md" are not diffusion measures
+    assert chunk_filter.skip_reason("Note\nad hoc md5 checks") == "vocabulary"
+    assert ChunkFilter(min_hits=3).skip_reason(RESULTS) == ""  # FA, corpus callosum, patients
+    assert ChunkFilter(min_hits=4).skip_reason(RESULTS) == "vocabulary"
+    assert ChunkFilter(min_hits=0).skip_reason(HISTORY) == ""
+
+
+def test_filter_sections_keeps_order_and_counts_drops():
+    chunk_filter = ChunkFilter()
+    references = "References\n1. Smith J. DTI of the brain. 2010."
+    sections = [METHODS, HISTORY, RESULTS, references]
+    assert chunk_filter.filter_sections(sections, pmcid=123) == [METHODS, RESULTS]
+    assert chunk_filter.paper_stats("123") == (4, 2, count_tokens(HISTORY) + count_tokens(references))
+    chunk_filter.filter_sections([METHODS], pmcid=456)
+    assert chunk_filter.stats() == {"papers": 2, "sections_seen": 5, "sections_dropped": 2,
+                                    "tokens_saved": count_tokens(HISTORY) + count_tokens(references)}
+    assert chunk_filter.paper_stats("missing") == (0, 0, 0)
+
+
+def test_alternation_prefers_the_longest_term():
+    pattern = alternation(["DTI", "diffusion", "diffusion tensor imaging", "C++", "DTI"])
+    assert pattern == alternation(["C++", "diffusion tensor imaging", "DTI", "diffusion"])
+    assert re.findall(pattern, "diffusion tensor imaging in C++") == ["diffusion tensor imaging", "C++"]
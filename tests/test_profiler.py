@@ -0,0 +1,42 @@
+import threading
+import time
+
+from utils.profiler import SamplingProfiler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def test_profiler_attributes_samples_to_the_running_function(tmp_path):
+    with SamplingProfiler(interval=0.001) as profiler:
+        busy_loop(0.2)
+    assert profiler.samples > 10
+    stats = profiler.stats()
+    assert stats["samples"] == profiler.samples and stats["duration"] >= 0.2
+    busy = [label for label in profiler.total_counts if label.startswith("busy_loop (tests/test_profiler.py:")]
+    assert busy and profiler.total_counts[busy[0]] >= profiler.samples * 0.5
+    assert profiler.top_functions(1)[0][1] <= profiler.samples
+
+    report = profiler.report(top=5, paths=3)
+    assert report.startswith(f"{profiler.samples} samples over")
+    assert "Hot paths (innermost frames):" in report
+    assert busy[0] in report
+
+    path = tmp_path / "run.folded"
+    profiler.write_folded(str(path))
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profiler.samples
+    assert any(busy[0] in line.rsplit(" ", 1)[0].split(";") for line in lines)
+
+
+def test_all_threads_roots_stacks_at_the_thread_name():
+    worker = threading.Thread(target=busy_loop, args=(0.2,), name="worker")
+    with SamplingProfiler(interval=0.001, all_threads=True) as profiler:
+        worker.start()
+        worker.join()
+    assert any(stack[0] == "thread worker" for stack in profiler.stacks)
@@ -0,0 +1,75 @@
+from prompts.brain_extraction import (EXTRACTION_FIELDS, FIELD_PROMPTS, RULE_ORDER, SYSTEM_PROMPT,
+                                      build_system_prompt, field_fingerprint)
+
+# The hand-written prompt the per-field blocks were split from; results extracted with it
+# stay comparable only while the assembled prompt is byte-identical
+ORIGINAL_SYSTEM_PROMPT = (
+    'You are an information extraction expert for brain imaging papers.\n'
+    '\n'
+    'Task: Given a JSON object that contain the paper details like title, abstract, and body, extract and return a JSON object with these fields:\n'
+    '\n'
+    '- imaging_modalities: e.g ["Anatomical MRI","fMRI","DTI","PET","CT","SPECT","MEG","EEG"]\n'
+    '- patient_groups: e.g ["Alzheimer\'s disease","Bipolar","Healthy controls"]\n'
+    '- whitematter_tracts: e.g ["Corpus Callosum","Cingulum","Uncinate Fasciculus","Superior Longitudinal Fasciculus"]\n'
+    '- subjects: e.g ["humans","mice","rats","monkeys"]  \n'
+    '- analysis_software: e.g ["DIPY","FSL","FreeSurfer","SPM"]\n'
+    '- study_type: e.g ["review", "single study"]\n'
+    '- diffusion_measures: e.g ["FA","MD","AD","RD","MK", "NDI","ODI"]    \n'
+    '- template_space: e.g ["Talairach","MNI"]\n'
+    '- results_method: e.g ["t-test","ANOVA","MANOVA","beta effect size","correlation", "regression"]\n'
+    '- white_integrity: e.g ["decrease", "increase","no mention"]\n'
+    '- question_of_study: e.g ["bipolar patients vs controls", "Alzheimer\'s patients vs controls"]\n'
+    '\n'
+    'Rules:\n'
+    '- Return values mentioned in the text that clearly belong to each category\n'
+    '- For white matter tracts, only return names of specific white matter tracts, not general brain regions\n'
+    '- Imaging modalities should be only brain imaging modalities related to structural and functional brain imaging\n'
+    "- Patient groups should be conditions or diseases affecting humans e.g Alzheimer's disease, Bipolar disorder, Healthy controls\n"
+    '- Subjects should be the species/organisms studied, e.g humans, mice, rats, monkeys\n'
+    '- Analysis software: Extract the specialized neuroimaging analysis software or toolboxes that were used for the neuroimaging analysis, e.g (FSL, FreeSurfer, SPM, AFNI, DIPY).Do NOT include \n'
+    '  statistical analysis software like SPSS, R, SPSS, STATA, etc. Only comprehensive software library specifically for analyzing and processing neuroimaging data, such as fMRI, sMRI, and diffusion MRI.\n'
+    '- Study type: "single study" for original research, "review" for review studies or meta-analysis\n'
+    '- Template space should be the template space used for the analysis, e.g Talairach, MNI\n'
+    '- Results method should be the statistical method used for the analysis\n'
+    '- White matter integrity should be the mention of white matter integrity changes in the text\n'
+    '- Question of study should be the experimental conditions or comparisons the researchers used\n'
+    '- The lists given above are examples, not exhaustive\n'
+    '- If none apply, return an empty list for that field\n'
+    '- Output must be valid JSON only\n'
+    '\n'
+    'Example output format:\n'
+    '{\n'
+    '  "imaging_modalities": ["fMRI", "DTI"],\n'
+    '  "patient_groups": ["Alzheimer\'s disease", "Healthy controls"],\n'
+    '  "whitematter_tracts": ["Corpus Callosum"],\n'
+    '  "subjects": ["humans"],\n'
+    '  "analysis_software": ["FSL", "FreeSurfer", "SPM"],\n'
+    '  "study_type": ["single study"],\n'
+    '  "diffusion_measures": ["FA", "MD"],\n'
+    '  "template_space": ["MNI"],\n'
+    '  "results_method": ["t-test"],\n'
+    '  "white_integrity": ["decrease"],\n'
+    '  "question_of_study": ["Alzheimer\'s patients vs controls"]\n'
+    '}\n'
+)
+
+
+def test_system_prompt_is_unchanged():
+    assert SYSTEM_PROMPT == ORIGINAL_SYSTEM_PROMPT
+    assert build_system_prompt(EXTRACTION_FIELDS) == ORIGINAL_SYSTEM_PROMPT
+
+
+def test_every_field_has_a_prompt_block():
+    assert set(FIELD_PROMPTS) == set(EXTRACTION_FIELDS) == set(RULE_ORDER)
+
+
+def test_partial_prompt_keeps_only_selected_fields():
+    prompt = build_system_prompt(["subjects", "whitematter_tracts"])
+    assert '"subjects": ["humans"]' in prompt and '"whitematter_tracts": ["Corpus Callosum"]' in prompt
+    assert "imaging_modalities" not in prompt and "Template space" not in prompt
+    assert prompt.index("For white matter tracts") < prompt.index("Subjects should be")
+
+
+def test_field_fingerprint_is_per_field():
+    assert field_fingerprint("subjects") == field_fingerprint("subjects")
+    assert field_fingerprint("subjects") != field_fingerprint("patient_groups")
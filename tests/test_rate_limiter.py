@@ -0,0 +1,90 @@
+import pytest
+
+from utils.rate_limiter import RateLimiter, TokenBucket, parse_duration, retry_after_seconds
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20ms", 0.02),
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("1h2m3.5s", 3723.5),
+    ("2.5", 2.5),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", [None, "", "soon"])
+def test_parse_duration_invalid(value):
+    assert parse_duration(value) is None
+
+
+def test_retry_after_prefers_headers():
+    assert retry_after_seconds({"retry-after-ms": "250"}, attempt=3) == pytest.approx(0.25)
+    assert retry_after_seconds({"retry-after": "2s"}, attempt=3) == pytest.approx(2.0)
+
+
+def test_retry_after_backoff_without_headers():
+    for attempt in range(8):
+        delay = retry_after_seconds(None, attempt)
+        assert min(60.0, 2 ** attempt) / 2 <= delay <= min(60.0, 2 ** attempt)
+
+
+def test_token_bucket_refill_and_wait():
+    bucket = TokenBucket(60)
+    bucket.level = 0
+    bucket.updated = 100.0
+    bucket.refill(110.0)
+    assert bucket.level == pytest.approx(10)
+    assert bucket.wait_time(10) == 0.0
+    assert bucket.wait_time(20) == pytest.approx(10.0)
+    # Larger than the bucket: wait for a full bucket only
+    assert bucket.wait_time(1000) == pytest.approx(50.0)
+
+
+def test_reserve_takes_budget_then_delays():
+    limiter = RateLimiter(rpm=2, tpm=1000)
+    assert limiter._reserve(400) == 0.0
+    assert limiter._reserve(400) == 0.0
+    assert limiter.requests.level < 1
+    assert limiter._reserve(400) > 0
+
+
+def test_token_limit_delays_before_request_limit():
+    limiter = RateLimiter(rpm=100, tpm=1000)
+    assert limiter._reserve(900) == 0.0
+    assert limiter._reserve(900) > 0
+
+
+def test_update_from_headers():
+    limiter = RateLimiter(rpm=500, tpm=200_000)
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "5000", "x-ratelimit-remaining-requests": "10",
+                                 "x-ratelimit-limit-tokens": "bad"})
+    assert limiter.requests.capacity == 5000
+    assert limiter.requests.level == 10
+    assert limiter.tokens.capacity == 200_000
+
+
+def test_rate_limited_halves_scale_and_success_recovers():
+    limiter = RateLimiter(min_scale=0.2)
+    limiter.record_rate_limited(0.0)
+    limiter.record_rate_limited(0.0)
+    limiter.record_rate_limited(0.0)
+    assert limiter.scale == pytest.approx(0.2)
+    assert limiter.rate_limited == 3
+    limiter.record_success(100, 100)
+    assert limiter.scale == pytest.approx(0.25)
+
+
+def test_rate_limited_pauses_callers():
+    limiter = RateLimiter()
+    limiter.record_rate_limited(30.0)
+    assert limiter._reserve(1) > 29
+
+
+def test_record_success_settles_token_estimate():
+    limiter = RateLimiter(tpm=1000)
+    limiter._reserve(500)
+    level = limiter.tokens.level
+    limiter.record_success(500, 200)
+    assert limiter.tokens.level == pytest.approx(min(1000, level + 300))
@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+from prompts.brain_extraction import EXTRACTION_FIELDS
+from utils.journal import RunJournal
+from utils.result_index import And, Not, Or, ResultIndex, Term, bitmap_of, iter_bits, parse_query, popcount
+
+ROWS = [
+    {"pmcid": "1", "subjects": "humans", "imaging_modalities": "DTI;fMRI",
+     "whitematter_tracts": "Uncinate Fasciculus"},
+    {"pmcid": "2", "subjects": "mice", "imaging_modalities": "Diffusion Tensor Imaging", "whitematter_tracts": ""},
+    {"pmcid": "3", "subjects": "humans", "imaging_modalities": "PET", "whitematter_tracts": "Cingulum;uncinate  fasciculus"},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ResultIndex(str(tmp_path / "index.sqlite"))
+    index.add_rows(ROWS)
+    yield index
+    index.close()
+
+
+def test_bit_helpers():
+    assert popcount(0b10110) == 3
+    assert list(iter_bits(0b10110)) == [1, 2, 4]
+    assert bitmap_of([4, 1, 2, 2]) == 0b10110
+    assert bitmap_of([]) == 0
+    assert list(iter_bits(bitmap_of([1000, 3, 70]))) == [3, 70, 1000]
+
+
+def test_parse_query_precedence():
+    query = parse_query('NOT subjects:mice AND imaging_modalities:DTI OR whitematter_tracts:"Uncinate Fasciculus"')
+    assert isinstance(query, Or)
+    assert isinstance(query.queries[0], And) and isinstance(query.queries[0].queries[0], Not)
+    assert repr(query.queries[1]) == "Term('whitematter_tracts', 'Uncinate Fasciculus')"
+
+
+def test_parse_query_parentheses():
+    query = parse_query("subjects:humans AND (imaging_modalities:PET OR imaging_modalities:DTI)")
+    assert isinstance(query, And) and isinstance(query.queries[1], Or)
+
+
+@pytest.mark.parametrize("text", ["", "subjects", "subjects:humans AND", "(subjects:humans", "subjects:humans )"])
+def test_parse_query_errors(text):
+    with pytest.raises(ValueError):
+        parse_query(text)
+
+
+def test_values_are_normalized(index):
+    assert index.search("imaging_modalities:dti") == ["1", "2"]
+    assert index.search('whitematter_tracts:"uncinate fasciculus"') == ["1", "3"]
+    assert index.count("NOT subjects:humans") == 1
+    with pytest.raises(ValueError):
+        index.count("species:humans")
+
+
+def test_match_agrees_with_brute_force(tmp_path):
+    rng = random.Random(0)
+    values = ["a", "b", "c", "d"]
+    rows = [{"pmcid": str(i), "subjects": ";".join(rng.sample(values, rng.randint(0, 3))),
+             "study_type": rng.choice(["review", "single study"])} for i in range(200)]
+    index = ResultIndex(str(tmp_path / "index.sqlite"))
+    index.add_rows(rows)
+
+    def has(row, field, value):
+        return value in row[field].split(";")
+
+    cases = {
+        "subjects:a AND NOT subjects:b": lambda r: has(r, "subjects", "a") and not has(r, "subjects", "b"),
+        'subjects:c OR study_type:"single study"':
+            lambda r: has(r, "subjects", "c") or r["study_type"] == "single study",
+        "NOT (subjects:a OR subjects:d) AND study_type:review":
+            lambda r: not (has(r, "subjects", "a") or has(r, "subjects", "d")) and r["study_type"] == "review",
+    }
+    for text, predicate in cases.items():
+        assert index.search(text) == [r["pmcid"] for r in rows if predicate(r)]
+    assert index.count(Term("subjects", "a") & ~Term("subjects", "b")) == index.count("subjects:a AND NOT subjects:b")
+    index.close()
+
+
+def test_facets_and_cooccurrence(index):
+    assert index.facets("subjects") == [("humans", 2), ("mice", 1)]
+    assert index.facets("imaging_modalities", query="subjects:humans") == [("DTI", 1), ("PET", 1), ("fMRI", 1)]
+    assert index.cooccurrence("subjects", "imaging_modalities")["mice"] == {"DTI": 1}
+
+
+def test_unknown_facet_field(index):
+    with pytest.raises(ValueError, match="expected one of"):
+        index.facets("species")
+    with pytest.raises(ValueError, match="expected one of"):
+        index.cooccurrence("subjects", "species")
+
+
+def test_batched_add_rows_matches_adding_one_by_one(tmp_path):
+    rng = random.Random(1)
+    # pmcids repeat, within a batch and across batches, so rows re-index earlier papers
+    rows = [{"pmcid": str(rng.randrange(60)), "subjects": ";".join(rng.sample("abcde", rng.randint(0, 3)))}
+            for _ in range(200)]
+    batched = ResultIndex(str(tmp_path / "batched.sqlite"))
+    assert batched.add_rows(rows, batch_size=7) == 200
+    single = ResultIndex(str(tmp_path / "single.sqlite"))
+    for row in rows:
+        single.add(row["pmcid"], row)
+    assert batched.pmcids == single.pmcids
+    assert batched.postings == single.postings
+    assert batched.all_docs == single.all_docs
+    batched.close()
+    single.close()
+
+
+def test_readd_replaces_values_and_persists(index):
+    index.add("2", {"subjects": ["rats"]})
+    index.save()
+    reopened = ResultIndex(index.path)
+    assert reopened.search("subjects:mice") == []
+    assert reopened.search("subjects:rats") == ["2"]
+    assert reopened.stats()["papers"] == 3
+    reopened.close()
+
+
+def test_update_from_journal_is_incremental(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    index = ResultIndex(str(tmp_path / "index.sqlite"))
+    journal = RunJournal(path)
+    journal.append(0, ROWS[0])
+    journal.close()
+    assert index.update_from_journal(path) == 1
+    journal = RunJournal(path, resume=True)
+    journal.append(1, ROWS[1])
+    journal.close()
+    assert index.update_from_journal(path) == 1
+    assert index.search("imaging_modalities:DTI") == ["1", "2"]
+    index.close()
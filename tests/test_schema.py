@@ -0,0 +1,53 @@
+import json
+
+from utils.schema import OutputValidator, extraction_schema, packed_extraction_schema, validate_extraction
+
+FIELDS = ["subjects", "imaging_modalities"]
+
+
+def test_extraction_schema_requires_every_field():
+    schema = extraction_schema(FIELDS)
+    assert schema["required"] == FIELDS
+    assert schema["additionalProperties"] is False
+    assert schema["properties"]["subjects"] == {"type": "array", "items": {"type": "string"}}
+
+
+def test_packed_schema_adds_pmcid():
+    entry = packed_extraction_schema(FIELDS)["properties"]["results"]["items"]
+    assert entry["required"] == ["pmcid"] + FIELDS
+
+
+def test_validate_extraction():
+    assert validate_extraction({"subjects": ["humans"], "imaging_modalities": []}, FIELDS) is None
+    assert "missing" in validate_extraction({"subjects": []}, FIELDS)
+    assert "list of strings" in validate_extraction({"subjects": "humans", "imaging_modalities": []}, FIELDS)
+    assert "list of strings" in validate_extraction({"subjects": [1], "imaging_modalities": []}, FIELDS)
+    assert "JSON object" in validate_extraction([], FIELDS)
+
+
+def test_parse_valid():
+    validator = OutputValidator(FIELDS)
+    data = validator.parse(json.dumps({"subjects": ["humans"], "imaging_modalities": ["DTI"]}))
+    assert data == {"subjects": ["humans"], "imaging_modalities": ["DTI"]}
+    assert validator.stats()["malformed"] == 0
+
+
+def test_parse_counts_invalid_json_and_schema_errors():
+    validator = OutputValidator(FIELDS)
+    assert validator.parse("not json") is None
+    assert validator.parse(None) is None
+    assert validator.parse(json.dumps({"subjects": []})) is None
+    stats = validator.stats()
+    assert (stats["responses"], stats["invalid_json"], stats["schema_errors"], stats["malformed"]) == (3, 2, 1, 3)
+
+
+def test_parse_reduced_fields():
+    validator = OutputValidator(FIELDS)
+    assert validator.parse(json.dumps({"subjects": ["mice"]}), fields=["subjects"]) == {"subjects": ["mice"]}
+
+
+def test_response_format():
+    validator = OutputValidator(FIELDS)
+    assert validator.response_format["json_schema"]["strict"] is True
+    assert validator.response_format_for(["subjects"])["json_schema"]["schema"]["required"] == ["subjects"]
+    assert OutputValidator(FIELDS, use_schema=False).response_format is None
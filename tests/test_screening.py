@@ -0,0 +1,70 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+from utils.screening import RelevanceScreen  # noqa: E402
+
+TERMS = ["white matter", "tractography", "fractional anisotropy", "cortex", "memory"]
+QUERY = "white matter tractography fractional anisotropy"
+
+
+class StubVectorizer:
+    """Counts of a few fixed terms, standing in for the NeuroQuery TF-IDF vectorizer."""
+
+    def __init__(self):
+        self.texts = []
+
+    def transform(self, texts):
+        self.texts.extend(texts)
+        return np.array([[text.lower().count(term) for term in TERMS] for text in texts], dtype=np.float64)
+
+
+class StubEncoder:
+    def __init__(self):
+        self.vectorizer = StubVectorizer()
+
+
+class NoEncoder:
+    @property
+    def vectorizer(self):
+        raise AssertionError("the cache should be enough")
+
+
+PAPERS = [
+    {"pmcid": 1, "title": "White matter tractography", "abstract": "Fractional anisotropy.", "keywords": ""},
+    {"pmcid": 2, "title": "Cortex and memory", "abstract": "", "keywords": "memory"},
+    {"pmcid": 3, "title": "White matter in memory", "abstract": "", "keywords": ""},
+]
+
+
+def test_update_encodes_each_paper_once(tmp_path):
+    encoder = StubEncoder()
+    screen = RelevanceScreen(str(tmp_path), encoder=encoder)
+    assert screen.update(PAPERS[:2]) == 2
+    assert screen.update(PAPERS, batch_size=1) == 1
+    assert len(encoder.vectorizer.texts) == 3
+    assert screen.pmcids == ["1", "2", "3"]
+    assert screen.matrix.shape == (3, len(TERMS))
+
+
+def test_cache_round_trip_scores_without_the_encoder(tmp_path):
+    screen = RelevanceScreen(str(tmp_path), encoder=StubEncoder())
+    screen.update(PAPERS)
+    scores = screen.score_map(QUERY)
+    kept = [p["pmcid"] for p in screen.filter(PAPERS, threshold=0.3, query=QUERY)]
+
+    reopened = RelevanceScreen(str(tmp_path), encoder=NoEncoder())
+    # Views of the read-only memory maps, not copies
+    assert not reopened.matrix.data.flags.writeable
+    assert reopened.score_map(QUERY) == pytest.approx(scores)
+    assert [p["pmcid"] for p in reopened.filter(PAPERS, threshold=0.3, query=QUERY)] == kept == [1, 3]
+    assert scores["1"] > scores["3"] > scores["2"] == 0
+    assert reopened.threshold_table([0.0, 0.3, 0.99], query=QUERY) == [(0.0, 3), (0.3, 2), (0.99, 1)]
+
+
+def test_filter_lets_uncached_papers_through(tmp_path):
+    screen = RelevanceScreen(str(tmp_path), encoder=StubEncoder())
+    screen.update(PAPERS[:2])
+    new = {"pmcid": 4, "title": "Cortex", "abstract": "", "keywords": ""}
+    assert [p["pmcid"] for p in screen.filter(PAPERS[:2] + [new], threshold=0.5, query=QUERY)] == [1, 4]
+    assert screen.stats() == {"cached": 2, "screened": 3, "passed": 2, "dropped": 1}
@@ -0,0 +1,60 @@
+import csv
+
+import pytest
+
+from utils.journal import RunJournal
+from utils.sharding import (merge_shards, shard_items, shard_journal_path, shard_ledger_path, shard_of, shard_path,
+                            shard_range)
+
+FIELDS = ["pmcid", "title"]
+PAPERS = [{"pmcid": 1000 + i, "title": f"paper {i}"} for i in range(50)]
+
+
+def test_shard_of_is_stable_and_in_range():
+    assert shard_of(1234, 8) == shard_of("1234", 8)
+    assert all(0 <= shard_of(paper["pmcid"], 4) < 4 for paper in PAPERS)
+
+
+@pytest.mark.parametrize("by", ["hash", "range"])
+def test_shards_partition_the_input(by):
+    positions = sorted(i for k in range(4) for i, _ in shard_items(PAPERS, k, 4, by=by))
+    assert positions == list(range(len(PAPERS)))
+
+
+def test_shard_items_keeps_input_positions():
+    for i, paper in shard_items(PAPERS, 2, 4, by="range"):
+        assert PAPERS[i] is paper
+    for i, paper in shard_items(PAPERS, 1, 3):
+        assert PAPERS[i] is paper and shard_of(paper["pmcid"], 3) == 1
+
+
+def test_shard_range_covers_total():
+    ranges = [shard_range(10, k, 3) for k in range(3)]
+    assert ranges == [(0, 3), (3, 6), (6, 10)]
+
+
+def test_shard_items_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        shard_items(PAPERS, 4, 4)
+    with pytest.raises(ValueError):
+        shard_items(PAPERS, 0, 4, by="random")
+
+
+def test_shard_paths():
+    assert shard_path("out/extracted.csv", 2, 8) == "out/extracted.shard-2-of-8.csv"
+    assert shard_journal_path("extracted.csv", 0, 2) == "extracted.shard-0-of-2.journal.jsonl"
+    assert shard_ledger_path("ledger.jsonl", 1, 4) == "ledger.shard-1-of-4.jsonl"
+    assert shard_ledger_path(None, 1, 4) is None
+
+
+def test_merge_shards_restores_input_order(tmp_path):
+    out = str(tmp_path / "extracted.csv")
+    for k in range(3):
+        journal = RunJournal(shard_journal_path(out, k, 3))
+        # Shards finish their papers out of order
+        for i, paper in reversed(list(shard_items(PAPERS, k, 3))):
+            journal.append(i, paper)
+        journal.close()
+    assert merge_shards(out, 3, FIELDS) == len(PAPERS)
+    with open(out, newline="", encoding="utf-8") as f:
+        assert [row["pmcid"] for row in csv.DictReader(f)] == [str(paper["pmcid"]) for paper in PAPERS]
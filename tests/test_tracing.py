@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+from utils.tracing import Tracer, format_summary, span, traced
+
+
+def test_span_is_a_no_op_without_a_tracer():
+    with span("stage", pmcid=1) as stage:
+        stage.set(chunks=2)
+    tracer = Tracer()
+    assert tracer.events == []
+
+
+def test_spans_inherit_attributes_and_record_errors():
+    with Tracer() as tracer:
+        with span("extract_chunk", pmcid="7", chunk_index=0):
+            with span("api_call", model="m") as call:
+                call.set(attempt=1)
+        with pytest.raises(KeyError):
+            with span("validate_response"):
+                raise KeyError("x")
+    events = {event["name"]: event for event in tracer.events}
+    assert events["api_call"]["args"] == {"pmcid": "7", "chunk_index": 0, "model": "m", "attempt": 1}
+    assert events["extract_chunk"]["args"] == {"pmcid": "7", "chunk_index": 0}
+    assert events["validate_response"]["args"] == {"error": "KeyError"}
+    # The inner span ends first and lies within the outer one
+    outer, inner = events["extract_chunk"], events["api_call"]
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_traced_wraps_functions_and_coroutines():
+    @traced()
+    def parse():
+        return 1
+
+    @traced("fetch")
+    async def fetch_async():
+        await asyncio.sleep(0)
+        return 2
+
+    with Tracer() as tracer:
+        assert parse() == 1
+        assert asyncio.run(fetch_async()) == 2
+    assert [event["name"] for event in tracer.events] == ["parse", "fetch"]
+
+
+def test_concurrent_tasks_get_their_own_tracks():
+    async def chunk(i):
+        with span("extract_chunk", chunk_index=i):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(chunk(i) for i in range(3)))
+        await chunk(3)
+
+    with Tracer() as tracer:
+        asyncio.run(run())
+    tracks = {event["args"]["chunk_index"]: event["tid"] for event in tracer.events}
+    assert len({tracks[0], tracks[1], tracks[2]}) == 3
+    # A track is reused once its task's span has ended
+    assert tracks[3] in {tracks[0], tracks[1], tracks[2]}
+    assert tracer.stats() == {"spans": 4, "dropped": 0, "tracks": 3}
+
+
+def test_save_writes_chrome_trace_events_and_summary(tmp_path):
+    path = tmp_path / "traces" / "run.trace.json"
+    with Tracer(str(path), max_events=3) as tracer:
+        for i in range(4):
+            with span("build_request", i=i):
+                pass
+        with span("api_call"):
+            pass
+    trace = json.loads(path.read_text(encoding="utf-8"))
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [event["name"] for event in spans] == ["build_request"] * 3
+    assert {event["ph"] for event in trace["traceEvents"]} == {"M", "X"}
+    assert trace["otherData"] == {"dropped_spans": 2}
+
+    summary = tracer.summary()
+    assert summary["build_request"]["count"] == 3
+    assert summary["build_request"]["mean"] == pytest.approx(summary["build_request"]["total"] / 3)
+    lines = format_summary(summary)
+    assert lines[0].split() == ["stage", "spans", "total", "s", "mean", "ms", "max", "ms"]
+    assert lines[1].split()[:2] == ["build_request", "3"]
@@ -0,0 +1,78 @@
+from utils.vocabulary import LOCAL_FIELDS, VocabularyExtractor, agreement, compare_with_llm, sample_papers
+
+
+def test_extract_maps_synonyms_to_canonical_values_in_order():
+    extractor = VocabularyExtractor()
+    found = extractor.extract("We used diffusion tensor imaging and fMRI; FA was computed with TBSS in MNI152 space.")
+    assert found["imaging_modalities"] == ["DTI", "fMRI"]
+    assert found["diffusion_measures"] == ["FA"]
+    assert found["analysis_software"] == ["FSL"]
+    assert found["template_space"] == ["MNI"]
+
+
+def test_leftmost_longest_match():
+    found = VocabularyExtractor().extract("Non-human primates were scanned.")
+    assert found["subjects"] == ["monkeys"]
+
+
+def test_short_forms_are_case_sensitive_long_forms_are_not():
+    extractor = VocabularyExtractor()
+    assert extractor.extract("the ct scan")["imaging_modalities"] == []
+    assert extractor.extract("a CT scan")["imaging_modalities"] == ["CT"]
+    assert extractor.extract("FRACTIONAL ANISOTROPY")["diffusion_measures"] == ["FA"]
+
+
+def test_ambiguous_abbreviations_need_their_long_form():
+    extractor = VocabularyExtractor()
+    assert extractor.extract("patients with AD and MD students")["diffusion_measures"] == []
+    assert extractor.extract("mean diffusivity (MD)")["diffusion_measures"] == ["MD"]
+
+
+def test_whole_words_only():
+    assert VocabularyExtractor().extract("PETROL and FSLX")["imaging_modalities"] == []
+
+
+def test_selected_fields_and_stats():
+    extractor = VocabularyExtractor(fields=["subjects"])
+    assert extractor.extract("mice and rats, fMRI") == {"subjects": ["mice", "rats"]}
+    assert extractor.extract("mice", fields=["subjects"]) == {"subjects": ["mice"]}
+    assert extractor.stats() == {"chunks": 2, "matches": 3}
+
+
+def test_canonical():
+    extractor = VocabularyExtractor()
+    assert extractor.canonical("imaging_modalities", " Diffusion Tensor Imaging ") == "DTI"
+    assert extractor.canonical("subjects", "DTI") == "DTI"
+    assert extractor.canonical("subjects", "zebrafish") == "zebrafish"
+
+
+def test_agreement():
+    extractor = VocabularyExtractor(fields=["subjects"])
+    report = agreement([({"subjects": ["humans"]}, {"subjects": ["Humans", "mice"]})], extractor)
+    assert report["subjects"] == {"papers": 1, "exact": 0.0, "precision": 1.0, "recall": 0.5}
+
+
+def test_generic_human_words_are_not_subjects():
+    found = VocabularyExtractor().extract("Patients, volunteers and participants; a human template for the mice.")
+    assert found["subjects"] == ["mice"]
+    assert "subjects" not in LOCAL_FIELDS
+
+
+def test_compare_with_llm_matches_rows_by_pmcid(monkeypatch):
+    import main
+
+    papers = [{"pmcid": i, "title": title, "abstract": "", "keywords": "", "body": ""}
+              for i, title in enumerate(["A DTI study", "An fMRI study", "A PET study"])]
+    # The first paper failed, so the rows are one short and no longer line up with the sample
+    rows = [{"pmcid": 1, "imaging_modalities": "fMRI"}, {"pmcid": 2, "imaging_modalities": "PET"}]
+    monkeypatch.setattr(main, "extract_all", lambda *args, **kwargs: rows)
+    report = compare_with_llm(papers, VocabularyExtractor(fields=["imaging_modalities"]), sample_size=3)
+    assert report["imaging_modalities"] == {"papers": 2, "exact": 1.0, "precision": 1.0, "recall": 1.0}
+
+
+def test_sample_papers_keeps_input_order():
+    papers = [{"pmcid": i} for i in range(100)]
+    sample = sample_papers(iter(papers), 10, seed=1)
+    assert len(sample) == 10
+    assert [p["pmcid"] for p in sample] == sorted(p["pmcid"] for p in sample)
+    assert sample_papers(papers, 10, seed=1) == sample
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Dict, List, Optional
+
+from utils.ledger import RunLedger, usage_counts
+from utils.rate_limiter import DEFAULT_MAX_OUTPUT_TOKENS, RateLimiter, retry_after_seconds
+from utils.response_cache import ResponseCache
+from utils.tokens import estimate_request_tokens
+from utils.tracing import span
+
+
+def build_messages(system_prompt: str, user_payload: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Build the chat messages sent for one extraction request."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
+    ]
+
+
+# Retries of a request answered with HTTP 429 before giving up
+MAX_RATE_LIMIT_RETRIES = 6
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _error_headers(error: Exception):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None)
+
+
+def _usage_tokens(resp) -> Optional[int]:
+    usage = getattr(resp, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def _record(ledger: Optional[RunLedger], model: str, tags: Optional[Dict[str, Any]], resp,
+            latency: float, cache_hit: bool = False) -> None:
+    if ledger is None:
+        return
+    tags = tags or {}
+    usage = usage_counts(resp) if resp is not None else {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    ledger.record(getattr(resp, "model", None) or model, tags.get("pmcid"), tags.get("chunk_index"), usage, latency,
+                  cache_hit=cache_hit)
+
+
+def chat_completion(client, model: str, system_prompt: str, user_payload: Dict[str, Any],
+                    rate_limiter: Optional[RateLimiter] = None,
+                    cache: Optional[ResponseCache] = None,
+                    response_format: Optional[Dict[str, Any]] = None,
+                    refresh: bool = False,
+                    ledger: Optional[RunLedger] = None,
+                    tags: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Send one extraction request with the blocking OpenAI client.
+    Args:
+        client: An ``openai.OpenAI`` client.
+        model (str): The model to use for extraction.
+        system_prompt (str): The system prompt.
+        user_payload (Dict[str, Any]): The JSON payload sent as the user message.
+        rate_limiter (RateLimiter): Optional limiter; the request waits for RPM/TPM budget
+            and 429 responses are retried after the server's Retry-After delay.
+        cache (ResponseCache): Optional response cache checked before any network call.
+        response_format (Dict[str, Any]): Optional ``response_format`` for structured outputs
+            (see ``utils.schema.response_format``); part of the cache key.
+        refresh (bool): Skip the cache lookup and overwrite the cached entry, e.g. to
+            re-request a completion that failed validation.
+        ledger (RunLedger): Optional ledger recording usage, latency and cost of the call;
+            the request is admitted against its budget, counting the requests in flight.
+        tags (Dict[str, Any]): ``pmcid`` and ``chunk_index`` recorded with the call.
+    Returns:
+        str: The raw message content of the completion.
+    """
+    options = {"response_format": response_format} if response_format else {}
+    if cache is not None:
+        with span("cache_lookup", refresh=refresh) as lookup:
+            key = cache.make_key(model, system_prompt, user_payload, **options)
+            content = None if refresh else cache.get(key)
+            lookup.set(hit=content is not None)
+        if content is None:
+            content = chat_completion(client, model, system_prompt, user_payload, rate_limiter=rate_limiter,
+                                      response_format=response_format, ledger=ledger, tags=tags)
+            with span("cache_store"):
+                cache.put(key, model, content)
+        elif ledger is not None:
+            _record(ledger, model, tags, None, 0.0, cache_hit=True)
+        return content
+
+    with span("build_request"):
+        messages = build_messages(system_prompt, user_payload)
+        max_output_tokens = rate_limiter.max_output_tokens if rate_limiter is not None else DEFAULT_MAX_OUTPUT_TOKENS
+        estimated = estimate_request_tokens(messages, max_output_tokens, model)
+    # Counted against the budget until recorded, so concurrent requests cannot overshoot it
+    reservation = ledger.admit(model, estimated - max_output_tokens, max_output_tokens) if ledger is not None else None
+    try:
+        if rate_limiter is None:
+            start = time.perf_counter()
+            with span("api_call", model=model):
+                resp = client.chat.completions.create(model=model, temperature=0, messages=messages, **options)
+            _record(ledger, model, tags, resp, time.perf_counter() - start)
+            return resp.choices[0].message.content
+
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            with span("rate_limit_wait", attempt=attempt):
+                rate_limiter.acquire(estimated)
+            start = time.perf_counter()
+            try:
+                with span("api_call", model=model, attempt=attempt):
+                    raw = client.chat.completions.with_raw_response.create(model=model, temperature=0,
+                                                                           messages=messages, **options)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                rate_limiter.record_rate_limited(retry_after_seconds(_error_headers(e), attempt))
+                continue
+            rate_limiter.update_from_headers(raw.headers)
+            with span("decode_response"):
+                resp = raw.parse()
+            rate_limiter.record_success(estimated, _usage_tokens(resp))
+            _record(ledger, model, tags, resp, time.perf_counter() - start)
+            return resp.choices[0].message.content
+    finally:
+        if reservation is not None:
+            ledger.release(reservation)
+
+
+async def chat_completion_async(client, model: str, system_prompt: str, user_payload: Dict[str, Any],
+                                rate_limiter: Optional[RateLimiter] = None,
+                                cache: Optional[ResponseCache] = None,
+                                response_format: Optional[Dict[str, Any]] = None,
+                                refresh: bool = False,
+                                ledger: Optional[RunLedger] = None,
+                                tags: Optional[Dict[str, Any]] = None) -> str:
+    """Same as ``chat_completion`` but with an ``openai.AsyncOpenAI`` client."""
+    options = {"response_format": response_format} if response_format else {}
+    if cache is not None:
+        with span("cache_lookup", refresh=refresh) as lookup:
+            key = cache.make_key(model, system_prompt, user_payload, **options)
+            content = None if refresh else cache.get(key)
+            lookup.set(hit=content is not None)
+        if content is None:
+            content = await chat_completion_async(client, model, system_prompt, user_payload,
+                                                  rate_limiter=rate_limiter, response_format=response_format,
+                                                  ledger=ledger, tags=tags)
+            with span("cache_store"):
+                cache.put(key, model, content)
+        elif ledger is not None:
+            _record(ledger, model, tags, None, 0.0, cache_hit=True)
+        return content
+
+    with span("build_request"):
+        messages = build_messages(system_prompt, user_payload)
+        max_output_tokens = rate_limiter.max_output_tokens if rate_limiter is not None else DEFAULT_MAX_OUTPUT_TOKENS
+        estimated = estimate_request_tokens(messages, max_output_tokens, model)
+    # Counted against the budget until recorded, so concurrent requests cannot overshoot it
+    reservation = ledger.admit(model, estimated - max_output_tokens, max_output_tokens) if ledger is not None else None
+    try:
+        if rate_limiter is None:
+            start = time.perf_counter()
+            with span("api_call", model=model):
+                resp = await client.chat.completions.create(model=model, temperature=0, messages=messages, **options)
+            _record(ledger, model, tags, resp, time.perf_counter() - start)
+            return resp.choices[0].message.content
+
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            with span("rate_limit_wait", attempt=attempt):
+                await rate_limiter.acquire_async(estimated)
+            start = time.perf_counter()
+            try:
+                with span("api_call", model=model, attempt=attempt):
+                    raw = await client.chat.completions.with_raw_response.create(model=model, temperature=0,
+                                                                                 messages=messages, **options)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                rate_limiter.record_rate_limited(retry_after_seconds(_error_headers(e), attempt))
+                continue
+            rate_limiter.update_from_headers(raw.headers)
+            with span("decode_response"):
+                resp = raw.parse()
+            rate_limiter.record_success(estimated, _usage_tokens(resp))
+            _record(ledger, model, tags, resp, time.perf_counter() - start)
+            return resp.choices[0].message.content
+    finally:
+        if reservation is not None:
+            ledger.release(reservation)
+
+
+def run_coroutine(coro: Awaitable) -> Any:
+    """
+    Run a coroutine to completion from synchronous code.
+    Works both from plain scripts and from an already running event loop
+    (e.g. a Jupyter / VS Code interactive ``# %%`` cell) via nest_asyncio.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    import nest_asyncio
+    nest_asyncio.apply(loop)
+    return loop.run_until_complete(coro)
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.api_helper import build_messages
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Per-file limits of the OpenAI Batch API
+MAX_REQUESTS_PER_BATCH = 50_000
+MAX_BATCH_BYTES = 190 * 1024 * 1024  # a little under the 200 MB limit
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def make_custom_id(pmcid: Any, chunk_index: int) -> str:
+    """Build the batch ``custom_id`` of one chunk, e.g. ``"PMC123-2"``."""
+    return f"{pmcid}-{chunk_index}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[str, int]:
+    """Split a ``custom_id`` back into (pmcid, chunk index)."""
+    pmcid, chunk_index = custom_id.rsplit("-", 1)
+    return pmcid, int(chunk_index)
+
+
+def write_batch_files(requests: Iterable[Tuple[str, Dict[str, Any]]],
+                      out_prefix: str,
+                      model: str,
+                      system_prompt: str,
+                      response_format: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Write chat-completion requests to Batch API JSONL files, starting a new file
+    whenever the request count or size limit of a batch would be exceeded.
+    Args:
+        requests (Iterable[Tuple[str, Dict[str, Any]]]): (custom_id, user_payload) pairs.
+        out_prefix (str): Files are written to ``{out_prefix}_{part}.jsonl``.
+        model (str): The model to use for extraction.
+        system_prompt (str): The system prompt.
+        response_format (Dict[str, Any]): Optional structured-output format added to every request.
+    Returns:
+        List[str]: Paths of the files written.
+    """
+    if os.path.dirname(out_prefix):
+        os.makedirs(os.path.dirname(out_prefix), exist_ok=True)
+    paths = []
+    f = None
+    n_requests = n_bytes = 0
+    try:
+        for custom_id, user_payload in requests:
+            body = {"model": model, "temperature": 0, "messages": build_messages(system_prompt, user_payload)}
+            if response_format:
+                body["response_format"] = response_format
+            line = json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body,
+            }, ensure_ascii=False) + "\n"
+            size = len(line.encode("utf-8"))
+            if f is None or n_requests >= MAX_REQUESTS_PER_BATCH or n_bytes + size > MAX_BATCH_BYTES:
+                if f is not None:
+                    f.close()
+                paths.append(f"{out_prefix}_{len(paths)}.jsonl")
+                f = open(paths[-1], "w", encoding="utf-8")
+                n_requests = n_bytes = 0
+            f.write(line)
+            n_requests += 1
+            n_bytes += size
+    finally:
+        if f is not None:
+            f.close()
+    return paths
+
+
+def submit_batch(client, path: str, metadata: Optional[Dict[str, str]] = None):
+    """Upload a batch input file and create the batch. Returns the batch object."""
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata=metadata,
+    )
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float = 60.0, timeout: Optional[float] = None):
+    """
+    Poll a batch until it reaches a final status.
+    Args:
+        client: An ``openai.OpenAI`` client (or one pointed at a local stand-in).
+        batch_id (str): The batch to poll.
+        poll_interval (float): Seconds between two polls.
+        timeout (float): Give up after this many seconds (None waits forever).
+    Returns:
+        The final batch object.
+    """
+    start = time.monotonic()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        if batch.status in FINAL_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout}s")
+        time.sleep(poll_interval)
+
+
+def iter_batch_output(client, batch) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Yield ``(custom_id, content)`` for every request of a finished batch.
+    ``content`` is None for requests that failed (listed in the error file or
+    answered with a non-200 status).
+    """
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                yield record["custom_id"], response["body"]["choices"][0]["message"]["content"]
+            else:
+                yield record["custom_id"], None
@@ -0,0 +1,172 @@
+"""
+Cost-aware cascade: a cheap title/abstract/keywords pass (mode 3) for every paper,
+then body-chunk extraction only for the fields that pass left empty or uncertain,
+over the body sections likely to hold them.
+
+    cascade = Cascade()
+    extract_all(papers, cascade=cascade)
+    cascade.stats()  # papers escalated, tokens sent vs. what mode 2 would have sent
+
+A value is uncertain when it cannot be found in the text the model saw (nor, for a
+closed-vocabulary field, any synonym of it): the model inferred it rather than read
+it, so the methods and results are checked as well.
+"""
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from utils.prefilter import alternation
+from utils.tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens
+from utils.vocabulary import CLOSED_VOCABULARIES
+
+# Fields mostly reported in the methods or results rather than in the abstract
+ESCALATION_FIELDS = ["analysis_software", "template_space", "results_method", "diffusion_measures",
+                     "whitematter_tracts"]
+
+_METHODS = (r"method|material|procedure|acquisition|imaging|mri|image|preprocessing|processing|analys"
+            r"|statistic|tractography|participants|subjects|patients|experimental")
+_RESULTS = r"result|finding"
+# field -> section headings likely to hold it (case-insensitive)
+FIELD_HEADINGS = {
+    "analysis_software": _METHODS,
+    "template_space": _METHODS,
+    "results_method": _METHODS + "|" + _RESULTS,
+    "diffusion_measures": _METHODS + "|" + _RESULTS,
+    "whitematter_tracts": _RESULTS + "|" + _METHODS,
+}
+# Sections that restate the literature or the findings; hint terms do not select them
+CONTEXT_HEADINGS = r"introduction|background|discussion|conclusion|limitation|summary"
+# field -> terms that make a section worth sending whatever its heading
+FIELD_HINTS = {
+    "analysis_software": [term for canonical, synonyms in CLOSED_VOCABULARIES["analysis_software"].items()
+                          for term in [canonical] + synonyms],
+    "template_space": ["MNI", "Talairach", "template", "atlas", "standard space", "normalized", "normalised"],
+    "results_method": ["TBSS", "tract-based", "tractography", "voxel-wise", "voxelwise", "ROI", "region of interest",
+                       "along-tract", "connectome"],
+    "diffusion_measures": ["fractional anisotropy", "diffusivity", "kurtosis", "neurite", "FA", "NDI", "ODI"],
+    "whitematter_tracts": ["fasciculus", "corpus callosum", "cingulum", "fornix", "corticospinal",
+                           "internal capsule", "corona radiata", "thalamic radiation"],
+}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def request_tokens(system_prompt: str, user_payload: Dict[str, Any], model: str = "gpt-4o-mini") -> int:
+    """Prompt tokens of one request (system prompt and JSON payload), counted locally."""
+    return (count_tokens(system_prompt, model) + count_tokens(json.dumps(user_payload, ensure_ascii=False), model)
+            + 2 * MESSAGE_OVERHEAD_TOKENS)
+
+
+class Cascade:
+    """
+    Escalation policy and run statistics of the cascade.
+    After the abstract pass, every field of ``fields`` that came back empty or with a
+    value not found in the abstract text is escalated. The body sections whose heading
+    matches one of the escalated fields, or which mention one of its hint terms (outside
+    introduction and discussion), are sent in packed chunks with a prompt reduced to the
+    escalated fields. If no section qualifies, the whole body is sent.
+    Args:
+        fields (List[str]): Fields that may be escalated, defaults to ``ESCALATION_FIELDS``.
+        headings (Dict[str, str]): field -> regex of the section headings likely to hold it.
+        hints (Dict[str, List[str]]): field -> terms that select a section whatever its heading.
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None,
+                 headings: Dict[str, str] = FIELD_HEADINGS,
+                 hints: Dict[str, List[str]] = FIELD_HINTS):
+        self.fields = list(ESCALATION_FIELDS if fields is None else fields)
+        self._context = re.compile(CONTEXT_HEADINGS, re.IGNORECASE)
+        self._headings = {field: re.compile(headings[field], re.IGNORECASE) for field in self.fields if field in headings}
+        self._hints = {}
+        for field in self.fields:
+            terms = hints.get(field, [])
+            exact = [term for term in terms if len(term) <= 5 and term.lower() != term]
+            folded = [term for term in terms if term not in exact]
+            patterns = []
+            if exact:
+                patterns.append(r"(?<!\w)(?:" + alternation(exact) + r")(?!\w)")
+            if folded:
+                patterns.append(r"(?i:(?<!\w)(?:" + alternation(folded) + r")(?!\w))")
+            if patterns:
+                self._hints[field] = re.compile("|".join(patterns))
+        self._synonyms = {field: {_normalize(canonical): [_normalize(term) for term in [canonical] + synonyms]
+                                  for canonical, synonyms in CLOSED_VOCABULARIES[field].items()}
+                          for field in self.fields if field in CLOSED_VOCABULARIES}
+        self.papers = 0
+        self.escalated = 0
+        self.fields_escalated = Counter()
+        self.sections_seen = 0
+        self.sections_sent = 0
+        self.fallbacks = 0
+        self.body_requests = 0
+        self.tokens = 0
+        self.mode2_requests = 0
+        self.mode2_tokens = 0
+
+    def grounded(self, field: str, value: str, text: str) -> bool:
+        """Whether ``value`` (or a synonym of it) occurs in ``text`` (already normalized)."""
+        value = _normalize(value)
+        if value in text:
+            return True
+        return any(term in text for term in self._synonyms.get(field, {}).get(value, []))
+
+    def fields_to_escalate(self, data: Dict[str, List[str]], text: str,
+                           fields: Optional[List[str]] = None) -> List[str]:
+        """
+        The fields of the abstract-pass result ``data`` to look for in the body: empty,
+        or holding a value not found in ``text``. ``fields`` limits them to the fields
+        extracted in this run (e.g. the stale ones of a field store).
+        """
+        text = _normalize(text)
+        return [field for field in self.fields
+                if (fields is None or field in fields) and field in data
+                and (not data[field] or not all(self.grounded(field, value, text) for value in data[field]))]
+
+    def select_sections(self, sections: List[str], fields: List[str]) -> List[str]:
+        """The body sections likely to hold ``fields``, in paper order (all of them if none qualifies)."""
+        selected = []
+        for section in sections:
+            heading = section.split("\n", 1)[0][:120]
+            context = self._context.search(heading)
+            if any(field in self._headings and self._headings[field].search(heading)
+                   or not context and field in self._hints and self._hints[field].search(section)
+                   for field in fields):
+                selected.append(section)
+        self.sections_seen += len(sections)
+        if not selected:
+            self.fallbacks += bool(sections)
+            selected = sections
+        self.sections_sent += len(selected)
+        return selected
+
+    def record(self, escalated: List[str], tokens: int, body_requests: int,
+               mode2_requests: int, mode2_tokens: int) -> None:
+        """
+        Count one paper: the fields escalated, the prompt tokens sent (its share of a packed
+        abstract request included), the body requests, and what mode 2 would have sent.
+        """
+        self.papers += 1
+        self.escalated += bool(escalated)
+        self.fields_escalated.update(escalated)
+        self.tokens += tokens
+        self.body_requests += body_requests
+        self.mode2_requests += mode2_requests
+        self.mode2_tokens += mode2_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "papers": self.papers,
+            "escalated": self.escalated,
+            "fields_escalated": dict(self.fields_escalated.most_common()),
+            "sections_seen": self.sections_seen,
+            "sections_sent": self.sections_sent,
+            "fallbacks": self.fallbacks,
+            "body_requests": self.body_requests,
+            "tokens": self.tokens,
+            "mode2_requests": self.mode2_requests,
+            "mode2_tokens": self.mode2_tokens,
+            "tokens_saved": self.mode2_tokens - self.tokens,
+        }
@@ -0,0 +1,199 @@
+import re
+from typing import Any, Dict, List
+
+from utils.chunk_scheduler import ChunkScheduler
+from utils.prefilter import ChunkFilter
+from utils.tokens import count_tokens
+from utils.tracing import span
+
+# Token budget of one mode-2 body chunk
+DEFAULT_CHUNK_TOKENS = 6000
+# Largest single-request paper in mode 1 (gpt-4o-mini has a 128k context window;
+# leaves room for the system prompt and the completion)
+MAX_SINGLE_REQUEST_TOKENS = 100_000
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[])")
+
+
+def split_sections(body: str) -> List[str]:
+    """
+    Split a paper body on its '##' section markers.
+    Subsections (starting with '###') are combined with their main section.
+    """
+    sections = body.split("##")  # Split the body by sections marked with '##'
+    body_chunks = []
+    current_section = ""
+
+    for section in sections:
+        section = section.strip()
+        if not section:
+            continue
+        if section.startswith("#"):  # If it's a subsection (starts with '###')
+            current_section += " " + section
+        else:
+            if current_section:
+                body_chunks.append(current_section.strip())
+            current_section = section.strip()
+
+    if current_section:
+        body_chunks.append(current_section.strip())
+
+    return body_chunks
+
+
+def _split_words(text: str, max_tokens: int) -> List[str]:
+    """Last resort for a single sentence longer than the budget."""
+    words = text.split()
+    step = max(1, int(len(words) * max_tokens / max(1, count_tokens(text))))
+    return [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+
+
+def _units(text: str, max_tokens: int) -> List[str]:
+    """Break text into paragraphs, then sentences, each fitting ``max_tokens`` where possible."""
+    units = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                units.append(sentence)
+            else:
+                units.extend(_split_words(sentence, max_tokens))
+    return units
+
+
+def split_oversized(section: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Split one section larger than ``max_tokens`` on paragraph or sentence boundaries.
+    Each piece after the first starts with the last ``overlap_tokens`` worth of
+    sentences of the previous piece, so facts spanning a boundary are not lost.
+    """
+    budget = max(1, max_tokens - overlap_tokens)
+    pieces, current, current_tokens = [], [], 0
+    for unit in _units(section, budget):
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > budget:
+            pieces.append(current)
+            carried, carried_tokens = [], 0
+            for previous in reversed(current):
+                previous_tokens = count_tokens(previous)
+                if carried_tokens + previous_tokens > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous_tokens
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        pieces.append(current)
+    return ["\n".join(piece) for piece in pieces]
+
+
+def pack_sections(sections: List[str], max_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = 0) -> List[str]:
+    """
+    Pack adjacent sections into chunks of at most ``max_tokens`` tokens.
+    Sections that do not fit on their own are split with ``split_oversized``.
+    Args:
+        sections (List[str]): Sections in document order (see ``split_sections``).
+        max_tokens (int): Token budget of one chunk.
+        overlap_tokens (int): Tokens repeated between the pieces of a split section.
+    Returns:
+        List[str]: Chunks in document order.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for section in sections:
+        section_tokens = count_tokens(section)
+        if section_tokens > max_tokens:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(split_oversized(section, max_tokens, overlap_tokens))
+            continue
+        if current and current_tokens + section_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(section)
+        current_tokens += section_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def process_full_data(paper: Dict[str, Any], processing_mode: int,
+                      max_chunk_tokens: int = None,
+                      overlap_tokens: int = 0,
+                      chunk_filter: ChunkFilter = None,
+                      chunk_scheduler: ChunkScheduler = None,
+                      sections: List[str] = None) -> str:
+    """
+    Preprocess the data according to the selected processing mode:
+    1. No chunking: Combine all data (title, abstract, keywords, and body).
+       Papers longer than MAX_SINGLE_REQUEST_TOKENS fall back to packed body chunks.
+    2. Chunking: Abstract + body (body sections packed into chunks of at most
+       ``max_chunk_tokens`` tokens; 0 sends every '##' section on its own).
+    3. Title, Abstract, Keywords: Only include title, abstract, and keywords, no body.
+    ``overlap_tokens`` is repeated between the pieces of a section that had to be split.
+    ``chunk_filter`` drops irrelevant body sections (References, Funding, ...) in modes 1 and 2.
+    ``chunk_scheduler`` orders the mode-2 sections by expected yield before they are packed.
+    ``sections`` are body sections already split (and filtered) by the caller, so a paper
+    chunked in several modes goes through ``chunk_filter`` once; ``chunk_filter`` is then ignored.
+    """
+    # Convert all fields to strings to handle NaN/float values
+    body = str(paper.get("body", "")) if paper.get("body") is not None else ""
+    abstract = str(paper.get("abstract", "")) if paper.get("abstract") is not None else ""
+    title = str(paper.get("title", "")) if paper.get("title") is not None else ""
+    keywords = str(paper.get("keywords", "")) if paper.get("keywords") is not None else ""
+    if sections is None and chunk_filter is not None and processing_mode in (1, 2):
+        # Drop sections that cannot hold any field before they cost tokens
+        sections = chunk_filter.filter_sections(split_sections(body), paper.get("pmcid", ""))
+
+    if processing_mode == 1:
+        # No chunking: Combine all data (title, abstract, keywords, and body)
+        if sections is not None:
+            body = "\n\n".join(sections)
+        full_data = title + " " + abstract + " " + keywords + " " + body
+        max_tokens = max_chunk_tokens or MAX_SINGLE_REQUEST_TOKENS
+        if count_tokens(full_data) <= max_tokens:
+            return full_data, []
+        # Too long for one request: keep the metadata chunk and pack the body
+        if sections is None:
+            sections = split_sections(body)
+        full_data = title + " " + abstract + " " + keywords
+        return full_data, pack_sections(sections, max_tokens, overlap_tokens)
+
+    elif processing_mode == 2:
+        # Chunking: Combine abstract + body in chunks (split body into sections)
+        full_data = title + " " + abstract + " " + keywords
+        body_chunks = split_sections(body) if sections is None else list(sections)
+        if chunk_scheduler is not None:
+            body_chunks = chunk_scheduler.rank(body_chunks)
+        if max_chunk_tokens is None:
+            max_chunk_tokens = DEFAULT_CHUNK_TOKENS
+        if max_chunk_tokens:
+            body_chunks = pack_sections(body_chunks, max_chunk_tokens, overlap_tokens)
+        return full_data, body_chunks
+
+    elif processing_mode == 3:
+        # Just Title, Abstract, Keywords: Only include title, abstract, and keywords
+        full_data = title + " " + abstract + " " + keywords
+        return full_data, []
+
+    return "", []  # Default case if invalid processing_mode
+
+
+def build_chunks(WM_paper: Dict[str, Any], processing_mode: int, max_chunk_tokens: int = None,
+                 chunk_filter: ChunkFilter = None, chunk_scheduler: ChunkScheduler = None,
+                 sections: List[str] = None) -> List[str]:
+    """Return the list of text chunks sent to the model for one paper."""
+    with span("process_full_data", pmcid=WM_paper.get("pmcid", ""), mode=processing_mode) as stage:
+        full_data, body_chunks = process_full_data(WM_paper, processing_mode, max_chunk_tokens=max_chunk_tokens,
+                                                   chunk_filter=chunk_filter, chunk_scheduler=chunk_scheduler,
+                                                   sections=sections)
+        stage.set(chunks=1 + len(body_chunks))
+
+    # Modes 1 and 3 give a single chunk (unless a mode-1 paper overflows the context window)
+    return [full_data] + body_chunks  # Combine full data (title, abstract, keywords) + body chunks
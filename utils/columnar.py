@@ -0,0 +1,173 @@
+"""
+Columnar output of extraction results: a Parquet dataset with one list<string>
+column per field, so downstream analysis scans lists instead of re-splitting
+";"-joined CSV strings (which also breaks on values containing ";").
+
+    from utils.columnar import read_results, cooccurrence_counts
+    table = read_results("extracted_info.parquet", where={"subjects": ["humans"]})
+    cooccurrence_counts(table, "whitematter_tracts", "imaging_modalities").to_pandas()
+
+Requires ``pyarrow`` (``pip install pyarrow``); the CSV output does not.
+"""
+import glob
+import os
+from typing import Any, Dict, List, Optional, Set
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for Parquet output
+    pa = pc = ds = pq = None
+
+from prompts.brain_extraction import EXTRACTION_FIELDS
+
+# Papers per row group; each row group is written to the dataset as soon as it is full
+ROW_GROUP_SIZE = 5000
+
+
+def require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Parquet output needs pyarrow: pip install pyarrow")
+
+
+def results_schema(fields: List[str] = EXTRACTION_FIELDS):
+    """Arrow schema of the results: input position, pmcid, title and one list<string> per field."""
+    require_pyarrow()
+    return pa.schema([("index", pa.int64()), ("pmcid", pa.string()), ("title", pa.string())]
+                     + [(field, pa.list_(pa.string())) for field in fields])
+
+
+class ParquetResultWriter:
+    """
+    Writes results to a Parquet dataset (a directory of part files) while papers finish.
+    Rows are buffered and every ``row_group_size`` papers are written out as one row
+    group in a new part file (written to a hidden temporary name, then renamed), so a
+    crash loses at most the buffered papers. Rows are in completion order; the ``index``
+    column holds each paper's position in the input.
+    Args:
+        path (str): Dataset directory, e.g. ``extracted_info.parquet``.
+        fields (List[str]): Extraction fields, defaults to ``EXTRACTION_FIELDS``.
+        row_group_size (int): Papers per row group.
+        resume (bool): Keep the part files of an earlier run instead of removing them.
+        prefix (str): Name prefix of this writer's part files; the shards of a run write
+            to the same directory with their own prefix.
+    """
+
+    def __init__(self, path: str, fields: Optional[List[str]] = None, row_group_size: int = ROW_GROUP_SIZE,
+                 resume: bool = False, prefix: str = "part"):
+        require_pyarrow()
+        self.path = path
+        self.prefix = prefix
+        self.fields = list(fields or EXTRACTION_FIELDS)
+        self.schema = results_schema(self.fields)
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._buffer = {name: [] for name in self.schema.names}
+        os.makedirs(path, exist_ok=True)
+        parts = self.part_files()
+        if not resume:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        self._next_part = len(parts)
+
+    def part_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, f"{self.prefix}-[0-9]*.parquet")))
+
+    def completed_pmcids(self) -> Set[str]:
+        """The pmcids already in the dataset (reads the pmcid column only)."""
+        if not self.part_files():
+            return set()
+        return set(ds.dataset(self.part_files(), format="parquet").to_table(columns=["pmcid"])
+                   .column("pmcid").to_pylist())
+
+    def append(self, index: int, WM_paper: Dict[str, Any], data: Dict[str, List[str]]) -> None:
+        """Buffer the result of one paper; writes a row group once ``row_group_size`` are buffered."""
+        self._buffer["index"].append(index)
+        self._buffer["pmcid"].append(str(WM_paper.get("pmcid", "")))
+        self._buffer["title"].append(str(WM_paper.get("title", "") or ""))
+        for field in self.fields:
+            self._buffer[field].append(list(data.get(field, [])))
+        if len(self._buffer["index"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows as one row group in a new part file."""
+        n_rows = len(self._buffer["index"])
+        if not n_rows:
+            return
+        table = pa.Table.from_pydict(self._buffer, schema=self.schema)
+        name = f"{self.prefix}-{self._next_part:05d}.parquet"
+        # Dataset readers skip names starting with "."
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        pq.write_table(table, tmp, row_group_size=n_rows)
+        os.replace(tmp, os.path.join(self.path, name))
+        self._next_part += 1
+        self.rows_written += n_rows
+        self._buffer = {name: [] for name in self.schema.names}
+
+    def close(self) -> None:
+        self.flush()
+
+
+def read_results(path: str, columns: Optional[List[str]] = None, filter=None,
+                 where: Optional[Dict[str, List[str]]] = None):
+    """
+    Read a results dataset into an Arrow table sorted by input position.
+    Args:
+        path (str): Dataset directory written by ``ParquetResultWriter`` (or one Parquet file).
+        columns (List[str]): Columns to read; the others are never decoded.
+        filter: ``pyarrow.dataset`` expression pushed down to the scan, e.g.
+            ``pc.field("index") < 1000`` or ``pc.field("pmcid").isin([...])``; row groups
+            whose statistics rule it out are skipped.
+        where (Dict[str, List[str]]): Keep papers whose list field contains any of the
+            values, e.g. ``{"subjects": ["humans"]}`` (a vectorized scan of the list column).
+    Returns:
+        pyarrow.Table: The selected rows and columns.
+    """
+    require_pyarrow()
+    dataset = ds.dataset(path, format="parquet")
+    needed = None
+    if columns is not None:
+        needed = list(dict.fromkeys(["index"] + list(columns) + list(where or {})))
+    table = dataset.to_table(columns=needed, filter=filter)
+    for field, values in (where or {}).items():
+        table = rows_containing(table, field, values)
+    table = table.sort_by("index")
+    return table if columns is None else table.select(columns)
+
+
+def rows_containing(table, field: str, values: List[str]):
+    """Rows of ``table`` whose list column ``field`` contains any of ``values``."""
+    column = table.column(field).combine_chunks()
+    hits = pc.filter(pc.list_parent_indices(column), pc.is_in(pc.list_flatten(column), value_set=pa.array(values)))
+    return table.take(pc.unique(hits))
+
+
+def _exploded(table, field: str):
+    """(row, value) pairs of a list column, as a two-column table."""
+    column = table.column(field).combine_chunks()
+    return pa.table({"row": pc.list_parent_indices(column), field: pc.list_flatten(column)})
+
+
+def value_counts(table, field: str):
+    """Number of papers per value of the list column ``field``, most frequent first."""
+    counts = _exploded(table, field).group_by(field).aggregate([("row", "count")])
+    return pa.table({field: counts[field], "papers": counts["row_count"]}).sort_by([("papers", "descending")])
+
+
+def cooccurrence_counts(table, row_field: str, col_field: str):
+    """
+    Number of papers per (``row_field`` value, ``col_field`` value) pair, e.g. tract x
+    modality, computed by a hash join of the two exploded list columns on the row.
+    Returns:
+        pyarrow.Table: Columns ``row_field``, ``col_field`` and ``papers``, most frequent first.
+    """
+    if row_field == col_field:
+        raise ValueError("cooccurrence_counts needs two different fields")
+    pairs = _exploded(table, row_field).join(_exploded(table, col_field), "row", join_type="inner")
+    counts = pairs.group_by([row_field, col_field]).aggregate([("row", "count")])
+    return pa.table({row_field: counts[row_field], col_field: counts[col_field],
+                     "papers": counts["row_count"]}).sort_by([("papers", "descending")])
@@ -2,10 +2,9 @@
 import os
 import pandas as pd
 import json
-from dotenv import load_dotenv
 
-# Load environment variables (e.g., API keys, etc.)
-load_dotenv()  # Load environment variables from .env file
+from utils.paper_store import write_paper_store, PaperStore
+from utils.tracing import span, traced
 
 # Paths for data
 RAW_DATA_PATH = 'data/raw'  # Raw data 
@@ -14,8 +13,6 @@ PROCESSED_DATA_PATH = 'data/processed'  # Processed data directory
 # Create processed directory if it doesn't exist
 #os.makedirs(PROCESSED_DATA_PATH, exist_ok=True)  # Ensure the directory exists
 
-os.path.dirname(os.path.dirname(__file__))
-
 def get_file_path(file_name: str, folder: str = 'raw') -> str:
     """Generate and return the absolute file path for the data."""
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', folder, file_name)
@@ -31,89 +28,185 @@ def save_processed_data(df: pd.DataFrame, file_name: str):
     df.to_csv(file_path, index=False)
     print(f"Data saved to {file_path}")
 
-def process_data():
-    """Main data processing function."""
-    # Load raw data
-    WM_data = load_raw_data('WM_data.csv')  # Read raw data
-      
-    # Extract PMCID column
-    pmcids = WM_data['PMCID']  
-
-    # Strip 'PMC' from the PMCID column
-    pmcids = pmcids.str.replace('PMC', '', regex=False)  # Remove 'PMC' prefix
-
-    # Save cleaned pmcids to processed folder
-    pmcids.to_csv(get_file_path('pmcid.txt', 'processed'), index=False, header=False)  # Save to processed folder
-
-    # Read pmcid.txt, clean the PMC IDs and save them
-    pmcid_ids = pd.read_csv(get_file_path('pmcid.txt', 'processed'), header=None, names=["pmcid"])
-    save_processed_data(pmcid_ids, 'pmcids.csv')
-
-    # Read extracted data
-    text_csv = pd.read_csv(get_file_path('text.csv', 'raw'))
-    ordered_ids = pd.read_csv(get_file_path('pmcids.csv', 'processed'))
-
-    # Merge the data on PMCID
-    ordered_text = ordered_ids.merge(
-        text_csv[["pmcid", "title", "keywords", "abstract", "body"]],
-        on="pmcid",
-        how="left",
-        validate="1:1"
-    )
-
-    # Save ordered text data to processed folder
-    save_processed_data(ordered_text, 'ordered_txt.csv')
+# Columns of pubget's text.csv used to build the corpus
+TEXT_COLUMNS = ["pmcid", "title", "keywords", "abstract", "body"]
+# Rows per chunk when reading text.csv in a single process
+CSV_CHUNK_ROWS = 20_000
+# Approximate size of the byte ranges parsed by each worker when n_jobs > 1
+CSV_PART_BYTES = 256 * 1024 * 1024
+_BLOCK_BYTES = 1024 * 1024
+
+def normalize_pmcids(pmcids: pd.Series) -> pd.Series:
+    """Strip the 'PMC' prefix and return the ids as nullable integers (vectorized)."""
+    pmcids = pmcids.astype(str).str.strip().str.replace('PMC', '', regex=False)  # Remove 'PMC' prefix
+    return pd.to_numeric(pmcids, errors='coerce').astype('Int64')
+
+@traced()
+def load_ordered_pmcids(file_name: str = 'WM_data.csv') -> pd.Series:
+    """Read the PMCIDs of the white matter selection, in their original order."""
+    WM_data = pd.read_csv(get_file_path(file_name, 'raw'), usecols=['PMCID'])
+    return normalize_pmcids(WM_data['PMCID']).rename('pmcid')
+
+@traced("select_rows")
+def _select_rows(chunk: pd.DataFrame, wanted: pd.Index) -> pd.DataFrame:
+    """Normalize the pmcid column of a text.csv chunk and keep only the wanted papers."""
+    chunk['pmcid'] = normalize_pmcids(chunk['pmcid'])
+    return chunk[chunk['pmcid'].isin(wanted)]
+
+def _csv_record_ranges(path: str, n_parts: int):
+    """
+    Split a CSV file into ``n_parts`` byte ranges that start and end on record
+    boundaries. Quoted fields may contain newlines (article bodies do), so a
+    boundary is the first newline after the target offset that is outside quotes,
+    tracked by the parity of the quote characters seen so far.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        bounds = [len(header)]
+        pos, in_quotes = len(header), False
+        for k in range(1, n_parts):
+            target = bounds[0] + (size - bounds[0]) * k // n_parts
+            f.seek(pos)
+            while pos < target:
+                block = f.read(min(_BLOCK_BYTES, target - pos))
+                in_quotes ^= block.count(b'"') % 2 == 1
+                pos += len(block)
+            found = None
+            while found is None:
+                block = f.read(_BLOCK_BYTES)
+                if not block:
+                    break
+                for j, byte in enumerate(block):
+                    if byte == 0x22:  # '"'
+                        in_quotes = not in_quotes
+                    elif byte == 0x0A and not in_quotes:  # '\n'
+                        found = pos + j + 1
+                        break
+                pos = found if found is not None else pos + len(block)
+            if found is None or found >= size:
+                break
+            if found > bounds[-1]:
+                bounds.append(found)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _read_csv_range(path: str, start: int, end: int, columns, wanted: pd.Index) -> pd.DataFrame:
+    """Worker: parse one byte range of text.csv and keep the wanted papers."""
+    import io
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(data), header=None, names=columns, usecols=TEXT_COLUMNS)
+    return _select_rows(chunk, wanted)
+
+@traced()
+def read_text_rows(wanted: pd.Index, file_name: str = 'text.csv', n_jobs: int = 1) -> pd.DataFrame:
+    """
+    Read the rows of text.csv whose pmcid is in ``wanted``, using only the needed columns.
+    With ``n_jobs`` > 1 the file is split into record-aligned byte ranges parsed in
+    parallel worker processes; otherwise it is streamed in chunks of CSV_CHUNK_ROWS rows.
+    """
+    path = get_file_path(file_name, 'raw')
+    if n_jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        columns = pd.read_csv(path, nrows=0).columns.tolist()
+        n_parts = max(n_jobs, -(-os.path.getsize(path) // CSV_PART_BYTES))
+        ranges = _csv_record_ranges(path, n_parts)
+        with ProcessPoolExecutor(n_jobs) as pool:
+            futures = [pool.submit(_read_csv_range, path, start, end, columns, wanted) for start, end in ranges]
+            parts = [future.result() for future in futures]
+    else:
+        reader = pd.read_csv(path, usecols=TEXT_COLUMNS, chunksize=CSV_CHUNK_ROWS)
+        parts = [_select_rows(chunk, wanted) for chunk in reader]
+    return pd.concat(parts, ignore_index=True)
+
+@traced()
+def process_data(output: str = "whitematter_data.json", store_format: str = "json", n_jobs: int = 1):
+    """
+    Main data processing function.
+    Reads the white matter PMCIDs and the matching rows of text.csv in one pass,
+    joins them in the PMCID order of WM_data.csv and writes the corpus directly.
+    Args:
+        output (str): Output file name in the processed folder.
+        store_format (str): "json" for a JSON list, "jsonl" for an indexed paper store.
+        n_jobs (int): Worker processes used to parse text.csv.
+    """
+    ordered_ids = load_ordered_pmcids()
+    text_rows = read_text_rows(pd.Index(ordered_ids.dropna().unique()), n_jobs=n_jobs)
+
+    # Merge the data on PMCID, keeping the order of WM_data.csv
+    with span("merge_text_rows", papers=len(ordered_ids)):
+        ordered_text = ordered_ids.to_frame().merge(
+            text_rows,
+            on="pmcid",
+            how="left",
+            validate="1:1"
+        )
 
     # Generate JSON from processed data
-    generate_json_file(ordered_text)
-
-def generate_json_file(data, output="whitematter_data.json"):
-    """Generate a JSON file from the processed data."""
-    whitematter_pmcid = data['pmcid'].tolist()
-    whitematter_title = data['title'].tolist()
-    whitematter_keyword = data['keywords'].tolist()  # Not used but extracted
-    whitematter_abstract = data['abstract'].tolist()
-    whitematter_body = data['body'].tolist()
-
-    # Prepare the data for JSON
-    whitematter_json = []
-    for pmcid, abstract, title, keyword, body in zip(whitematter_pmcid, whitematter_abstract, whitematter_title, whitematter_keyword, whitematter_body):
-        whitematter_json.append({
-            "pmcid": pmcid,
-            "title": title,
-            "keywords": keyword,
-            "abstract": abstract,
-            "body": body
-        })
-
+    generate_json_file(ordered_text, output=output, store_format=store_format)
+
+def _json_records(data: pd.DataFrame):
+    """
+    Papers as dicts of plain Python values for ``json.dump``, so the files are byte-identical
+    to the original ones (``DataFrame.to_json`` escapes "/" and writes missing text as null).
+    """
+    columns = [[float("nan") if value is pd.NA else value for value in data[column].tolist()]
+               for column in TEXT_COLUMNS]
+    for values in zip(*columns):
+        yield dict(zip(TEXT_COLUMNS, values))
+
+@traced()
+def generate_json_file(data, output="whitematter_data.json", store_format="json"):
+    """
+    Generate a JSON file from the processed data.
+    store_format "jsonl" writes a line-delimited store with a pmcid index instead
+    (see utils.paper_store), which can be streamed or queried by pmcid.
+    """
     # Save JSON to output file
     output_path = get_file_path(output, "processed")  # Save to processed folder
-    with open(output_path, "w") as f:
-        json.dump(whitematter_json, f, indent=4, ensure_ascii=False)
+    if store_format == "jsonl":
+        write_paper_store(_json_records(data), output_path)
+    else:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(list(_json_records(data)), f, indent=4, ensure_ascii=False)
 
     print(f"JSON data saved to {output_path}")
 
+@traced()
 def save_abstract_data(json_file="whitematter_data.json"):
     """Extract abstracts and save to JSON."""
-    # Read JSON file
     json_file = get_file_path(json_file, 'processed')
-    with open(json_file, "r", encoding="utf-8") as f:
+    abstract_output_path = get_file_path('whitematter_abstract.json', 'processed')  # Save to processed folder
+
+    if json_file.endswith(".jsonl"):
+        # Stream the store and write the abstracts one by one
+        with open(abstract_output_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for i, paper in enumerate(PaperStore(json_file)):
+                abstract = {k: v for k, v in paper.items() if k != "body" and k != "pmcid"}
+                f.write(("," if i else "") + "\n" + json.dumps(abstract, indent=4, ensure_ascii=False))
+            f.write("\n]")
+        print(f"Abstract JSON data saved to {abstract_output_path}")
+        return
+
+    # Read JSON file
+    with span("load_papers", path=json_file), open(json_file, "r", encoding="utf-8") as f:
         whitematter_json = json.load(f)
 
     # Extract abstract data
     abstract_data = [{k: v for k, v in d.items() if k != "body" and k != "pmcid"} for d in whitematter_json]
 
     # Save abstract data to JSON file
-    abstract_output_path = get_file_path('whitematter_abstract.json', 'processed')  # Save to processed folder
     with open(abstract_output_path, "w", encoding="utf-8") as f:
         json.dump(abstract_data, f, indent=4, ensure_ascii=False)
 
     print(f"Abstract JSON data saved to {abstract_output_path}")
 
-# Run the data processing functions
-process_data()
-ordered_csv = load_raw_data(get_file_path('ordered_txt.csv', 'processed'))
-generate_json_file(ordered_csv)
-save_abstract_data()
+if __name__ == "__main__":
+    # Run the data processing functions
+    process_data()
+    save_abstract_data()
 
 
@@ -0,0 +1,190 @@
+"""
+Near-duplicate chunk detection: chunks whose text is nearly the same as a chunk
+already extracted (boilerplate methods paragraphs, text reused across papers of a
+lab) get the stored result instead of another API call.
+
+    dedup = ChunkDeduplicator(threshold=0.9)
+    extract_all(papers, processing_mode=2, dedup=dedup)
+    dedup.stats()  # lookups, hits, tokens not sent
+
+Signatures, band keys and results persist in SQLite, so later runs reuse the
+extractions of earlier ones.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_DEDUP_PATH = "data/cache/chunk_minhash.sqlite"
+# Words per shingle
+SHINGLE_SIZE = 5
+# Chunks with fewer shingles are never matched (too little text to call two chunks the same)
+MIN_SHINGLES = 40
+_MASK = (1 << 64) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    ``(bands, rows)`` with ``bands * rows == num_perm`` whose S-curve midpoint is the
+    closest one at or below ``threshold``: two chunks share a band with probability
+    1 - (1 - J^rows)^bands, and candidates are checked against ``threshold`` anyway,
+    so erring low only costs a few extra comparisons.
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [br for br in options if (1 / br[0]) ** (1 / br[1]) <= threshold] or options[:1]
+    return max(below, key=lambda br: (1 / br[0]) ** (1 / br[1]))
+
+
+class ChunkDeduplicator:
+    """
+    MinHash/LSH index of the chunks already extracted, so a near-duplicate chunk
+    (a standard DTI acquisition paragraph, a TBSS pipeline description, text reused
+    across a lab's papers) gets the stored result instead of an API call.
+    Chunks are shingled into ``shingle_size``-word windows and signed with one-permutation
+    MinHash (one hash per shingle, ``num_perm`` buckets, empty buckets filled from the
+    next one). Signatures are split into LSH bands; chunks sharing a band are candidates,
+    and a candidate is reused when the signatures estimate a Jaccard similarity of at
+    least ``threshold``. Results are scoped by model, prompt and schema, so a chunk is
+    only reused for the same request. Counts lookups, hits and tokens not sent for the run.
+    Args:
+        path (str): SQLite file holding signatures, band keys and results.
+        threshold (float): Minimum estimated Jaccard similarity of two chunks to reuse a result.
+        num_perm (int): MinHash signature length.
+        shingle_size (int): Words per shingle.
+        min_shingles (int): Shorter chunks are always sent.
+    """
+
+    def __init__(self, path: str = DEFAULT_DEDUP_PATH, threshold: float = 0.9, num_perm: int = 128,
+                 shingle_size: int = SHINGLE_SIZE, min_shingles: int = MIN_SHINGLES):
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        # Run counters
+        self.lookups = 0
+        self.hits = 0
+        self.added = 0
+        self.too_short = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                                  id INTEGER PRIMARY KEY,
+                                  scope TEXT,
+                                  signature BLOB,
+                                  result TEXT)""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bands (scope TEXT, band TEXT, chunk INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands(scope, band)")
+        self._conn.commit()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Sent to shard worker processes, which open their own connection
+        return {"path": self.path, "threshold": self.threshold, "num_perm": self.num_perm,
+                "shingle_size": self.shingle_size, "min_shingles": self.min_shingles}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)
+
+    @staticmethod
+    def scope(model: str, system_prompt: str, response_format: Any = None) -> str:
+        """Key of the request a chunk is sent with; results are only reused within a scope."""
+        blob = json.dumps([model, system_prompt, response_format], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+    def signature(self, text: str) -> Optional[array]:
+        """One-permutation MinHash of the word shingles of ``text``, or None if it is too short."""
+        words = _WORD_RE.findall(text.lower())
+        n_shingles = len(words) - self.shingle_size + 1
+        if n_shingles < self.min_shingles:
+            return None
+        buckets = [_MASK] * self.num_perm
+        for i in range(n_shingles):
+            shingle = " ".join(words[i:i + self.shingle_size]).encode("utf-8")
+            h = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+            bucket, value = h % self.num_perm, h // self.num_perm
+            if value < buckets[bucket]:
+                buckets[bucket] = value
+        # Densification: an empty bucket takes the value of the next filled one
+        filled = [b for b in range(self.num_perm) if buckets[b] != _MASK]
+        if len(filled) < self.num_perm:
+            for b in range(self.num_perm):
+                if buckets[b] == _MASK:
+                    nxt = next((f for f in filled if f > b), filled[0])
+                    buckets[b] = buckets[nxt]
+        return array("Q", buckets)
+
+    def _band_keys(self, signature: array) -> List[str]:
+        return [f"{band}:" + hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                             digest_size=8).hexdigest()
+                for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(a: array, b: array) -> float:
+        """Jaccard similarity estimated from two signatures."""
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def find(self, signature: Optional[array], scope: str, tokens: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        The stored result of the most similar chunk of ``scope`` at or above the
+        threshold, or None. ``tokens`` (of the chunk) are counted as saved on a hit.
+        """
+        if signature is None:
+            self.too_short += 1
+            return None
+        self.lookups += 1
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(row[0] for row in self._conn.execute(
+                    "SELECT chunk FROM bands WHERE scope = ? AND band = ?", (scope, key)))
+            best, best_result = self.threshold, None
+            for chunk in candidates:
+                blob, result = self._conn.execute("SELECT signature, result FROM chunks WHERE id = ?",
+                                                  (chunk,)).fetchone()
+                similarity = self.similarity(signature, array("Q", blob))
+                if similarity >= best:
+                    best, best_result = similarity, result
+        if best_result is None:
+            return None
+        self.hits += 1
+        self.tokens_saved += tokens
+        return json.loads(best_result)
+
+    def add(self, signature: Optional[array], scope: str, result: Dict[str, Any]) -> None:
+        """Index a chunk and its validated result."""
+        if signature is None:
+            return
+        with self._lock:
+            chunk = self._conn.execute("INSERT INTO chunks (scope, signature, result) VALUES (?, ?, ?)",
+                                       (scope, signature.tobytes(), json.dumps(result, ensure_ascii=False))).lastrowid
+            self._conn.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                                   [(scope, key, chunk) for key in self._band_keys(signature)])
+            self._conn.commit()
+            self.added += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "too_short": self.too_short,
+            "added": self.added,
+            "tokens_saved": self.tokens_saved,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
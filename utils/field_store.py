@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from prompts.brain_extraction import EXTRACTION_FIELDS, field_fingerprint
+
+DEFAULT_FIELD_STORE_PATH = "data/cache/extracted_fields.sqlite"
+
+
+class FieldStore:
+    """
+    Extraction results stored per (pmcid, field) with the fingerprint of the field's
+    prompt instructions (``prompts.brain_extraction.field_fingerprint``).
+    A field is stale for a paper when it was never extracted or its fingerprint has
+    changed since, i.e. the field was added or its rule/examples were edited. With a
+    store, ``extract_all`` only asks the model for the stale fields of each paper,
+    with a prompt reduced to them, and merges the answer with the stored fields;
+    papers without stale fields cost no request at all.
+    One store holds the results of one model and processing mode.
+    Args:
+        path (str): SQLite file holding the fields.
+        fields (List[str]): Fields of the current prompt, defaults to ``EXTRACTION_FIELDS``.
+    """
+
+    def __init__(self, path: str = DEFAULT_FIELD_STORE_PATH, fields: Optional[List[str]] = None):
+        self.path = path
+        self.fields = list(fields or EXTRACTION_FIELDS)
+        self.fingerprints = {field: field_fingerprint(field) for field in self.fields}
+        # Run counters
+        self.papers_current = 0
+        self.papers_updated = 0
+        self.fields_reused = 0
+        self.fields_extracted = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shard worker processes share the file, so wait for each other's writes
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS fields (
+                                  pmcid TEXT,
+                                  field TEXT,
+                                  fingerprint TEXT,
+                                  value TEXT,
+                                  model TEXT,
+                                  updated_at REAL,
+                                  PRIMARY KEY (pmcid, field))""")
+        self._conn.commit()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Sent to shard worker processes, which open their own connection
+        return {"path": self.path, "fields": self.fields}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["path"], state["fields"])
+
+    def lookup(self, pmcid: Any) -> Tuple[Dict[str, List[str]], List[str]]:
+        """
+        Current values of ``pmcid`` and its stale fields.
+        Returns:
+            Tuple[Dict[str, List[str]], List[str]]: ``(values, stale)``; ``values`` holds the fields
+            whose stored fingerprint matches the prompt, ``stale`` the others in ``fields`` order.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT field, fingerprint, value FROM fields WHERE pmcid = ?",
+                                      (str(pmcid),)).fetchall()
+        values = {field: json.loads(value) for field, fingerprint, value in rows
+                  if self.fingerprints.get(field) == fingerprint}
+        return values, [field for field in self.fields if field not in values]
+
+    def put(self, pmcid: Any, values: Dict[str, List[str]], model: str = "") -> None:
+        """Store freshly extracted fields of ``pmcid`` with their current fingerprints."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO fields VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(str(pmcid), field, self.fingerprints[field], json.dumps(value, ensure_ascii=False),
+                                     model, now)
+                                    for field, value in values.items() if field in self.fingerprints])
+            self._conn.commit()
+
+    def import_csv(self, csv_path: str, model: str = "", fields: Optional[List[str]] = None) -> int:
+        """
+        Seed the store from the CSV of an earlier run, taking its columns as extracted with
+        the current prompt, so the next run only extracts fields added or edited after it.
+        Only the columns present in the CSV (and in ``fields``, if given) are imported.
+        Returns:
+            int: Number of papers imported.
+        """
+        n_papers = 0
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            columns = [field for field in (fields or self.fields) if field in (reader.fieldnames or [])]
+            for row in reader:
+                self.put(row["pmcid"], {field: [v for v in (row[field] or "").split(";") if v] for field in columns},
+                         model)
+                n_papers += 1
+        print(f"✅ Imported {len(columns)} fields of {n_papers} papers from {csv_path}")
+        return n_papers
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the run: papers served from the store or updated, fields reused or extracted."""
+        return {
+            "papers_current": self.papers_current,
+            "papers_updated": self.papers_updated,
+            "fields_reused": self.fields_reused,
+            "fields_extracted": self.fields_extracted,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+from typing import Any, Dict, List, Set, Union
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of finished papers, used to checkpoint long extraction runs.
+    Each line holds the paper's position in the input (``index``) and its CSV row.
+    Lines are flushed immediately and fsync'ed every ``fsync_every`` records, so a crash
+    loses at most the records of the last unsynced batch.
+    Args:
+        path (str): Journal file path.
+        resume (bool): Keep the existing records (and skip their pmcids) instead of starting over.
+        fsync_every (int): Number of appended records between two fsync calls.
+    """
+
+    def __init__(self, path: str, resume: bool = False, fsync_every: int = 20):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._pending = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and os.path.exists(path):
+            _drop_partial_line(path)
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+
+    def completed_pmcids(self) -> Set[str]:
+        """Return the pmcids already recorded in the journal (as strings)."""
+        return {str(record["row"]["pmcid"]) for _, record in iter_journal(self.path)}
+
+    def append(self, index: int, row: Dict[str, Any]) -> None:
+        """Record one finished paper."""
+        self._file.write(json.dumps({"index": index, "row": row}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        """Force the appended records to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+def _drop_partial_line(path: str) -> None:
+    """Truncate a record left half-written by a crash, so new records start on a fresh line."""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def iter_journal(path: str, start: int = 0):
+    """Yield ``(byte_offset, record)`` for every complete record of a journal, from byte ``start`` on."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if not line.endswith(b"\n"):
+                break  # partial record of an interrupted write
+            try:
+                yield start, json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def compact_journal(journal_path: Union[str, List[str]], out_csv: str, fieldnames: List[str]) -> int:
+    """
+    Write the journal to a CSV in input order, keeping the last record of each pmcid.
+    Only (index, offset) pairs are held in memory; rows are read back one at a time.
+    Args:
+        journal_path (str or List[str]): Journal written by ``RunJournal``, or the journals of
+            several shards of one run (their ``index`` values all refer to the same input);
+            for a pmcid in several journals the one in the later journal wins.
+        out_csv (str): Output CSV file path.
+        fieldnames (List[str]): CSV columns.
+    Returns:
+        int: Number of rows written.
+    """
+    paths = [journal_path] if isinstance(journal_path, str) else list(journal_path)
+    latest = {}
+    for path_index, path in enumerate(paths):
+        for offset, record in iter_journal(path):
+            latest[str(record["row"]["pmcid"])] = (record["index"], path_index, offset)
+    positions = sorted(latest.values())
+
+    sources = [open(path, "rb") if os.path.exists(path) else None for path in paths]
+    try:
+        with open(out_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for _, path_index, offset in positions:
+                src = sources[path_index]
+                src.seek(offset)
+                writer.writerow(json.loads(src.readline())["row"])
+    finally:
+        for src in sources:
+            if src is not None:
+                src.close()
+    return len(positions)
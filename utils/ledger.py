@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+# Batch API requests are billed at half price
+BATCH_DISCOUNT = 0.5
+
+
+def model_prices(model: str):
+    """Prices of ``model``, matching dated snapshots (``gpt-4o-mini-2024-07-18``) by prefix."""
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return MODEL_PRICES[name]
+    return MODEL_PRICES["gpt-4o-mini"]
+
+
+def request_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Dollar cost of one request; cached prompt tokens are billed at the cached-input price."""
+    input_price, cached_price, output_price = model_prices(model)
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+def usage_counts(resp) -> Dict[str, int]:
+    """Prompt, completion and cached tokens of a chat completion's ``usage`` (0 when missing)."""
+    usage = getattr(resp, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+    }
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised before a request when the run's token or dollar budget is spent."""
+
+
+class RunLedger:
+    """
+    Per-call record of token usage, latency and cost, with per-paper and run rollups.
+    Every API call (and every response-cache hit, at zero cost) is appended to ``path``
+    as one compact JSON line. With ``max_tokens`` or ``max_cost`` set, ``admit`` raises
+    ``BudgetExceeded`` once the run's spending plus the estimates of the requests still
+    in flight would pass the budget, so the engine stops starting new requests (without
+    overshooting by a window of concurrent requests) and the checkpoint journal holds
+    every finished paper.
+    Args:
+        path (str): Optional JSONL ledger file (appended to).
+        max_tokens (int): Token budget of the run (prompt + completion), or None.
+        max_cost (float): Dollar budget of the run, or None.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_tokens: Optional[int] = None,
+                 max_cost: Optional[float] = None):
+        self.path = path
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.per_paper = {}
+        self.paper_seconds = {}
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self.latency = 0.0
+        # Estimated tokens and cost of the requests admitted but not recorded yet
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def exhausted(self) -> bool:
+        """True once the token or dollar budget is spent."""
+        return ((self.max_tokens is not None and self.total_tokens >= self.max_tokens)
+                or (self.max_cost is not None and self.cost >= self.max_cost))
+
+    def check_budget(self) -> None:
+        """Raise ``BudgetExceeded`` if the budget is spent."""
+        if self.exhausted:
+            raise BudgetExceeded(f"budget reached: {self.total_tokens} tokens, ${self.cost:.4f}")
+
+    def admit(self, model: str, prompt_tokens: int, completion_tokens: int) -> Tuple[int, float]:
+        """
+        Admit one request of the estimated size, called before it is sent: raises
+        ``BudgetExceeded`` if the spending so far, the requests in flight and this one
+        would pass the budget; otherwise reserves the estimate until ``release``.
+        Returns:
+            Tuple[int, float]: The reservation (tokens, cost) to pass to ``release``.
+        """
+        tokens, cost = prompt_tokens + completion_tokens, request_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            if ((self.max_tokens is not None and self.total_tokens + self.reserved_tokens + tokens > self.max_tokens)
+                    or (self.max_cost is not None and self.cost + self.reserved_cost + cost > self.max_cost)):
+                raise BudgetExceeded(f"budget reached: {self.total_tokens} tokens, ${self.cost:.4f} spent, "
+                                     f"{self.reserved_tokens} tokens, ${self.reserved_cost:.4f} in flight")
+            self.reserved_tokens += tokens
+            self.reserved_cost += cost
+        return tokens, cost
+
+    def release(self, reservation: Tuple[int, float]) -> None:
+        """Give back the reservation of a request that was recorded or failed."""
+        with self._lock:
+            self.reserved_tokens -= reservation[0]
+            self.reserved_cost -= reservation[1]
+
+    def record(self, model: str, pmcid: Any, chunk_index: Optional[int], usage: Dict[str, int],
+               latency: float, cache_hit: bool = False, discount: float = 1.0) -> None:
+        """
+        Record one call. ``pmcid`` may be a list for a packed request, whose tokens and
+        cost are then shared evenly between the papers in the per-paper rollup.
+        """
+        prompt, completion, cached = usage["prompt_tokens"], usage["completion_tokens"], usage["cached_tokens"]
+        cost = 0.0 if cache_hit else request_cost(model, prompt, completion, cached) * discount
+        if cache_hit:
+            self.cache_hits += 1
+        else:
+            self.calls += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.cached_tokens += cached
+            self.cost += cost
+            self.latency += latency
+
+        pmcids = [str(p) for p in pmcid] if isinstance(pmcid, (list, tuple)) else [str(pmcid)]
+        share = 1 / len(pmcids)
+        for p in pmcids:
+            paper = self.per_paper.setdefault(p, [0, 0, 0.0, 0.0, 0.0])
+            if not cache_hit:
+                paper[0] += 1
+                paper[1] += prompt * share
+                paper[2] += completion * share
+                paper[3] += cost * share
+                paper[4] += latency
+        if self._file is not None:
+            self._file.write(json.dumps({
+                "t": round(time.time(), 3), "model": model, "pmcid": pmcid if len(pmcids) > 1 else pmcids[0],
+                "chunk": chunk_index, "prompt": prompt, "completion": completion, "cached": cached,
+                "latency": round(latency, 3), "cost": round(cost, 6), "hit": int(cache_hit),
+            }, separators=(",", ":")) + "\n")
+
+    def record_paper_time(self, pmcid: Any, seconds: float) -> None:
+        """Record the wall-clock time from starting a paper to having its result."""
+        self.paper_seconds[str(pmcid)] = seconds
+
+    def paper_stats(self, pmcid: Any) -> Dict[str, Any]:
+        """Rollup of one paper: calls, tokens, cost, summed call latency and wall-clock seconds."""
+        calls, prompt, completion, cost, latency = self.per_paper.get(str(pmcid), [0, 0, 0, 0.0, 0.0])
+        return {"calls": calls, "prompt_tokens": round(prompt), "completion_tokens": round(completion),
+                "cost": cost, "latency": latency, "seconds": self.paper_seconds.get(str(pmcid))}
+
+    def top_papers(self, n: int = 10) -> List[Dict[str, Any]]:
+        """The ``n`` most expensive papers of the run."""
+        ranked = sorted(self.per_paper, key=lambda p: self.per_paper[p][3], reverse=True)[:n]
+        return [dict(pmcid=p, **self.paper_stats(p)) for p in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        """Run rollup."""
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "papers": len(self.per_paper),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "cost": self.cost,
+            "mean_latency": self.latency / self.calls if self.calls else 0.0,
+            "cost_per_paper": self.cost / len(self.per_paper) if self.per_paper else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+
+def load_ledger(path: str) -> List[Dict[str, Any]]:
+    """Read the records of a ledger file, e.g. into ``pandas.DataFrame(load_ledger(path))``."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
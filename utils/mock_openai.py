@@ -0,0 +1,285 @@
+"""
+Local OpenAI-compatible stand-in for offline testing.
+Serves ``/v1/chat/completions``, ``/v1/files`` and ``/v1/batches`` with canned
+responses, so the pipeline can be exercised by pointing a client at it:
+
+    with MockOpenAIServer() as server:
+        client = OpenAI(base_url=server.base_url, api_key="test")
+
+Latency, jitter and HTTP 429 injection make it usable for load tests
+(see ``benchmarks/bench_extraction.py``).
+
+Run standalone with ``python -m utils.mock_openai --port 8000``.
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_RESULT = {
+    "subjects": ["humans"],
+    "patient_groups": [],
+    "imaging_modalities": ["DTI"],
+    "whitematter_tracts": ["Corpus Callosum"],
+    "analysis_software": [],
+    "study_type": ["single study"],
+    "diffusion_measures": ["FA"],
+    "template_space": [],
+    "results_method": [],
+    "white_integrity": [],
+    "question_of_study": [],
+}
+DEFAULT_CONTENT = json.dumps(DEFAULT_RESULT)
+
+
+def canned_responder(request_body: Dict[str, Any]) -> str:
+    """
+    Default responder: the same extraction JSON for every request, or one copy
+    per pmcid for a packed request (user payload with a "papers" list).
+    """
+    try:
+        payload = json.loads(request_body["messages"][-1]["content"])
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError):
+        return DEFAULT_CONTENT
+    if isinstance(payload, dict) and isinstance(payload.get("papers"), list):
+        return json.dumps({"results": [dict(DEFAULT_RESULT, pmcid=str(paper.get("pmcid", "")))
+                                       for paper in payload["papers"]]})
+    return DEFAULT_CONTENT
+
+
+class MockOpenAIServer:
+    """
+    Threaded HTTP server implementing the subset of the OpenAI API used by the pipeline.
+    Batches are executed immediately with ``responder`` and reported as completed
+    once ``batch_delay`` seconds have passed since their creation.
+    Chat completions take ``latency`` seconds plus uniform jitter, and a fraction
+    ``rate_limit_rate`` of them is answered with HTTP 429 and a ``retry-after-ms`` header.
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind (0 picks a free port).
+        responder (Callable): Maps a chat-completion request body to the message content.
+        batch_delay (float): Seconds a batch stays ``in_progress``.
+        latency (float): Base response time of a chat completion, in seconds.
+        jitter (float): Extra response time drawn uniformly from [0, jitter].
+        rate_limit_rate (float): Probability that a chat completion is rejected with 429.
+        retry_after_ms (int): ``retry-after-ms`` sent with a 429.
+        seed (int): Seed of the latency and 429 draws, for reproducible runs.
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 responder: Callable[[Dict[str, Any]], str] = canned_responder,
+                 batch_delay: float = 0.0,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 retry_after_ms: int = 50,
+                 seed: Optional[int] = None):
+        self.responder = responder
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.files = {}
+        self.batches = {}
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def new_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def draw_delay(self) -> float:
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+
+    def draw_rate_limited(self) -> bool:
+        with self._lock:
+            if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+                self.rate_limited_count += 1
+                return True
+            return False
+
+    # --- endpoint implementations -------------------------------------------------
+
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.request_count += 1
+        content = self.responder(body)
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": self.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def create_file(self, filename: str, purpose: str, data: bytes) -> Dict[str, Any]:
+        file_id = self.new_id("file")
+        self.files[file_id] = data
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        lines = self.files[body["input_file_id"]].decode("utf-8").splitlines()
+        output, failed = [], 0
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                response = {"status_code": 200, "request_id": self.new_id("req"),
+                            "body": self.chat_completion(request["body"])}
+                error = None
+            except Exception as e:
+                failed += 1
+                response, error = None, {"code": "server_error", "message": str(e)}
+            output.append(json.dumps({"id": self.new_id("batch_req"), "custom_id": request["custom_id"],
+                                      "response": response, "error": error}))
+        output_file = self.create_file("batch_output.jsonl", "batch_output", ("\n".join(output) + "\n").encode("utf-8"))
+        batch = {
+            "id": self.new_id("batch"), "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress", "output_file_id": None, "error_file_id": None,
+            "created_at": int(time.time()), "metadata": body.get("metadata"),
+            "request_counts": {"total": len(output), "completed": 0, "failed": 0},
+            "_ready_at": time.time() + self.batch_delay,
+            "_result": (output_file["id"], len(output) - failed, failed),
+        }
+        self.batches[batch["id"]] = batch
+        return self.retrieve_batch(batch["id"])
+
+    def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() >= batch["_ready_at"]:
+            output_file_id, completed, failed = batch["_result"]
+            batch.update(status="completed", output_file_id=output_file_id,
+                         completed_at=int(time.time()),
+                         request_counts={"total": completed + failed, "completed": completed, "failed": failed})
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+
+def _make_handler(server: MockOpenAIServer):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload: Dict[str, Any], status: int = 200,
+                       headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            path = self.path.split("?")[0]
+            body = self._read_body()
+            if path.endswith("/chat/completions"):
+                delay = server.draw_delay()
+                if delay:
+                    time.sleep(delay)
+                if server.draw_rate_limited():
+                    self._send_json({"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                               "code": "rate_limit_exceeded"}},
+                                    status=429, headers={"retry-after-ms": str(server.retry_after_ms)})
+                else:
+                    self._send_json(server.chat_completion(json.loads(body)))
+            elif path.endswith("/files"):
+                message = BytesParser(policy=default_policy).parsebytes(
+                    b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+                fields, filename, data = {}, "upload.jsonl", b""
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    if name == "file":
+                        filename = part.get_filename() or filename
+                        data = part.get_payload(decode=True)
+                    else:
+                        fields[name] = part.get_content().strip()
+                self._send_json(server.create_file(filename, fields.get("purpose", "batch"), data))
+            elif path.endswith("/batches"):
+                self._send_json(server.create_batch(json.loads(body)))
+            else:
+                self._send_json({"error": {"message": f"Unknown endpoint {path}"}}, status=404)
+
+        def do_GET(self):
+            parts = self.path.split("?")[0].rstrip("/").split("/")
+            if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in server.batches:
+                self._send_json(server.retrieve_batch(parts[-1]))
+            elif len(parts) >= 3 and parts[-1] == "content" and parts[-2] in server.files:
+                data = server.files[parts[-2]]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._send_json({"error": {"message": f"Unknown resource {self.path}"}}, status=404)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--batch-delay", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per chat completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds per chat completion")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    mock = MockOpenAIServer(args.host, args.port, batch_delay=args.batch_delay, latency=args.latency,
+                            jitter=args.jitter, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    print(f"Mock OpenAI server listening on {mock.base_url}")
+    try:
+        mock._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
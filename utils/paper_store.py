@@ -0,0 +1,123 @@
+import json
+import mmap
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+INDEX_SUFFIX = ".idx"
+
+
+def write_paper_store(papers: Iterable[Dict[str, Any]], path: str) -> int:
+    """
+    Write papers as a line-delimited JSON store with a pmcid -> (offset, length) index.
+    The store is ``path`` (one paper per line) and the index is ``path + ".idx"``,
+    a JSON object keeping the papers' order.
+    Args:
+        papers (Iterable[Dict[str, Any]]): Papers to write, consumed lazily.
+        path (str): Output store path, e.g. ``whitematter_data.jsonl``.
+    Returns:
+        int: Number of papers written.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    index = {}
+    offset = 0
+    with open(path, "wb") as f:
+        for paper in papers:
+            line = (json.dumps(paper, ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            index[str(paper.get("pmcid", ""))] = [offset, len(line)]
+            offset += len(line)
+    with open(path + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return len(index)
+
+
+def write_store_index(path: str, pmcids: Iterable[Any]) -> int:
+    """
+    Build the index of a line-delimited store written by another tool (e.g.
+    ``DataFrame.to_json(lines=True)``). ``pmcids`` must follow the line order.
+    Returns:
+        int: Number of papers indexed.
+    """
+    index = {}
+    offset = 0
+    with open(path, "rb") as f:
+        for pmcid, line in zip(pmcids, f):
+            index[str(pmcid)] = [offset, len(line)]
+            offset += len(line)
+    with open(path + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return len(index)
+
+
+class PaperStore:
+    """
+    Read access to a store written by ``write_paper_store``.
+    Iterating streams the papers one at a time in store order; ``get(pmcid)``
+    fetches a single paper in O(1) through a memory map of the store file.
+
+        store = PaperStore("data/processed/whitematter_data.jsonl")
+        paper = store.get("PMC1234567")
+        extract_all(store.iter_range(0, 100))
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self._offsets = None
+        self._file = None
+        self._mmap = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, pmcid: Any) -> bool:
+        return str(pmcid) in self.index
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def pmcids(self) -> List[str]:
+        """All pmcids in store order."""
+        return list(self.index)
+
+    def _map(self) -> mmap.mmap:
+        if self._mmap is None:
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def get(self, pmcid: Any) -> Optional[Dict[str, Any]]:
+        """Return one paper by pmcid, or None if it is not in the store."""
+        entry = self.index.get(str(pmcid))
+        if entry is None:
+            return None
+        offset, length = entry
+        return json.loads(self._map()[offset:offset + length])
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Stream the papers at positions ``start`` to ``end`` (exclusive) without reading the ones before."""
+        if self._offsets is None:
+            self._offsets = [offset for offset, _ in self.index.values()]
+        positions = range(len(self._offsets))[start:end]
+        if not positions:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[positions[0]])
+            for _ in positions:
+                yield json.loads(f.readline())
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    def __enter__(self) -> "PaperStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,167 @@
+"""
+Dry-run planner: tokenizes the chunks every processing mode would send, without
+calling the API, and estimates requests, tokens, cost and wall-clock time per mode.
+
+    python cli.py plan --data data/processed/whitematter_data.jsonl --rpm 500 --tpm 200000
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from prompts.brain_extraction import SYSTEM_PROMPT, PACKED_SYSTEM_PROMPT
+from utils import tokens
+from utils.chunking import MAX_SINGLE_REQUEST_TOKENS, build_chunks, process_full_data, split_sections
+from utils.ledger import BATCH_DISCOUNT, request_cost
+from utils.prefilter import ChunkFilter
+from utils.rate_limiter import DEFAULT_RPM, DEFAULT_TPM
+from utils.tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+# Context window per model, in tokens
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o-mini": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-4.1-nano": 1_047_576,
+}
+# Typical completion of one extraction request (11 short lists of strings)
+EXPECTED_OUTPUT_TOKENS = 150
+# Typical latency of one request, used for the concurrency bound on wall-clock time
+EXPECTED_LATENCY_SECONDS = 3.0
+
+
+def context_window(model: str) -> int:
+    for name in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return MODEL_CONTEXT_TOKENS[name]
+    return MODEL_CONTEXT_TOKENS["gpt-4o-mini"]
+
+
+def _payload_tokens(payload: Dict[str, Any], model: str) -> int:
+    """Tokens of the user message of one request (system prompt excluded)."""
+    return count_tokens(json.dumps(payload, ensure_ascii=False), model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def plan_corpus(papers: Iterable[Dict[str, Any]],
+                model: str = "gpt-4o-mini",
+                modes: Iterable[int] = (1, 2, 3),
+                max_chunk_tokens: Optional[int] = None,
+                chunk_filter: Optional[ChunkFilter] = None,
+                pack_size: int = 1,
+                rpm: int = DEFAULT_RPM,
+                tpm: int = DEFAULT_TPM,
+                max_concurrency: int = 8,
+                output_tokens: int = EXPECTED_OUTPUT_TOKENS,
+                latency: float = EXPECTED_LATENCY_SECONDS) -> Dict[str, Any]:
+    """
+    Estimate what extracting ``papers`` would cost in each processing mode.
+    Every paper goes through ``process_full_data`` exactly as in ``extract_all`` and
+    every chunk is tokenized locally (tiktoken when installed, else ~4 chars/token).
+    Each paper's body is filtered by ``chunk_filter`` once and shared by all modes, so
+    its stats count every paper once.
+    Args:
+        papers (Iterable[Dict[str, Any]]): Papers to plan for; streamed once.
+        model (str): Model whose prices and context window are used.
+        modes (Iterable[int]): Processing modes to estimate.
+        max_chunk_tokens (int): Token budget per body chunk, as in ``extract_all``.
+        chunk_filter (ChunkFilter): Optional pre-filter applied in modes 1 and 2.
+        pack_size (int): Papers per request in mode 3.
+        rpm (int): Requests per minute limit.
+        tpm (int): Tokens per minute limit.
+        max_concurrency (int): Requests in flight, bounding throughput by ``latency``.
+        output_tokens (int): Expected completion tokens per paper and request.
+        latency (float): Expected seconds per request.
+    Returns:
+        Dict[str, Any]: ``{"papers": n, "modes": {mode: estimate}, "overflow": [...]}`` where
+        ``overflow`` lists the papers whose unchunked mode-1 request exceeds the context window.
+    """
+    modes = list(modes)
+    window = context_window(model)
+    system_tokens = count_tokens(SYSTEM_PROMPT, model) + MESSAGE_OVERHEAD_TOKENS
+    packed_system_tokens = count_tokens(PACKED_SYSTEM_PROMPT, model) + MESSAGE_OVERHEAD_TOKENS
+    totals = {mode: {"requests": 0, "input_tokens": 0, "output_tokens": 0, "max_request_tokens": 0}
+              for mode in modes}
+    overflow = []
+    pack = []
+    n_papers = 0
+
+    def add(mode: int, request_tokens: int, n_outputs: int = 1) -> None:
+        total = totals[mode]
+        total["requests"] += 1
+        total["input_tokens"] += request_tokens
+        total["output_tokens"] += output_tokens * n_outputs
+        total["max_request_tokens"] = max(total["max_request_tokens"], request_tokens)
+
+    def flush_pack() -> None:
+        if pack:
+            add(3, packed_system_tokens + _payload_tokens({"papers": list(pack)}, model), len(pack))
+            pack.clear()
+
+    for paper in papers:
+        n_papers += 1
+        pmcid = str(paper.get("pmcid", ""))
+        sections = None
+        if chunk_filter is not None:
+            body = paper.get("body")
+            sections = chunk_filter.filter_sections(split_sections(str(body) if body is not None else ""), pmcid)
+        # The paper as a single mode-1 request, before any overflow fallback
+        full_data, _ = process_full_data(paper, 1, max_chunk_tokens=float("inf"), sections=sections)
+        full_tokens = count_tokens(full_data, model)
+        single_tokens = system_tokens + _payload_tokens({"body": full_data}, model) + output_tokens
+        if single_tokens > window:
+            overflow.append({"pmcid": pmcid, "tokens": single_tokens})
+        for mode in modes:
+            if mode == 3 and pack_size > 1:
+                pack.append({"pmcid": pmcid, "body": build_chunks(paper, 3)[0]})
+                if len(pack) >= pack_size:
+                    flush_pack()
+                continue
+            if mode == 1 and full_tokens <= (max_chunk_tokens or MAX_SINGLE_REQUEST_TOKENS):
+                chunks = [full_data]  # what build_chunks returns, without splitting and filtering twice
+            else:
+                chunks = build_chunks(paper, mode, max_chunk_tokens, sections=sections)
+            for chunk in chunks:
+                add(mode, system_tokens + _payload_tokens({"body": chunk}, model))
+    if 3 in modes:
+        flush_pack()
+
+    estimates = {}
+    for mode, total in totals.items():
+        cost = request_cost(model, total["input_tokens"], total["output_tokens"])
+        # Wall-clock time is set by the slowest of the RPM, TPM and concurrency limits
+        bounds = {"rpm": total["requests"] / rpm,
+                  "tpm": (total["input_tokens"] + total["output_tokens"]) / tpm,
+                  "concurrency": total["requests"] * latency / max(1, max_concurrency) / 60}
+        limited_by = max(bounds, key=bounds.get)
+        estimates[mode] = dict(total,
+                               requests_per_paper=total["requests"] / n_papers if n_papers else 0.0,
+                               cost=cost,
+                               batch_cost=cost * BATCH_DISCOUNT,
+                               minutes=bounds[limited_by],
+                               limited_by=limited_by)
+    return {"papers": n_papers, "model": model, "context_window": window,
+            "exact_tokens": tokens.tiktoken is not None, "modes": estimates, "overflow": overflow}
+
+
+def print_plan(plan: Dict[str, Any], max_overflow: int = 20) -> None:
+    """Print the estimates of ``plan_corpus`` as a table, one row per mode."""
+    print(f"Plan for {plan['papers']} papers with {plan['model']} "
+          f"({'tiktoken' if plan['exact_tokens'] else 'estimated'} token counts)")
+    print(f"{'mode':>4} {'requests':>10} {'req/paper':>9} {'input tok':>12} {'output tok':>11} "
+          f"{'cost $':>9} {'batch $':>9} {'hours':>7}  limited by")
+    for mode, est in sorted(plan["modes"].items()):
+        print(f"{mode:>4} {est['requests']:>10} {est['requests_per_paper']:>9.2f} {est['input_tokens']:>12} "
+              f"{est['output_tokens']:>11} {est['cost']:>9.2f} {est['batch_cost']:>9.2f} "
+              f"{est['minutes'] / 60:>7.2f}  {est['limited_by']}")
+    overflow = plan["overflow"]
+    if overflow:
+        print(f"{len(overflow)} papers exceed the {plan['context_window']}-token context window in mode 1 "
+              f"(extract_all falls back to body chunks for them):")
+        for entry in sorted(overflow, key=lambda e: e["tokens"], reverse=True)[:max_overflow]:
+            print(f"  {entry['pmcid']}: {entry['tokens']} tokens")
+        if len(overflow) > max_overflow:
+            print(f"  ... and {len(overflow) - max_overflow} more")
+
+
+def plan_rows(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten the estimates into one row per mode, e.g. for ``pandas.DataFrame``."""
+    return [dict(mode=mode, **est) for mode, est in sorted(plan["modes"].items())]
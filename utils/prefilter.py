@@ -0,0 +1,118 @@
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+from utils.tokens import count_tokens
+
+# Section headings that never contain the fields of SYSTEM_PROMPT
+SKIP_HEADINGS = [
+    "acknowledgement", "acknowledgment", "acknowledgements", "acknowledgments",
+    "funding", "financial support", "financial disclosure", "disclosure", "disclosures",
+    "conflict of interest", "conflicts of interest", "competing interest", "competing interests",
+    "declaration of competing interest", "declaration of interest", "declarations",
+    "data availability", "data availability statement", "availability of data and materials",
+    "code availability", "references", "bibliography", "author contributions", "authors' contributions",
+    "ethics statement", "ethics approval", "consent for publication", "abbreviations",
+    "supplementary material", "supplementary materials", "supplementary data", "footnotes",
+    "publisher's note",
+]
+
+# Terms that signal a section may hold extractable fields, taken from the prompt examples.
+# Short abbreviations are matched case-sensitively, everything else case-insensitively.
+DEFAULT_VOCABULARY = [
+    # imaging modalities and diffusion measures
+    "MRI", "fMRI", "DTI", "DWI", "DKI", "NODDI", "HARDI", "PET", "CT", "SPECT", "MEG", "EEG",
+    "diffusion", "tractography", "tensor", "anisotropy", "diffusivity", "FA", "MD", "AD", "RD",
+    "MK", "NDI", "ODI", "T1-weighted", "T2-weighted", "FLAIR", "b-value", "voxel",
+    # white matter tracts
+    "white matter", "fasciculus", "fasciculi", "corpus callosum", "cingulum", "fornix", "forceps",
+    "corticospinal", "internal capsule", "external capsule", "corona radiata", "thalamic radiation",
+    "uncinate", "arcuate", "genu", "splenium", "SLF", "ILF", "IFOF", "ATR", "CST",
+    # software and templates
+    "FSL", "TBSS", "FreeSurfer", "SPM", "AFNI", "DIPY", "MRtrix", "ANTs", "DSI Studio",
+    "MNI", "Talairach", "JHU", "atlas", "template",
+    # subjects, groups and statistics
+    "participants", "patients", "controls", "subjects", "mice", "rats", "monkeys",
+    "t-test", "ANOVA", "MANOVA", "regression", "correlation", "effect size", "p <", "p<",
+]
+
+
+def alternation(terms: Iterable[str]) -> str:
+    """
+    Regex alternation of ``terms``, escaped and longest first, so that the longest form
+    at a position wins ("diffusion tensor imaging" before "diffusion"). Ties are sorted
+    so the pattern is the same in every process.
+    """
+    return "|".join(re.escape(term) for term in sorted(set(terms), key=lambda term: (-len(term), term)))
+
+
+class ChunkFilter:
+    """
+    Lexical pre-filter that drops body sections before they are sent to the model.
+    A section is skipped when its heading is one of ``skip_headings`` or when a
+    single compiled multi-pattern scan finds fewer than ``min_hits`` vocabulary
+    terms in it. The title/abstract/keywords chunk is never filtered.
+    Dropped sections and their tokens are counted per paper and for the run.
+    Args:
+        skip_headings (List[str]): Section headings to skip (case-insensitive, numbering ignored).
+        vocabulary (List[str]): Terms that make a section worth sending.
+        min_hits (int): Minimum number of vocabulary matches; 0 disables the vocabulary scan.
+    """
+
+    def __init__(self,
+                 skip_headings: List[str] = SKIP_HEADINGS,
+                 vocabulary: List[str] = DEFAULT_VOCABULARY,
+                 min_hits: int = 1):
+        self.min_hits = min_hits
+        self._heading_re = re.compile(
+            r"^\s*(?:[\dIVX]+\.?\s*)*(?:" + alternation(skip_headings) + r")\s*:?\s*$", re.IGNORECASE)
+        abbreviations = [term for term in vocabulary if len(term) <= 5 and term.isupper()]
+        words = [term for term in vocabulary if term not in abbreviations]
+        self._vocabulary_re = re.compile(
+            r"(?<!\w)(?:" + alternation(abbreviations) + r")(?!\w)"
+            + r"|(?i:(?<!\w)(?:" + alternation(words) + r"))")
+        self.per_paper = {}
+        self.sections_seen = 0
+        self.sections_dropped = 0
+        self.tokens_saved = 0
+
+    def skip_reason(self, section: str) -> str:
+        """Return why a section should be skipped ("heading" or "vocabulary"), or "" to keep it."""
+        heading = section.strip().split("\n", 1)[0][:120]
+        if self._heading_re.match(heading):
+            return "heading"
+        if self.min_hits:
+            hits = 0
+            for _ in self._vocabulary_re.finditer(section):
+                hits += 1
+                if hits >= self.min_hits:
+                    return ""
+            return "vocabulary"
+        return ""
+
+    def filter_sections(self, sections: List[str], pmcid: Any = None) -> List[str]:
+        """Return the sections worth sending and record what was dropped for ``pmcid``."""
+        kept, dropped, tokens = [], 0, 0
+        for section in sections:
+            if self.skip_reason(section):
+                dropped += 1
+                tokens += count_tokens(section)
+            else:
+                kept.append(section)
+        self.per_paper[str(pmcid)] = (len(sections), dropped, tokens)
+        self.sections_seen += len(sections)
+        self.sections_dropped += dropped
+        self.tokens_saved += tokens
+        return kept
+
+    def stats(self) -> Dict[str, Any]:
+        """Run totals of the filter."""
+        return {
+            "papers": len(self.per_paper),
+            "sections_seen": self.sections_seen,
+            "sections_dropped": self.sections_dropped,
+            "tokens_saved": self.tokens_saved,
+        }
+
+    def paper_stats(self, pmcid: Any) -> Tuple[int, int, int]:
+        """(sections seen, sections dropped, tokens saved) for one paper."""
+        return self.per_paper.get(str(pmcid), (0, 0, 0))
@@ -0,0 +1,146 @@
+"""
+Opt-in sampling profiler for whole runs. A background thread records the Python
+stack of the profiled thread every ``interval`` seconds, so its cost does not grow
+with the number of function calls (unlike ``cProfile``) and a long extraction can be
+profiled as it runs.
+
+    with SamplingProfiler(interval=0.005) as profiler:
+        extract_all(papers, processing_mode=2)
+    print(profiler.report())              # hottest functions and call paths
+    profiler.write_folded("run.folded")   # flame graph input (speedscope, flamegraph.pl)
+
+Time the event loop spends waiting on the network shows up in the selector's
+``select``, so the report also tells how much of a run is waiting rather than Python work.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_INTERVAL = 0.005
+# Frames kept per sample, innermost first
+MAX_DEPTH = 64
+# Innermost frames shown per hot path in the report
+PATH_FRAMES = 6
+
+
+def _short_path(filename: str) -> str:
+    """``package/module.py``: enough to tell ``json/__init__.py`` from ``utils/__init__.py``."""
+    return os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+
+
+class SamplingProfiler:
+    """
+    Samples call stacks and aggregates them per function and per call path.
+    ``self`` counts a function when it is the innermost frame of a sample, ``total``
+    when it is anywhere on the stack (recursion counted once).
+    Args:
+        interval (float): Seconds between samples.
+        all_threads (bool): Sample every thread (each stack rooted at its thread name)
+            instead of only the thread that calls ``start``, which runs the event loop.
+        max_depth (int): Frames kept per sample.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, all_threads: bool = False, max_depth: int = MAX_DEPTH):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.max_depth = max_depth
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.stacks = Counter()
+        self.duration = 0.0
+        self._labels = {}
+        self._target = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._started = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration += time.perf_counter() - self._started
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> bool:
+        self.stop()
+        return False
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.all_threads:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                targets = [(names.get(ident, str(ident)), frame) for ident, frame in frames.items() if ident != own]
+            else:
+                targets = [(None, frames.get(self._target))]
+            for thread_name, frame in targets:
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                if thread_name is not None:
+                    stack.append(f"thread {thread_name}")
+                stack = tuple(reversed(stack))
+                self.samples += 1
+                self.self_counts[stack[-1]] += 1
+                self.total_counts.update(set(stack))
+                self.stacks[stack] += 1
+
+    def top_functions(self, n: int = 20) -> List[Tuple[str, int, int]]:
+        """``(function, self samples, total samples)`` of the ``n`` functions with most self samples."""
+        return [(label, count, self.total_counts[label]) for label, count in self.self_counts.most_common(n)]
+
+    def hot_paths(self, n: int = 10, frames: int = PATH_FRAMES) -> List[Tuple[Tuple[str, ...], int]]:
+        """The ``n`` most sampled call paths, cut to their innermost ``frames`` frames."""
+        paths = Counter()
+        for stack, count in self.stacks.items():
+            paths[stack[-frames:]] += count
+        return paths.most_common(n)
+
+    def report(self, top: int = 20, paths: int = 10) -> str:
+        """Text report: functions by self time, then the hottest call paths."""
+        samples = max(1, self.samples)
+        lines = [f"{self.samples} samples over {self.duration:.1f}s (every {self.interval * 1000:g}ms)", "",
+                 f"{'self %':>7}{'total %':>9}  function"]
+        for label, own, total in self.top_functions(top):
+            lines.append(f"{own / samples:>7.1%}{total / samples:>9.1%}  {label}")
+        lines += ["", "Hot paths (innermost frames):"]
+        for path, count in self.hot_paths(paths):
+            lines.append(f"{count / samples:>7.1%}  " + " > ".join(path))
+        return "\n".join(lines)
+
+    def write_folded(self, path: str) -> None:
+        """Write the stacks in the folded format (``a;b;c count`` per line) read by flame graph tools."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(";".join(frame.replace(";", ",") for frame in stack) + f" {count}\n")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"samples": self.samples, "duration": self.duration, "interval": self.interval,
+                "functions": len(self.self_counts)}
@@ -0,0 +1,154 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Mapping, Optional
+
+# Default limits for gpt-4o-mini on a tier-1 account; corrected from the
+# x-ratelimit-* response headers as soon as the first response arrives.
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+# Expected completion size used when reserving tokens before a request
+DEFAULT_MAX_OUTPUT_TOKENS = 400
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as ``"20ms"``, ``"1s"`` or ``"6m0s"`` into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]], attempt: int) -> float:
+    """Return how long to wait after a 429: ``retry-after(-ms)`` if sent, else exponential backoff with jitter."""
+    if headers:
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        delay = parse_duration(headers.get("retry-after"))
+        if delay is not None:
+            return delay
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class TokenBucket:
+    """A bucket holding up to ``capacity`` units, refilled continuously at ``capacity`` per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float = 1.0) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0 * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, scale: float = 1.0) -> float:
+        """Seconds until ``amount`` units are available (requests larger than the bucket wait for a full one)."""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.capacity / 60.0 * scale)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by all extraction calls.
+    Every request reserves one request and its estimated token cost before it is
+    sent. The budgets are corrected from the x-ratelimit-* response headers, a 429
+    pauses all callers for the Retry-After delay and halves the refill rate, and
+    each success then recovers the rate additively.
+    Args:
+        rpm (int): Requests per minute allowed for the account/model.
+        tpm (int): Tokens per minute allowed for the account/model.
+        max_output_tokens (int): Completion tokens reserved per request.
+        min_scale (float): Lowest fraction of the nominal rate used after repeated 429s.
+    """
+
+    def __init__(self,
+                 rpm: int = DEFAULT_RPM,
+                 tpm: int = DEFAULT_TPM,
+                 max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+                 min_scale: float = 0.1):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_output_tokens = max_output_tokens
+        self.min_scale = min_scale
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        """Take one request and ``tokens`` tokens if available; otherwise return the delay to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.requests.refill(now, self.scale)
+            self.tokens.refill(now, self.scale)
+            delay = max(self.requests.wait_time(1, self.scale), self.tokens.wait_time(tokens, self.scale))
+            if delay > 0:
+                return delay
+            self.requests.level -= 1
+            self.tokens.level -= min(tokens, self.tokens.capacity)
+            return 0.0
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of ``tokens`` estimated tokens may be sent."""
+        while True:
+            delay = self._reserve(tokens)
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int) -> None:
+        """Async version of ``acquire``."""
+        while True:
+            delay = self._reserve(tokens)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Adopt the account's real limits and remaining budget from the x-ratelimit-* headers."""
+        if not headers:
+            return
+        with self._lock:
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                try:
+                    if limit is not None:
+                        bucket.capacity = float(limit)
+                    if remaining is not None:
+                        bucket.level = min(bucket.level, float(remaining))
+                except ValueError:
+                    continue
+
+    def record_success(self, estimated_tokens: int, actual_tokens: Optional[int] = None) -> None:
+        """Recover the rate after a successful call and settle the token estimate against real usage."""
+        with self._lock:
+            self.scale = min(1.0, self.scale + 0.05)
+            if actual_tokens is not None:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated_tokens - actual_tokens)
+
+    def record_rate_limited(self, retry_after: float) -> None:
+        """Pause every caller for ``retry_after`` seconds and halve the refill rate."""
+        with self._lock:
+            self.rate_limited += 1
+            self.scale = max(self.min_scale, self.scale / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
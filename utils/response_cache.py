@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = "data/cache/llm_responses.sqlite"
+# Eviction runs after this many writes when a size or age limit is set
+EVICT_EVERY = 200
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of LLM completions stored in SQLite.
+    Entries are keyed by a SHA-256 of the model, system prompt and serialized user
+    payload, so a rerun with unchanged inputs (at ``temperature=0``) is answered
+    locally instead of calling the API.
+    Args:
+        path (str): SQLite file holding the cache.
+        max_bytes (int): Evict least recently used entries beyond this total content size.
+        max_age_days (float): Evict entries older than this.
+        read_only (bool): Only serve hits, never write or evict.
+    """
+
+    def __init__(self,
+                 path: str = DEFAULT_CACHE_PATH,
+                 max_bytes: Optional[int] = None,
+                 max_age_days: Optional[float] = None,
+                 read_only: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                      key TEXT PRIMARY KEY,
+                                      model TEXT,
+                                      content TEXT,
+                                      size INTEGER,
+                                      created_at REAL,
+                                      last_used REAL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_payload: Dict[str, Any], **request_options: Any) -> str:
+        """Hash everything that determines the completion into a cache key."""
+        blob = json.dumps([model, system_prompt, user_payload, request_options],
+                          sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached content for ``key`` or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, model: str, content: str) -> None:
+        """Store a completion (no-op in read-only mode)."""
+        if self.read_only or content is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, model, content, len(content.encode("utf-8")), now, now))
+            self._conn.commit()
+            self.writes += 1
+        if self.writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Apply the age and size limits. Returns the number of entries removed."""
+        if self.read_only or (self.max_bytes is None and self.max_age_days is None):
+            return 0
+        removed = 0
+        with self._lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used")
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                removed += len(stale)
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this session and the current cache size."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        self.evict()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,404 @@
+"""
+Inverted index over extraction results, for faceted queries without scanning the CSV.
+
+    index = ResultIndex("data/index/results.sqlite")
+    index.update_from_csv("extracted_info.csv")
+    index.search('imaging_modalities:DTI AND diffusion_measures:FA AND white_integrity:decrease '
+                 'AND whitematter_tracts:"Uncinate Fasciculus" AND subjects:humans')
+    index.facets("patient_groups", query="whitematter_tracts:Cingulum")
+
+Every paper gets a doc id and every (field, value) a posting list stored as a
+bitmap over doc ids (a Python int, bit i = doc i), so AND/OR/NOT are single integer
+operations and facet counts are popcounts of intersections.
+"""
+import csv
+import itertools
+import os
+import re
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from prompts.brain_extraction import EXTRACTION_FIELDS
+from utils.journal import iter_journal
+from utils.vocabulary import VocabularyExtractor
+
+DEFAULT_INDEX_PATH = "data/index/results.sqlite"
+# Rows indexed together by ``add_rows``: each posting list is rebuilt once per batch
+# instead of once per paper, which would copy the whole bitmap every time
+ADD_BATCH_SIZE = 50_000
+
+
+def popcount(bitmap: int) -> int:
+    return bitmap.bit_count() if hasattr(bitmap, "bit_count") else bin(bitmap).count("1")
+
+
+def bitmap_of(docs: List[int]) -> int:
+    """Bitmap with the bits of ``docs`` set, built in one pass over a byte buffer."""
+    if not docs:
+        return 0
+    low = min(docs)
+    buffer = bytearray((max(docs) - low) // 8 + 1)
+    for doc in docs:
+        buffer[(doc - low) >> 3] |= 1 << ((doc - low) & 7)
+    return int.from_bytes(buffer, "little") << low
+
+
+def iter_bits(bitmap: int):
+    """Doc ids set in ``bitmap``, in increasing order."""
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+
+class Query:
+    """Node of a query; combine with ``&`` (AND), ``|`` (OR) and ``~`` (NOT)."""
+
+    def bitmap(self, index: "ResultIndex") -> int:
+        raise NotImplementedError
+
+    def __and__(self, other: "Query") -> "Query":
+        return And(self, other)
+
+    def __or__(self, other: "Query") -> "Query":
+        return Or(self, other)
+
+    def __invert__(self) -> "Query":
+        return Not(self)
+
+
+class Term(Query):
+    """Papers whose ``field`` contains ``value`` (matched after normalization)."""
+
+    def __init__(self, field: str, value: str):
+        self.field, self.value = field, value
+
+    def bitmap(self, index: "ResultIndex") -> int:
+        return index.posting(self.field, self.value)
+
+    def __repr__(self) -> str:
+        return f"Term({self.field!r}, {self.value!r})"
+
+
+class And(Query):
+    def __init__(self, *queries: Query):
+        self.queries = queries
+
+    def bitmap(self, index: "ResultIndex") -> int:
+        result = index.all_docs
+        for query in self.queries:
+            result &= query.bitmap(index)
+        return result
+
+
+class Or(Query):
+    def __init__(self, *queries: Query):
+        self.queries = queries
+
+    def bitmap(self, index: "ResultIndex") -> int:
+        result = 0
+        for query in self.queries:
+            result |= query.bitmap(index)
+        return result
+
+
+class Not(Query):
+    def __init__(self, query: Query):
+        self.query = query
+
+    def bitmap(self, index: "ResultIndex") -> int:
+        return index.all_docs & ~self.query.bitmap(index)
+
+
+_TOKEN_RE = re.compile(r'\(|\)|[^\s():"]+:"[^"]*"|[^\s()]+')
+
+
+def parse_query(text: str) -> Query:
+    """
+    Parse ``field:value`` terms combined with AND, OR, NOT and parentheses (NOT binds
+    tightest, then AND, then OR). Values with spaces are quoted: ``whitematter_tracts:"Uncinate Fasciculus"``.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    pos = 0
+
+    def peek() -> Optional[str]:
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take() -> str:
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError(f"Unexpected end of query: {text!r}")
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or() -> Query:
+        queries = [parse_and()]
+        while peek() == "OR":
+            take()
+            queries.append(parse_and())
+        return queries[0] if len(queries) == 1 else Or(*queries)
+
+    def parse_and() -> Query:
+        queries = [parse_not()]
+        while peek() == "AND":
+            take()
+            queries.append(parse_not())
+        return queries[0] if len(queries) == 1 else And(*queries)
+
+    def parse_not() -> Query:
+        if peek() == "NOT":
+            take()
+            return Not(parse_not())
+        token = take()
+        if token == "(":
+            query = parse_or()
+            if take() != ")":
+                raise ValueError(f"Missing ')' in query: {text!r}")
+            return query
+        field, sep, value = token.partition(":")
+        if not sep or not value:
+            raise ValueError(f"Expected field:value, got {token!r}")
+        return Term(field, value.strip('"'))
+
+    query = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected {peek()!r} in query: {text!r}")
+    return query
+
+
+class ResultIndex:
+    """
+    Persistent inverted index of extraction results: one bitmap posting list per
+    (field, value) over doc ids assigned to pmcids in insertion order.
+    Values are normalized before indexing and querying: closed-vocabulary fields map
+    synonyms to their canonical label ("Diffusion Tensor Imaging" -> DTI, see
+    ``utils.vocabulary``) and all values are compared case-insensitively.
+    Adding a pmcid again replaces its values, so updates are idempotent. ``save``
+    writes only the docs and posting lists changed since the last save.
+    Args:
+        path (str): SQLite file holding the index (created if missing).
+        fields (List[str]): Indexed fields, defaults to ``EXTRACTION_FIELDS``.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, fields: Optional[List[str]] = None):
+        self.path = path
+        self.fields = list(fields or EXTRACTION_FIELDS)
+        self._vocabulary = VocabularyExtractor()
+        self.pmcids = []
+        self.doc_ids = {}
+        self.postings = {field: {} for field in self.fields}
+        self.labels = {field: {} for field in self.fields}
+        self.all_docs = 0
+        self._saved_docs = 0
+        self._dirty = set()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, pmcid TEXT)")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS postings (
+                                  field TEXT,
+                                  value TEXT,
+                                  label TEXT,
+                                  bitmap BLOB,
+                                  PRIMARY KEY (field, value))""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._load()
+
+    def _load(self) -> None:
+        for doc, pmcid in self._conn.execute("SELECT doc, pmcid FROM docs ORDER BY doc"):
+            self.doc_ids[pmcid] = doc
+            self.pmcids.append(pmcid)
+        self.all_docs = (1 << len(self.pmcids)) - 1
+        self._saved_docs = len(self.pmcids)
+        for field, value, label, blob in self._conn.execute("SELECT field, value, label, bitmap FROM postings"):
+            if field in self.postings:
+                self.postings[field][value] = int.from_bytes(blob, "little")
+                self.labels[field][value] = label
+
+    def normalize(self, field: str, value: str) -> str:
+        """Key of a value in the posting lists of ``field``."""
+        value = " ".join(str(value).split())
+        if field in self._vocabulary.fields:
+            value = self._vocabulary.canonical(field, value)
+        return value.casefold()
+
+    def _check_field(self, field: str) -> None:
+        if field not in self.postings:
+            raise ValueError(f"Unknown field {field!r}, expected one of {self.fields}")
+
+    def add(self, pmcid: Any, data: Dict[str, Union[List[str], str]]) -> int:
+        """
+        Index (or re-index) one paper. Field values are lists, or ";"-joined strings as
+        in the CSV. Returns the doc id of the paper.
+        """
+        pmcid = str(pmcid)
+        self._add_batch({pmcid: data})
+        return self.doc_ids[pmcid]
+
+    def _add_batch(self, rows: Dict[str, Dict[str, Union[List[str], str]]]) -> None:
+        """Index ``{pmcid: data}``, setting the bits of all the papers of a posting list at once."""
+        readded = []
+        for pmcid in rows:
+            doc = self.doc_ids.get(pmcid)
+            if doc is None:
+                self.doc_ids[pmcid] = len(self.pmcids)
+                self.pmcids.append(pmcid)
+            else:
+                readded.append(doc)
+        self.all_docs = (1 << len(self.pmcids)) - 1
+        if readded:
+            # Drop the old values of re-added papers, in one pass over the posting lists
+            mask = bitmap_of(readded)
+            for field in self.fields:
+                for value, bitmap in self.postings[field].items():
+                    if bitmap & mask:
+                        self.postings[field][value] = bitmap & ~mask
+                        self._dirty.add((field, value))
+        docs = {}
+        for pmcid, data in rows.items():
+            doc = self.doc_ids[pmcid]
+            for field in self.fields:
+                values = data.get(field) or []
+                if isinstance(values, str):
+                    values = values.split(";")
+                for value in values:
+                    if not str(value).strip():
+                        continue
+                    key = self.normalize(field, value)
+                    docs.setdefault((field, key), []).append(doc)
+                    self.labels[field].setdefault(key, " ".join(str(value).split()))
+        for (field, key), doc_list in docs.items():
+            self.postings[field][key] = self.postings[field].get(key, 0) | bitmap_of(doc_list)
+            self._dirty.add((field, key))
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]], batch_size: int = ADD_BATCH_SIZE) -> int:
+        """
+        Index CSV rows (or any dicts with ``pmcid`` and the fields), ``batch_size`` at a
+        time. A pmcid seen again replaces its earlier values. Returns the number of rows.
+        """
+        n_rows = 0
+        rows = iter(rows)
+        while True:
+            batch = {}
+            for row in itertools.islice(rows, batch_size):
+                # The last row of a pmcid wins, as if the rows were added one by one
+                batch[str(row["pmcid"])] = row
+                n_rows += 1
+            if not batch:
+                return n_rows
+            self._add_batch(batch)
+
+    def update_from_csv(self, csv_path: str) -> int:
+        """Index every row of an output CSV."""
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            n_rows = self.add_rows(csv.DictReader(f))
+        self.save()
+        return n_rows
+
+    def update_from_journal(self, journal_path: str) -> int:
+        """
+        Index the records appended to a checkpoint journal since the last update, so a
+        running or resumed extraction can be indexed as it goes. Returns the number of records.
+        """
+        key = f"journal:{os.path.abspath(journal_path)}"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        start = int(row[0]) if row else 0
+        if not os.path.exists(journal_path) or os.path.getsize(journal_path) < start:
+            start = 0  # the journal was started over
+        last = None
+
+        def journal_rows():
+            nonlocal last
+            for offset, record in iter_journal(journal_path, start):
+                last = offset
+                yield record["row"]
+
+        n_records = self.add_rows(journal_rows())
+        if last is not None:
+            with open(journal_path, "rb") as f:
+                f.seek(last)
+                f.readline()
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(f.tell())))
+        self.save()
+        return n_records
+
+    def update_from_parquet(self, parquet_path: str) -> int:
+        """Index a Parquet dataset written with ``out_parquet`` (list columns, needs pyarrow)."""
+        from utils.columnar import read_results
+
+        table = read_results(parquet_path, columns=["pmcid"] + self.fields)
+        n_rows = self.add_rows(table.to_pylist())
+        self.save()
+        return n_rows
+
+    def save(self) -> None:
+        """Write the docs and posting lists changed since the last save."""
+        self._conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?)",
+                               [(doc, self.pmcids[doc]) for doc in range(self._saved_docs, len(self.pmcids))])
+        rows = []
+        for field, value in self._dirty:
+            bitmap = self.postings[field][value]
+            rows.append((field, value, self.labels[field][value],
+                         bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")))
+        self._conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?)", rows)
+        self._conn.commit()
+        self._saved_docs = len(self.pmcids)
+        self._dirty.clear()
+
+    def close(self) -> None:
+        self.save()
+        self._conn.close()
+
+    def posting(self, field: str, value: str) -> int:
+        """Bitmap of the papers whose ``field`` contains ``value``."""
+        self._check_field(field)
+        return self.postings[field].get(self.normalize(field, value), 0)
+
+    def match(self, query: Union[str, Query, None] = None) -> int:
+        """Bitmap of the papers matching ``query`` (a query string or ``Query``; None: all papers)."""
+        if query is None:
+            return self.all_docs
+        if isinstance(query, str):
+            query = parse_query(query)
+        return query.bitmap(self)
+
+    def count(self, query: Union[str, Query, None] = None) -> int:
+        return popcount(self.match(query))
+
+    def search(self, query: Union[str, Query, None] = None, limit: Optional[int] = None) -> List[str]:
+        """Pmcids of the matching papers, in indexing order."""
+        pmcids = []
+        for doc in iter_bits(self.match(query)):
+            if limit is not None and len(pmcids) >= limit:
+                break
+            pmcids.append(self.pmcids[doc])
+        return pmcids
+
+    def facets(self, field: str, query: Union[str, Query, None] = None, top: Optional[int] = 20) -> List[tuple]:
+        """``(value, papers)`` of ``field`` among the matching papers, most frequent first."""
+        self._check_field(field)
+        matched = self.match(query)
+        counts = [(self.labels[field][value], popcount(bitmap & matched))
+                  for value, bitmap in self.postings[field].items()]
+        counts = sorted((c for c in counts if c[1]), key=lambda c: (-c[1], c[0]))
+        return counts if top is None else counts[:top]
+
+    def cooccurrence(self, row_field: str, col_field: str,
+                     query: Union[str, Query, None] = None) -> Dict[str, Dict[str, int]]:
+        """Papers per (``row_field`` value, ``col_field`` value) among the matching papers."""
+        self._check_field(row_field)
+        self._check_field(col_field)
+        matched = self.match(query)
+        table = {}
+        for row_value, row_bitmap in self.postings[row_field].items():
+            row_bitmap &= matched
+            if not row_bitmap:
+                continue
+            counts = {self.labels[col_field][col_value]: popcount(row_bitmap & col_bitmap)
+                      for col_value, col_bitmap in self.postings[col_field].items()}
+            table[self.labels[row_field][row_value]] = {value: n for value, n in counts.items() if n}
+        return table
+
+    def stats(self) -> Dict[str, Any]:
+        return {"papers": len(self.pmcids),
+                "values": {field: len(values) for field, values in self.postings.items()}}
@@ -0,0 +1,123 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# Re-requests of a chunk whose output failed validation, after the first attempt
+MAX_VALIDATION_RETRIES = 2
+
+
+def extraction_schema(fields: List[str]) -> Dict[str, Any]:
+    """JSON schema of one extraction result: every field is a required list of strings."""
+    return {
+        "type": "object",
+        "properties": {field: {"type": "array", "items": {"type": "string"}} for field in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+
+
+def packed_extraction_schema(fields: List[str]) -> Dict[str, Any]:
+    """JSON schema of a packed answer: ``{"results": [{"pmcid": ..., <fields>}, ...]}``."""
+    entry = extraction_schema(fields)
+    entry["properties"] = {"pmcid": {"type": "string"}, **entry["properties"]}
+    entry["required"] = ["pmcid"] + entry["required"]
+    return {
+        "type": "object",
+        "properties": {"results": {"type": "array", "items": entry}},
+        "required": ["results"],
+        "additionalProperties": False,
+    }
+
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """``response_format`` argument asking the API for strict schema-constrained JSON output."""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def validate_extraction(data: Any, fields: List[str]) -> Optional[str]:
+    """Return why ``data`` is not a valid extraction result, or None if it is."""
+    if not isinstance(data, dict):
+        return f"expected a JSON object, got {type(data).__name__}"
+    for field in fields:
+        if field not in data:
+            return f"missing field {field!r}"
+        value = data[field]
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            return f"field {field!r} is not a list of strings"
+    return None
+
+
+class OutputValidator:
+    """
+    Checks completions against the extraction schema and counts malformed responses.
+    ``parse`` returns the parsed result, or None when the content is not valid JSON
+    or does not match the schema; the caller then re-requests that chunk, at most
+    ``max_retries`` times. Counters cover every response seen by this validator.
+    Args:
+        fields (List[str]): Extraction fields (see ``prompts.brain_extraction.EXTRACTION_FIELDS``).
+        max_retries (int): Re-requests of one chunk before its output is given up.
+        use_schema (bool): Send ``response_format`` with the schema; turn off for models
+            without structured-output support (the output is still validated).
+    """
+
+    def __init__(self, fields: List[str], max_retries: int = MAX_VALIDATION_RETRIES, use_schema: bool = True):
+        self.fields = list(fields)
+        self.max_retries = max_retries
+        self.use_schema = use_schema
+        self.response_format = self.response_format_for(self.fields)
+        self.packed_response_format = self.packed_response_format_for(self.fields)
+        self.responses = 0
+        self.invalid_json = 0
+        self.schema_errors = 0
+        self.retries = 0
+        self.recovered = 0
+        self.failed = 0
+
+    def response_format_for(self, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """``response_format`` of a request asking for ``fields`` only (None without schema)."""
+        return response_format("extraction", extraction_schema(fields)) if self.use_schema else None
+
+    def packed_response_format_for(self, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """``response_format`` of a packed request asking for ``fields`` only (None without schema)."""
+        return response_format("packed_extraction", packed_extraction_schema(fields)) if self.use_schema else None
+
+    def check(self, data: Any, fields: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Validate an already parsed result (e.g. one entry of a packed answer) and count errors.
+        ``fields`` restricts the check to the fields a reduced prompt asked for.
+        """
+        error = validate_extraction(data, self.fields if fields is None else fields)
+        if error:
+            self.schema_errors += 1
+        return error
+
+    def parse(self, content: Optional[str], fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Parse and validate one completion; None (and a counted error) if it is malformed."""
+        self.responses += 1
+        try:
+            data = json.loads(content)
+        except (json.JSONDecodeError, TypeError) as e:
+            self.invalid_json += 1
+            print(f"JSON parsing error: {e}")
+            print(f"Raw content: {content}")
+            return None
+        error = self.check(data, fields)
+        if error:
+            print(f"Schema error: {error}")
+            return None
+        return data
+
+    @property
+    def malformed(self) -> int:
+        return self.invalid_json + self.schema_errors
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the run: responses checked, malformed ones, retries and outcomes."""
+        return {
+            "responses": self.responses,
+            "malformed": self.malformed,
+            "invalid_json": self.invalid_json,
+            "schema_errors": self.schema_errors,
+            "retries": self.retries,
+            "recovered": self.recovered,
+            "failed": self.failed,
+        }
@@ -0,0 +1,206 @@
+"""
+Relevance pre-screening: every paper's title/abstract/keywords is encoded once into
+the NeuroQuery vocabulary (TF-IDF over its ~7500 neuroscience terms and phrases) and
+cached on disk as a sparse CSR matrix; white-matter relevance of the whole corpus is
+then one sparse matrix-vector product, and only papers above a threshold go to
+``extract_all``.
+
+    screen = RelevanceScreen()
+    screen.update(papers)                    # encodes only papers not cached yet
+    extract_all(screen.filter(papers, threshold=0.05), ...)
+
+The CSR arrays are stored as separate ``.npy`` files (members of an ``.npz`` archive
+cannot be memory-mapped) and opened with ``mmap_mode="r"``, so re-scoring with another
+threshold or query reads the cache without loading the NeuroQuery model.
+Requires ``neuroquery`` (with numpy and scipy) to encode; scoring a cache needs numpy and scipy only.
+"""
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional: only needed for pre-screening
+    np = sparse = None
+
+DEFAULT_SCREEN_DIR = "data/cache/neuroquery_vectors"
+# Query describing the papers worth extracting; its terms are NeuroQuery vocabulary entries
+WHITE_MATTER_QUERY = ("white matter diffusion tensor imaging diffusion weighted imaging fractional anisotropy "
+                      "mean diffusivity radial diffusivity axial diffusivity tractography tract-based spatial "
+                      "statistics white matter integrity white matter tracts corpus callosum cingulum fornix "
+                      "uncinate fasciculus arcuate fasciculus superior longitudinal fasciculus corticospinal tract "
+                      "internal capsule corona radiata white matter hyperintensities myelin")
+DEFAULT_THRESHOLD = 0.05
+# Papers encoded per call to the vectorizer
+ENCODE_BATCH_SIZE = 1000
+
+_ARRAYS = ("data", "indices", "indptr")
+
+
+def require_screening() -> None:
+    if np is None:
+        raise ImportError("Pre-screening needs numpy and scipy: pip install neuroquery")
+
+
+def load_encoder():
+    """The NeuroQuery model (downloaded on first use by ``fetch_neuroquery_model``)."""
+    from neuroquery import fetch_neuroquery_model, NeuroQueryModel
+    return NeuroQueryModel.from_data_dir(fetch_neuroquery_model())
+
+
+def paper_text(WM_paper: Dict[str, Any]) -> str:
+    """Title, abstract and keywords of a paper, the text that is encoded."""
+    return " ".join(str(WM_paper.get(key) or "") for key in ("title", "abstract", "keywords"))
+
+
+def _l2_normalize(matrix):
+    """Scale every row to unit norm, so dot products are cosine similarities."""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=np.float32)
+
+
+class RelevanceScreen:
+    """
+    Cached NeuroQuery vectors of a corpus and relevance scoring over them.
+    The cache directory holds the rows of a CSR matrix (one row per paper,
+    L2-normalized TF-IDF over the NeuroQuery vocabulary), the pmcid of each row and
+    the vectors of the queries used so far. ``update`` appends the papers not cached
+    yet; ``scores`` is one product of the memory-mapped matrix with the query vector.
+    Args:
+        cache_dir (str): Directory of the cache, created on first update.
+        encoder: A ``NeuroQueryModel``; loaded with ``load_encoder`` when something must be encoded.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_SCREEN_DIR, encoder=None):
+        require_screening()
+        self.cache_dir = cache_dir
+        self._encoder = encoder
+        self.matrix = None
+        self.pmcids = []
+        self.rows = {}
+        self.queries = {}
+        self.screened = 0
+        self.passed = 0
+        self._load()
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            start = time.perf_counter()
+            self._encoder = load_encoder()
+            print(f"Loaded the NeuroQuery model in {time.perf_counter() - start:.1f}s")
+        return self._encoder
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        data, indices, indptr = (np.load(self._path(f"{name}.npy"), mmap_mode="r") for name in _ARRAYS)
+        self.matrix = sparse.csr_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+        self.pmcids = meta["pmcids"]
+        self.rows = {pmcid: row for row, pmcid in enumerate(self.pmcids)}
+        if os.path.exists(self._path("queries.json")):
+            with open(self._path("queries.json"), "r", encoding="utf-8") as f:
+                self.queries = json.load(f)
+
+    def _save(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write every file under a temporary name first; meta.json, renamed last, commits the update
+        for name in _ARRAYS:
+            with open(self._path(f".{name}.npy.tmp"), "wb") as f:
+                np.save(f, getattr(self.matrix, name))
+        with open(self._path(".meta.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"shape": list(self.matrix.shape), "pmcids": self.pmcids}, f)
+        for name in _ARRAYS:
+            os.replace(self._path(f".{name}.npy.tmp"), self._path(f"{name}.npy"))
+        os.replace(self._path(".meta.json.tmp"), self._path("meta.json"))
+
+    def encode(self, texts: List[str]):
+        """L2-normalized NeuroQuery TF-IDF vectors of ``texts``, as a float32 CSR matrix."""
+        return _l2_normalize(sparse.csr_matrix(self.encoder.vectorizer.transform(texts)))
+
+    def update(self, WM_papers: Iterable[Dict[str, Any]], batch_size: int = ENCODE_BATCH_SIZE) -> int:
+        """
+        Encode the papers whose pmcid is not cached yet and append them to the cache.
+        Returns:
+            int: Number of papers encoded.
+        """
+        blocks, new_pmcids, texts = [], {}, []
+        for paper in WM_papers:
+            pmcid = str(paper.get("pmcid", ""))
+            if pmcid in self.rows or pmcid in new_pmcids:
+                continue
+            new_pmcids[pmcid] = None  # an ordered set
+            texts.append(paper_text(paper))
+            if len(texts) >= batch_size:
+                blocks.append(self.encode(texts))
+                texts = []
+        if texts:
+            blocks.append(self.encode(texts))
+        if not blocks:
+            return 0
+        if self.matrix is not None:
+            blocks.insert(0, self.matrix)
+        self.matrix = sparse.vstack(blocks, format="csr", dtype=np.float32)
+        self.pmcids += list(new_pmcids)
+        self._save()
+        self._load()  # back to the memory-mapped arrays
+        return len(new_pmcids)
+
+    def query_vector(self, query: str = WHITE_MATTER_QUERY):
+        """Dense vector of ``query``; cached with the matrix, so a known query needs no model."""
+        if query not in self.queries:
+            vector = self.encode([query])
+            self.queries[query] = [vector.indices.tolist(), vector.data.tolist()]
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._path("queries.json"), "w", encoding="utf-8") as f:
+                json.dump(self.queries, f)
+        indices, weights = self.queries[query]
+        vector = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        vector[indices] = weights
+        return vector
+
+    def scores(self, query: str = WHITE_MATTER_QUERY):
+        """Cosine similarity of every cached paper with ``query``, in cache order."""
+        if self.matrix is None:
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ self.query_vector(query)
+
+    def score_map(self, query: str = WHITE_MATTER_QUERY) -> Dict[str, float]:
+        """pmcid -> relevance score of every cached paper."""
+        return dict(zip(self.pmcids, self.scores(query).tolist()))
+
+    def relevant(self, threshold: float = DEFAULT_THRESHOLD, query: str = WHITE_MATTER_QUERY) -> List[str]:
+        """Pmcids of the cached papers scoring at least ``threshold``, in cache order."""
+        return [self.pmcids[row] for row in np.flatnonzero(self.scores(query) >= threshold)]
+
+    def filter(self, WM_papers: Iterable[Dict[str, Any]], threshold: float = DEFAULT_THRESHOLD,
+               query: str = WHITE_MATTER_QUERY) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the papers scoring at least ``threshold``, lazily and in input order.
+        Papers not in the cache are let through (run ``update`` first to screen them);
+        ``screened`` and ``passed`` count the papers seen and kept.
+        """
+        scores = self.scores(query)
+        for paper in WM_papers:
+            self.screened += 1
+            row = self.rows.get(str(paper.get("pmcid", "")))
+            if row is None or scores[row] >= threshold:
+                self.passed += 1
+                yield paper
+
+    def threshold_table(self, thresholds: Iterable[float], query: str = WHITE_MATTER_QUERY) -> List[tuple]:
+        """``(threshold, papers kept)`` for each threshold, to pick one before a run."""
+        scores = self.scores(query)
+        return [(threshold, int(np.count_nonzero(scores >= threshold))) for threshold in thresholds]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cached": len(self.pmcids), "screened": self.screened, "passed": self.passed,
+                "dropped": self.screened - self.passed}
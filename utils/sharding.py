@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.journal import compact_journal
+
+SHARD_STRATEGIES = ("hash", "range")
+
+
+def shard_of(pmcid: Any, num_shards: int) -> int:
+    """Shard of a paper by a stable hash of its pmcid (the same on every machine and run)."""
+    return zlib.crc32(str(pmcid).encode("utf-8")) % num_shards
+
+
+def shard_range(total: int, shard_index: int, num_shards: int) -> Tuple[int, int]:
+    """Contiguous input positions ``[start, end)`` of one shard for ``by="range"``."""
+    return total * shard_index // num_shards, total * (shard_index + 1) // num_shards
+
+
+def shard_items(papers: Iterable[Dict[str, Any]], shard_index: int, num_shards: int,
+                by: str = "hash") -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield ``(input position, paper)`` for the papers of one shard.
+    Positions always refer to the whole input, so the outputs of all shards merge
+    back into input order.
+    Args:
+        papers (Iterable[Dict[str, Any]]): The whole input. ``by="range"`` needs its length,
+            and only reads the shard's own papers from a ``PaperStore`` or a list.
+        shard_index (int): This shard, from 0 to ``num_shards - 1``.
+        num_shards (int): Number of shards.
+        by (str): "hash" (pmcid hash mod ``num_shards``) or "range" (contiguous blocks).
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+    if by == "hash":
+        return ((i, paper) for i, paper in enumerate(papers) if shard_of(paper.get("pmcid", ""), num_shards) == shard_index)
+    if by == "range":
+        start, end = shard_range(len(papers), shard_index, num_shards)
+        selected = papers.iter_range(start, end) if hasattr(papers, "iter_range") else papers[start:end]
+        return enumerate(selected, start)
+    raise ValueError(f"Unknown shard strategy {by!r}, expected one of {SHARD_STRATEGIES}")
+
+
+def shard_path(out_csv: str, shard_index: int, num_shards: int, suffix: str = ".csv") -> str:
+    """Partial output of one shard, e.g. ``extracted_info.shard-2-of-8.csv``."""
+    root, _ = os.path.splitext(out_csv)
+    return f"{root}.shard-{shard_index}-of-{num_shards}{suffix}"
+
+
+def shard_journal_path(out_csv: str, shard_index: int, num_shards: int) -> str:
+    """Journal of one shard, e.g. ``extracted_info.shard-2-of-8.journal.jsonl``."""
+    return shard_path(out_csv, shard_index, num_shards, ".journal.jsonl")
+
+
+def shard_ledger_path(ledger_path: Optional[str], shard_index: int, num_shards: int) -> Optional[str]:
+    """Ledger of one shard, e.g. ``ledger.shard-2-of-8.jsonl`` (None without a ledger)."""
+    if not ledger_path:
+        return None
+    return shard_path(ledger_path, shard_index, num_shards, os.path.splitext(ledger_path)[1] or ".jsonl")
+
+
+def merge_shards(out_csv: str, num_shards: int, fieldnames: List[str]) -> int:
+    """
+    Merge the journals of all shards of a run into one CSV ordered like the input.
+    Missing shard journals are skipped (and reported), so a partial merge is possible.
+    Returns:
+        int: Number of rows written.
+    """
+    journals = [shard_journal_path(out_csv, k, num_shards) for k in range(num_shards)]
+    missing = [path for path in journals if not os.path.exists(path)]
+    if missing:
+        print(f"Missing shard journals: {', '.join(missing)}")
+    n_rows = compact_journal(journals, out_csv, fieldnames)
+    print(f"✅ Merged {num_shards} shards into {n_rows} records in {out_csv}")
+    return n_rows
+
+
+def load_shard_input(data_path: str, start: int = 0, end: Optional[int] = None):
+    """The corpus at ``data_path``, or its papers ``start`` to ``end``, in a form ``shard_items`` accepts."""
+    from main import load_papers
+
+    papers = load_papers(data_path)
+    if start == 0 and end is None:
+        return papers
+    if hasattr(papers, "iter_range"):
+        return list(papers.iter_range(start, end))
+    return papers[start:end]
+
+
+def run_shard(data_path: str, out_csv: str, shard_index: int, num_shards: int, shard_by: str = "hash",
+              start: int = 0, end: Optional[int] = None,
+              rpm: Optional[int] = None, tpm: Optional[int] = None,
+              ledger_path: Optional[str] = None, max_tokens: Optional[int] = None,
+              max_cost: Optional[float] = None, use_cache: bool = True, **extract_kwargs: Any) -> None:
+    """
+    Extract one shard of the corpus at ``data_path`` into its own journal and CSV.
+    Runs in a worker process of ``run_sharded``, or on its own on another machine.
+    ``max_tokens``/``max_cost`` are this shard's own budget, and its ledger goes to
+    ``ledger_path`` (see ``shard_ledger_path``).
+    """
+    import main
+    from utils.ledger import RunLedger
+    from utils.rate_limiter import RateLimiter
+
+    # Module state is not inherited by spawned workers
+    main.USE_RESPONSE_CACHE = use_cache
+    limiter = RateLimiter(**{k: v for k, v in (("rpm", rpm), ("tpm", tpm)) if v is not None})
+    ledger = RunLedger(ledger_path, max_tokens=max_tokens, max_cost=max_cost)
+    main.extract_all(load_shard_input(data_path, start, end),
+                     out_csv=shard_path(out_csv, shard_index, num_shards),
+                     journal_path=shard_journal_path(out_csv, shard_index, num_shards),
+                     shard_index=shard_index, num_shards=num_shards, shard_by=shard_by,
+                     limiter=limiter, ledger=ledger, keep_results=False, **extract_kwargs)
+
+
+def run_sharded(data_path: str, out_csv: str, num_shards: int, shard_by: str = "hash",
+                start: int = 0, end: Optional[int] = None,
+                rpm: int = None, tpm: int = None, ledger_path: Optional[str] = None,
+                max_tokens: Optional[int] = None, max_cost: Optional[float] = None,
+                use_cache: bool = True, **extract_kwargs: Any) -> int:
+    """
+    Extract the corpus with ``num_shards`` worker processes and merge their outputs.
+    Every worker runs ``extract_all`` over its shard with its own event loop, journal
+    and partial CSV; the account's ``rpm``/``tpm`` limits and the run's token and dollar
+    budgets are split evenly between them.
+    The merged CSV is ordered like the input, whatever the number of shards.
+    Args:
+        data_path (str): Corpus path (a ``.jsonl`` store is best: each worker streams it).
+        out_csv (str): Merged output CSV; shard files are written next to it.
+        num_shards (int): Number of worker processes.
+        shard_by (str): "hash" or "range" (see ``shard_items``).
+        start (int): Index of the first paper of the corpus to process.
+        end (int): Index after the last paper, or None for the end of the corpus.
+        rpm (int): Requests per minute limit of the account, shared by the workers.
+        tpm (int): Tokens per minute limit of the account, shared by the workers.
+        ledger_path (str): Optional JSONL ledger; every worker writes its own
+            ``shard_ledger_path`` next to it.
+        max_tokens (int): Token budget of the run, shared by the workers.
+        max_cost (float): Dollar budget of the run, shared by the workers.
+        use_cache (bool): Use the response cache (``main.USE_RESPONSE_CACHE``) in the workers.
+        **extract_kwargs: Passed on to ``extract_all`` (processing_mode, model, resume, ...).
+    Returns:
+        int: Number of rows in the merged CSV.
+    """
+    from main import CSV_FIELDNAMES
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_shard,
+                               args=(data_path, out_csv, k, num_shards, shard_by, start, end),
+                               kwargs=dict(extract_kwargs,
+                                           rpm=rpm // num_shards if rpm else None,
+                                           tpm=tpm // num_shards if tpm else None,
+                                           ledger_path=shard_ledger_path(ledger_path, k, num_shards),
+                                           max_tokens=max_tokens // num_shards if max_tokens else None,
+                                           max_cost=max_cost / num_shards if max_cost else None,
+                                           use_cache=use_cache),
+                               name=f"shard-{k}")
+               for k in range(num_shards)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    failed = [worker.name for worker in workers if worker.exitcode != 0]
+    if failed:
+        print(f"Shards failed: {', '.join(failed)}; rerun with resume=True to finish them")
+    return merge_shards(out_csv, num_shards, CSV_FIELDNAMES)
@@ -0,0 +1,42 @@
+from typing import Dict, List
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Rough characters-per-token ratio for English scientific text
+CHARS_PER_TOKEN = 4
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encodings = {}
+
+
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Count the tokens of ``text`` with tiktoken if installed, otherwise estimate them."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]],
+                            max_output_tokens: int = 0,
+                            model: str = "gpt-4o-mini") -> int:
+    """Estimate the tokens a chat request counts against the TPM limit (prompt + expected output)."""
+    prompt_tokens = sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    return prompt_tokens + max_output_tokens
@@ -0,0 +1,229 @@
+"""
+Span tracing of the pipeline stages, exported in the Chrome trace event format
+(open the file in https://ui.perfetto.dev or chrome://tracing).
+
+    with Tracer("run.trace.json") as tracer:
+        extract_all(papers, processing_mode=2)
+    tracer.summary()  # time per stage
+
+The pipeline calls ``span(name, **attributes)`` around each stage: loading the
+corpus, building the chunks, the request payload, rate-limit waits, the API call,
+validating the response, aggregation and writing the outputs. A span records nothing
+unless a tracer is active, so a normal run pays one check per stage. Attributes of
+the enclosing spans (pmcid, chunk_index) are inherited, so every span of a chunk
+carries them. Concurrent asyncio tasks and threads get their own tracks, reused once
+a task's outermost span ends, so the trace has about as many tracks as stages ran at once.
+"""
+import asyncio
+import functools
+import heapq
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List
+
+# Spans kept in memory by a tracer; later ones are only counted
+MAX_EVENTS = 1_000_000
+
+_active = None
+_attributes: ContextVar[Dict[str, Any]] = ContextVar("trace_attributes", default={})
+
+
+class _NullSpan:
+    """What ``span`` returns when no tracer is active."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "attributes", "start", "_owner", "_track", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.attributes = {**_attributes.get(), **self.attributes}
+        self._token = _attributes.set(dict(self.attributes))
+        self._owner, self._track = self.tracer._enter()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        _attributes.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._exit(self.name, self.start, end, self.attributes, self._owner, self._track)
+        return False
+
+    def set(self, **attributes) -> None:
+        """Add attributes known only once the stage has run (e.g. the number of chunks)."""
+        self.attributes.update(attributes)
+
+
+def span(name: str, **attributes):
+    """
+    Context manager timing one stage on the active tracer; a shared no-op without one.
+    ``attributes`` (pmcid, chunk_index, ...) are stored with the span and inherited by
+    the spans opened inside it.
+    """
+    tracer = _active
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, attributes)
+
+
+def traced(name: str = None) -> Callable:
+    """Decorator wrapping every call of a function (or coroutine function) in a span."""
+    def decorate(func: Callable) -> Callable:
+        label = name or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(label):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(label):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _owner():
+    """The asyncio task running the caller, or its thread outside of a task."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task if task is not None else threading.current_thread()
+
+
+class Tracer:
+    """
+    Collects the spans of a run while it is active (``start``/``stop`` or ``with``) and
+    writes them as complete ("X") events of the Chrome trace event format, timestamps in
+    microseconds from the start of the tracer.
+    Args:
+        path (str): Trace file written by ``save`` (and when the ``with`` block exits).
+        max_events (int): Spans kept in memory; later spans are counted in ``dropped`` only.
+    """
+
+    def __init__(self, path: str = None, max_events: int = MAX_EVENTS):
+        self.path = path
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self._pid = os.getpid()
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        # owner (task or thread) -> [track, open spans]
+        self._tracks = {}
+        self._free = []
+        self._n_tracks = 0
+        self._previous = None
+
+    def start(self) -> "Tracer":
+        """Make this tracer the one ``span`` records to."""
+        global _active
+        self._previous, _active = _active, self
+        return self
+
+    def stop(self) -> None:
+        global _active
+        if _active is self:
+            _active = self._previous
+
+    def __enter__(self) -> "Tracer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> bool:
+        self.stop()
+        if self.path:
+            self.save()
+        return False
+
+    def _enter(self):
+        owner = _owner()
+        with self._lock:
+            state = self._tracks.get(owner)
+            if state is None:
+                if self._free:
+                    track = heapq.heappop(self._free)
+                else:
+                    track = self._n_tracks
+                    self._n_tracks += 1
+                state = self._tracks[owner] = [track, 0]
+            state[1] += 1
+            return owner, state[0]
+
+    def _exit(self, name: str, start: int, end: int, attributes: Dict[str, Any], owner, track: int) -> None:
+        with self._lock:
+            state = self._tracks.get(owner)
+            if state is not None:
+                state[1] -= 1
+                if state[1] <= 0:
+                    del self._tracks[owner]
+                    heapq.heappush(self._free, track)
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append({"name": name, "ph": "X", "ts": (start - self._origin) / 1000,
+                                "dur": (end - start) / 1000, "pid": self._pid, "tid": track,
+                                "args": attributes})
+
+    def save(self, path: str = None) -> str:
+        """Write the trace file; returns its path."""
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+            n_tracks = self._n_tracks
+        metadata = [{"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": "extraction"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": track,
+                      "args": {"name": f"track {track}"}} for track in range(n_tracks)]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped_spans": self.dropped}}, f, default=str)
+        return path
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per stage: spans, total and mean seconds, longest span; by decreasing total time."""
+        stages = {}
+        with self._lock:
+            for event in self.events:
+                stage = stages.setdefault(event["name"], {"count": 0, "total": 0.0, "max": 0.0})
+                stage["count"] += 1
+                stage["total"] += event["dur"] / 1e6
+                stage["max"] = max(stage["max"], event["dur"] / 1e6)
+        for stage in stages.values():
+            stage["mean"] = stage["total"] / stage["count"]
+        return dict(sorted(stages.items(), key=lambda item: -item[1]["total"]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"spans": len(self.events), "dropped": self.dropped, "tracks": self._n_tracks}
+
+
+def format_summary(summary: Dict[str, Dict[str, float]], top: int = 12) -> List[str]:
+    """Lines of a per-stage table (``Tracer.summary``); totals overlap for concurrent stages."""
+    lines = [f"{'stage':<24}{'spans':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}"]
+    for name, stage in list(summary.items())[:top]:
+        lines.append(f"{name:<24}{stage['count']:>8}{stage['total']:>10.3f}"
+                     f"{stage['mean'] * 1000:>10.2f}{stage['max'] * 1000:>10.2f}")
+    return lines
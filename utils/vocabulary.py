@@ -0,0 +1,226 @@
+"""
+Deterministic fast path for the closed-vocabulary fields of SYSTEM_PROMPT.
+A single compiled pattern of every surface form (canonical names, synonyms and
+abbreviations) is scanned over each chunk once; matches are leftmost-longest, as
+in Aho-Corasick, so "diffusion tensor imaging" is one DTI match and "non-human
+primates" is not also "humans". With a ``VocabularyExtractor``, ``extract_all``
+finds these fields locally and the model is only asked for the open-ended ones.
+"""
+import os
+import random
+import re
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.prefilter import alternation
+
+# field -> canonical value (as in the prompt examples) -> synonyms and abbreviations
+CLOSED_VOCABULARIES = {
+    "imaging_modalities": {
+        "Anatomical MRI": ["structural MRI", "sMRI", "anatomical MRI", "T1-weighted", "T1w", "T2-weighted", "FLAIR"],
+        "MRI": ["magnetic resonance imaging"],
+        "fMRI": ["FMRI", "functional MRI", "functional magnetic resonance imaging", "resting-state fMRI", "rs-fMRI"],
+        "DTI": ["diffusion tensor imaging", "diffusion tensor MRI"],
+        "DWI": ["diffusion-weighted imaging", "diffusion weighted imaging", "diffusion MRI", "dMRI"],
+        "DKI": ["diffusion kurtosis imaging"],
+        "NODDI": ["neurite orientation dispersion and density imaging"],
+        "PET": ["positron emission tomography"],
+        "CT": ["computed tomography"],
+        "SPECT": ["single photon emission computed tomography", "single-photon emission computed tomography"],
+        "MEG": ["magnetoencephalography"],
+        "EEG": ["electroencephalography", "electroencephalogram"],
+    },
+    "diffusion_measures": {
+        "FA": ["fractional anisotropy"],
+        "MD": ["mean diffusivity"],
+        "AD": ["axial diffusivity"],
+        "RD": ["radial diffusivity"],
+        "MK": ["mean kurtosis"],
+        "NDI": ["neurite density index"],
+        "ODI": ["orientation dispersion index"],
+    },
+    "template_space": {
+        "MNI": ["MNI152", "MNI-152", "Montreal Neurological Institute"],
+        "Talairach": ["Talairach space", "Talairach and Tournoux"],
+    },
+    "subjects": {
+        # "human", "patients", "participants" and "volunteers" are left out: they are as often
+        # said of human templates, atlases and diseases in animal studies
+        "humans": [],
+        "mice": ["mouse"],
+        "rats": ["rat"],
+        "monkeys": ["monkey", "macaque", "macaques", "rhesus", "non-human primates", "nonhuman primates",
+                    "non-human primate", "nonhuman primate"],
+    },
+    "analysis_software": {
+        "FSL": ["FMRIB Software Library", "TBSS", "FDT", "BEDPOSTX", "bedpostx", "probtrackx", "PROBTRACKX"],
+        "FreeSurfer": ["Freesurfer", "TRACULA"],
+        "SPM": ["SPM8", "SPM12", "Statistical Parametric Mapping"],
+        "AFNI": [],
+        "DIPY": ["Dipy", "DiPy"],
+        "MRtrix": ["MRtrix3", "MRTrix", "MRTrix3"],
+        "ANTs": ["Advanced Normalization Tools"],
+        "DSI Studio": [],
+        "ExploreDTI": [],
+        "TrackVis": [],
+        "CAT12": [],
+    },
+}
+CLOSED_FIELDS = list(CLOSED_VOCABULARIES)
+# Fields the fast path finds locally; human subjects are rarely called "humans",
+# so ``subjects`` stays with the model
+LOCAL_FIELDS = [field for field in CLOSED_FIELDS if field != "subjects"]
+# Never matched on their own: in this corpus they more often mean Alzheimer's disease
+# or a degree, and papers define them next to their long form anyway
+AMBIGUOUS_TERMS = {"AD", "MD", "RD"}
+
+
+def _case_sensitive(term: str) -> bool:
+    """Short forms with capitals (CT, FSL, ANTs, fMRI) must match exactly; the rest ignores case."""
+    return len(term) <= 5 and term.lower() != term
+
+
+class VocabularyExtractor:
+    """
+    Finds the closed-vocabulary fields of a chunk in one pass, without calling the model.
+    Every surface form maps to its field and canonical value, so the output uses the
+    same labels as the prompt examples. Counts chunks scanned and matches for the run.
+    Args:
+        vocabularies (Dict[str, Dict[str, List[str]]]): field -> canonical value -> synonyms.
+        fields (List[str]): Fields to extract locally, defaults to every field of ``vocabularies``.
+    """
+
+    def __init__(self, vocabularies: Dict[str, Dict[str, List[str]]] = CLOSED_VOCABULARIES,
+                 fields: Optional[List[str]] = None):
+        self.fields = list(fields or vocabularies)
+        self._lookup = {}
+        for field in self.fields:
+            for canonical, synonyms in vocabularies[field].items():
+                for term in [canonical] + list(synonyms):
+                    if term in AMBIGUOUS_TERMS:
+                        continue
+                    self._lookup[term if _case_sensitive(term) else term.lower()] = (field, canonical)
+        exact = [term for term in self._lookup if _case_sensitive(term)]
+        folded = [term for term in self._lookup if not _case_sensitive(term)]
+        # An empty alternation would match the empty string everywhere
+        parts = []
+        if exact:
+            parts.append(r"(?<!\w)(?:" + alternation(exact) + r")(?!\w)")
+        if folded:
+            parts.append(r"(?i:(?<!\w)(?:" + alternation(folded) + r")(?!\w))")
+        self._pattern = re.compile("|".join(parts) or r"(?!)")
+        self.chunks = 0
+        self.matches = 0
+
+    def _resolve(self, term: str):
+        return self._lookup.get(term) or self._lookup.get(term.lower())
+
+    def extract(self, text: str, fields: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """Canonical values of ``fields`` (default all) found in ``text``, in order of first mention."""
+        fields = self.fields if fields is None else fields
+        found = {field: [] for field in fields}
+        self.chunks += 1
+        for match in self._pattern.finditer(text):
+            field, canonical = self._resolve(match.group(0))
+            if field in found and canonical not in found[field]:
+                found[field].append(canonical)
+                self.matches += 1
+        return found
+
+    def canonical(self, field: str, value: str) -> str:
+        """The canonical label of a value written as one of the known surface forms, else the value."""
+        resolved = self._resolve(value.strip())
+        return resolved[1] if resolved and resolved[0] == field else value.strip()
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks": self.chunks, "matches": self.matches}
+
+
+def agreement(pairs: List[tuple], extractor: VocabularyExtractor) -> Dict[str, Dict[str, float]]:
+    """
+    Per-field agreement of local and model results of the same papers.
+    Model values are mapped to canonical labels first, so "Diffusion Tensor Imaging"
+    and "DTI" agree. Precision is the share of local values the model also found,
+    recall the share of model values found locally (micro-averaged over papers).
+    Args:
+        pairs (List[tuple]): ``(local, llm)`` result dicts, one pair per paper.
+        extractor (VocabularyExtractor): Extractor whose fields and synonyms are compared.
+    """
+    report = {}
+    for field in extractor.fields:
+        both = local_total = llm_total = exact = 0
+        for local, llm in pairs:
+            local_values = {v.lower() for v in local.get(field, [])}
+            llm_values = {extractor.canonical(field, v).lower() for v in llm.get(field, []) if v.strip()}
+            both += len(local_values & llm_values)
+            local_total += len(local_values)
+            llm_total += len(llm_values)
+            exact += local_values == llm_values
+        report[field] = {
+            "papers": len(pairs),
+            "exact": exact / len(pairs) if pairs else 0.0,
+            "precision": both / local_total if local_total else 1.0,
+            "recall": both / llm_total if llm_total else 1.0,
+        }
+    return report
+
+
+def print_agreement(report: Dict[str, Dict[str, float]]) -> None:
+    """Print the report of ``agreement`` as a table, one row per field."""
+    print(f"{'field':>20} {'papers':>6} {'exact':>6} {'precision':>9} {'recall':>6}")
+    for field, row in report.items():
+        print(f"{field:>20} {row['papers']:>6} {row['exact']:>6.0%} {row['precision']:>9.0%} {row['recall']:>6.0%}")
+
+
+def sample_papers(papers: Iterable[Dict[str, Any]], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Uniform sample of ``n`` papers in input order, streamed once (reservoir sampling)."""
+    rng = random.Random(seed)
+    sample = []
+    for i, paper in enumerate(papers):
+        if i < n:
+            sample.append((i, paper))
+        else:
+            j = rng.randint(0, i)
+            if j < n:
+                sample[j] = (i, paper)
+    return [paper for _, paper in sorted(sample, key=lambda item: item[0])]
+
+
+def compare_with_llm(papers: Iterable[Dict[str, Any]], extractor: Optional[VocabularyExtractor] = None,
+                     sample_size: int = 20, seed: int = 0, processing_mode: int = 1,
+                     max_chunk_tokens: Optional[int] = None, **extract_kwargs: Any) -> Dict[str, Dict[str, float]]:
+    """
+    Extract a sample of papers with the model (all fields) and locally, and report agreement.
+    Args:
+        papers (Iterable[Dict[str, Any]]): Corpus to sample from.
+        extractor (VocabularyExtractor): Defaults to one over ``CLOSED_VOCABULARIES``.
+        sample_size (int): Papers in the sample.
+        seed (int): Sampling seed.
+        processing_mode (int): Mode used for both extractions (they see the same chunks).
+        max_chunk_tokens (int): Token budget per body chunk.
+        **extract_kwargs: Passed on to ``extract_all`` (model, cache, ledger, ...).
+    Returns:
+        Dict[str, Dict[str, float]]: Report of ``agreement``, also printed.
+    """
+    import main
+
+    extractor = extractor or VocabularyExtractor()
+    sample = sample_papers(papers, sample_size, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = main.extract_all(sample, out_csv=os.path.join(tmp, "sample.csv"), processing_mode=processing_mode,
+                                max_chunk_tokens=max_chunk_tokens, **extract_kwargs)
+    by_pmcid = {str(row["pmcid"]): row for row in rows}
+    pairs = []
+    for paper in sample:
+        # Rows of papers that failed or were skipped are missing, so match on pmcid
+        row = by_pmcid.get(str(paper.get("pmcid", "")))
+        if row is None:
+            continue
+        local = main.empty_result(extractor.fields)
+        for chunk in main.build_chunks(paper, processing_mode, max_chunk_tokens):
+            main.merge_chunk_data(local, extractor.extract(chunk))
+        llm = {field: [v for v in row[field].split(";") if v] for field in extractor.fields}
+        pairs.append((main.finalize_result(local), llm))
+    report = agreement(pairs, extractor)
+    print_agreement(report)
+    return report